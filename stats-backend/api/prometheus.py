@@ -0,0 +1,239 @@
+"""
+Queries against the Prometheus datasource that Grafana proxies (STATS_URL).
+
+get_stats_data and get_yastats_data opened a new connection for every query,
+and the tasks that need several queries sent them one after another. Every
+Grafana query now goes through this module instead:
+
+- One requests.Session per process keeps up to PROMETHEUS_MAX_CONNECTIONS
+  connections alive. The async face runs the same client on worker threads,
+  so views and tasks in a process share its connections and the coalescing
+  below.
+- query_many and async_query_many send a list of queries at most
+  PROMETHEUS_CONCURRENCY at a time.
+- An identical request made while one is in flight, or within
+  PROMETHEUS_COALESCE_SECONDS of a successful answer, gets that answer
+  instead of being sent again. Callers must not modify it.
+- Every request sent is timed; latency_metrics() summarizes them per query,
+  with label values blanked out so that per-node queries share an entry.
+  Each process prints and resets the summary every
+  PROMETHEUS_LATENCY_LOG_SECONDS, and keeps at most
+  PROMETHEUS_LATENCY_MAX_QUERIES entries, adding any further query to
+  "(other queries)".
+
+Responses are ``[payload, status]``, as get_stats_data has always returned.
+"""
+
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from urllib.parse import parse_qs, urlencode, urlsplit
+
+import requests
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+DATASOURCE_UID = "dec5owmc8gt8ge"
+
+_lock = threading.Lock()
+_session = None
+_recent = {}  # request key -> (expires at, Future)
+_latencies = {}  # query -> [count, errors, total seconds, max seconds]
+_latencies_since = time.monotonic()
+
+OTHER_QUERIES = "(other queries)"
+_LABEL_VALUE = re.compile(r'"(?:[^"\\]|\\.)*"')
+
+
+def _reset():
+    global _session, _latencies_since
+    _session = None
+    _recent.clear()
+    _latencies.clear()
+    _latencies_since = time.monotonic()
+
+
+# A forked worker must not share the parent's sockets.
+os.register_at_fork(after_in_child=_reset)
+
+
+def _get_session():
+    global _session
+    with _lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = HTTPAdapter(
+                pool_connections=1,
+                pool_maxsize=settings.PROMETHEUS_MAX_CONNECTIONS,
+                pool_block=True,
+            )
+            _session.mount("http://", adapter)
+            _session.mount("https://", adapter)
+        return _session
+
+
+def _headers():
+    return {"Authorization": f"Bearer {os.environ.get('GRAFANA_SERVICE_TOKEN')}"}
+
+
+def datasource_url(endpoint, **params):
+    """URL of a Prometheus API endpoint ("query", "query_range") on the datasource."""
+    return (
+        f"{os.environ.get('STATS_URL')}api/datasources/uid/{DATASOURCE_UID}"
+        f"/resources/api/v1/{endpoint}?{urlencode(params)}"
+    )
+
+
+def _query_name(url, json_body):
+    if json_body is not None:
+        name = " ".join(q.get("expr", "") for q in json_body.get("queries", []))
+    else:
+        name = parse_qs(urlsplit(url).query).get("query", [urlsplit(url).path])[0]
+    return _LABEL_VALUE.sub('""', name)
+
+
+def _summary():
+    return {
+        name: dict(zip(("count", "errors", "total_seconds", "max_seconds"), stats))
+        for name, stats in _latencies.items()
+    }
+
+
+def _record(name, seconds, failed):
+    global _latencies_since
+    report = None
+    with _lock:
+        stats = _latencies.get(name)
+        if stats is None:
+            if len(_latencies) >= settings.PROMETHEUS_LATENCY_MAX_QUERIES:
+                name = OTHER_QUERIES
+            stats = _latencies.setdefault(name, [0, 0, 0.0, 0.0])
+        stats[0] += 1
+        stats[1] += failed
+        stats[2] += seconds
+        stats[3] = max(stats[3], seconds)
+        now = time.monotonic()
+        interval = settings.PROMETHEUS_LATENCY_LOG_SECONDS
+        if interval and now - _latencies_since >= interval:
+            report, period = _summary(), now - _latencies_since
+            _latencies.clear()
+            _latencies_since = now
+    if report is not None:
+        _print_latencies(report, period)
+
+
+def _print_latencies(report, period):
+    requests_sent = sum(stats["count"] for stats in report.values())
+    print(f"Prometheus latency, pid {os.getpid()}: {requests_sent} requests in {period:.0f}s")
+    for name, stats in sorted(report.items(), key=lambda item: -item[1]["total_seconds"]):
+        print(
+            f"  {stats['count']:>6} requests {stats['errors']:>4} errors "
+            f"avg {stats['total_seconds'] / stats['count'] * 1000:>7.1f}ms "
+            f"max {stats['max_seconds'] * 1000:>7.1f}ms  {name}"
+        )
+
+
+def latency_metrics():
+    """{query: {"count", "errors", "total_seconds", "max_seconds"}} since the last printout."""
+    with _lock:
+        return _summary()
+
+
+def fetch(url, json_body=None):
+    """GET ``url``, or POST ``json_body`` to it, and return ``[payload, status]``."""
+    key = (url, json.dumps(json_body, sort_keys=True))
+    now = time.monotonic()
+    with _lock:
+        for stale in [k for k, (expires, _) in _recent.items() if expires <= now]:
+            del _recent[stale]
+        shared = _recent.get(key)
+        if shared is None:
+            future = Future()
+            _recent[key] = (float("inf"), future)
+    if shared is not None:
+        return shared[1].result()
+
+    name = _query_name(url, json_body)
+    started = time.perf_counter()
+    try:
+        response = _get_session().request(
+            "GET" if json_body is None else "POST",
+            url,
+            headers=_headers(),
+            json=json_body,
+            timeout=settings.PROMETHEUS_TIMEOUT,
+        )
+        result = [response.json(), response.status_code]
+    except Exception as e:
+        _record(name, time.perf_counter() - started, True)
+        with _lock:
+            del _recent[key]
+        future.set_exception(e)
+        raise
+    _record(name, time.perf_counter() - started, result[1] != 200)
+    with _lock:
+        if result[1] == 200:
+            _recent[key] = (time.monotonic() + settings.PROMETHEUS_COALESCE_SECONDS, future)
+        else:
+            del _recent[key]
+    future.set_result(result)
+    return result
+
+
+def fetch_many(urls):
+    """fetch() every URL, PROMETHEUS_CONCURRENCY at a time, in order."""
+    urls = list(urls)
+    if len(urls) < 2:
+        return [fetch(url) for url in urls]
+    workers = min(settings.PROMETHEUS_CONCURRENCY, len(urls))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(fetch, urls))
+
+
+def query(promql, at=None):
+    """Instant query, evaluated at ``at`` (epoch seconds) or now."""
+    return fetch(datasource_url("query", query=promql, time=at or round(time.time())))
+
+
+def query_many(queries, at=None):
+    """Instant queries evaluated at the same moment, sent concurrently."""
+    at = at or round(time.time())
+    return fetch_many(datasource_url("query", query=promql, time=at) for promql in queries)
+
+
+def query_range(promql, start, end, step):
+    return fetch(datasource_url("query_range", query=promql, start=start, end=end, step=step))
+
+
+def grafana_query(expr, time_from=None, time_to=None):
+    """Instant query through Grafana's /api/ds/query, which answers in data frames."""
+    payload = {
+        "queries": [
+            {
+                "refId": "A",
+                "expr": expr,
+                "instant": True,
+                "datasource": {"type": "prometheus", "uid": DATASOURCE_UID},
+            }
+        ]
+    }
+    if time_from and time_to:
+        payload["from"] = str(int(time_from) * 1000)  # milliseconds
+        payload["to"] = str(int(time_to) * 1000)
+    return fetch(f"{os.environ.get('STATS_URL')}api/ds/query", json_body=payload)
+
+
+async def async_fetch(url, json_body=None):
+    return await sync_to_async(fetch, thread_sensitive=False)(url, json_body)
+
+
+async def async_query(promql, at=None):
+    return await sync_to_async(query, thread_sensitive=False)(promql, at)
+
+
+async def async_query_many(queries, at=None):
+    return await sync_to_async(query_many, thread_sensitive=False)(queries, at)
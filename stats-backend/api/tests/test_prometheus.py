@@ -0,0 +1,200 @@
+import asyncio
+import json
+import os
+import threading
+from unittest.mock import patch
+from urllib.parse import parse_qs, urlsplit
+
+import fakeredis
+from django.test import TestCase
+
+from api import prometheus
+from core.testing import FakeHTTPServer
+
+
+class FakeGrafana(FakeHTTPServer):
+    """Answers Prometheus instant queries with the value set for the query."""
+
+    def __init__(self, delay=0.0):
+        self.values = {}
+        self.status = 200
+        self.queries = []
+        super().__init__(delay=delay)
+
+    def respond(self, path):
+        query = parse_qs(urlsplit(path).query)["query"][0]
+        self.queries.append(query)
+        body = json.dumps({
+            "status": "success",
+            "data": {"result": [{"metric": {}, "value": [0, self.values.get(query, "1")]}]},
+        }).encode()
+        return self.status, body
+
+
+class PrometheusClientTests(TestCase):
+    def setUp(self):
+        prometheus._reset()
+        self.addCleanup(self._close_session)
+
+    def _close_session(self):
+        if prometheus._session is not None:
+            prometheus._session.close()
+        prometheus._reset()
+
+    def _grafana(self, **kwargs):
+        grafana = FakeGrafana(**kwargs)
+        self.addCleanup(grafana.close)
+        patcher = patch.dict(os.environ, {"STATS_URL": grafana.url})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return grafana
+
+    def _value(self, data):
+        return data[0]["data"]["result"][0]["value"][1]
+
+    def test_queries_share_kept_alive_connections(self):
+        grafana = self._grafana()
+        for i in range(5):
+            prometheus.query(f"up{{instance='{i}'}}", at=1000)
+
+        self.assertEqual(len(grafana.queries), 5)
+        self.assertEqual(len(grafana.connections), 1)
+
+    def test_query_lists_are_sent_concurrently_and_bounded(self):
+        grafana = self._grafana(delay=0.05)
+        queries = [f"metric_{i}" for i in range(12)]
+        grafana.values = {query: str(i) for i, query in enumerate(queries)}
+
+        with self.settings(PROMETHEUS_CONCURRENCY=4):
+            results = prometheus.query_many(queries, at=1000)
+
+        self.assertEqual([self._value(data) for data in results], [str(i) for i in range(12)])
+        self.assertGreater(grafana.most_in_flight, 1)
+        self.assertLessEqual(grafana.most_in_flight, 4)
+        self.assertLessEqual(len(grafana.connections), 4)
+
+    def test_identical_queries_in_flight_are_sent_once(self):
+        grafana = self._grafana(delay=0.1)
+        results = []
+
+        def run():
+            results.append(prometheus.query("sum(up)", at=1000))
+
+        threads = [threading.Thread(target=run) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(grafana.queries, ["sum(up)"])
+        self.assertEqual(len(results), 5)
+
+    def test_answers_are_reused_for_a_short_time(self):
+        grafana = self._grafana()
+        with self.settings(PROMETHEUS_COALESCE_SECONDS=60):
+            prometheus.query("sum(up)", at=1000)
+            prometheus.query("sum(up)", at=1000)
+            prometheus.query("sum(up)", at=1001)
+        self.assertEqual(len(grafana.queries), 2)
+
+        with self.settings(PROMETHEUS_COALESCE_SECONDS=0):
+            prometheus.query("sum(up)", at=1002)
+            prometheus.query("sum(up)", at=1002)
+        self.assertEqual(len(grafana.queries), 4)
+
+    def test_failed_answers_are_not_reused(self):
+        grafana = self._grafana()
+        grafana.status = 503
+        with self.settings(PROMETHEUS_COALESCE_SECONDS=60):
+            self.assertEqual(prometheus.query("sum(up)", at=1000)[1], 503)
+            grafana.status = 200
+            self.assertEqual(prometheus.query("sum(up)", at=1000)[1], 200)
+        self.assertEqual(len(grafana.queries), 2)
+
+    def test_async_face_shares_the_client(self):
+        grafana = self._grafana()
+        grafana.values = {"a": "1", "b": "2"}
+
+        async def fetch():
+            return (
+                await prometheus.async_query_many(["a", "b"], at=1000),
+                await prometheus.async_query("a", at=1000),
+            )
+
+        with self.settings(PROMETHEUS_COALESCE_SECONDS=60):
+            many, single = asyncio.run(fetch())
+            prometheus.query("b", at=1000)
+
+        self.assertEqual([self._value(data) for data in many], ["1", "2"])
+        self.assertEqual(self._value(single), "1")
+        self.assertEqual(sorted(grafana.queries), ["a", "b"])
+
+    def test_latency_is_recorded_per_query(self):
+        grafana = self._grafana(delay=0.02)
+        prometheus.query("sum(up)", at=1000)
+        prometheus.query("sum(up)", at=1001)
+        grafana.status = 500
+        prometheus.query("count(up)", at=1000)
+
+        metrics = prometheus.latency_metrics()
+        self.assertEqual(metrics["sum(up)"]["count"], 2)
+        self.assertEqual(metrics["sum(up)"]["errors"], 0)
+        self.assertGreaterEqual(metrics["sum(up)"]["max_seconds"], 0.02)
+        self.assertGreaterEqual(metrics["sum(up)"]["total_seconds"], 0.04)
+        self.assertEqual(metrics["count(up)"]["errors"], 1)
+
+    def test_latency_entries_are_bounded(self):
+        self._grafana()
+        for node in ("0xaaa", "0xbbb"):
+            prometheus.query(f'sum(up{{instance="{node}"}})', at=1000)
+        with self.settings(PROMETHEUS_LATENCY_MAX_QUERIES=2):
+            for i in range(3):
+                prometheus.query(f"metric_{i}", at=1000)
+
+        metrics = prometheus.latency_metrics()
+        self.assertEqual(metrics['sum(up{instance=""})']["count"], 2)
+        self.assertEqual(metrics["metric_0"]["count"], 1)
+        self.assertEqual(metrics[prometheus.OTHER_QUERIES]["count"], 2)
+        self.assertEqual(len(metrics), 3)
+
+    def test_latency_is_printed_and_reset_periodically(self):
+        self._grafana()
+        with self.settings(PROMETHEUS_LATENCY_LOG_SECONDS=60):
+            prometheus.query("sum(up)", at=1000)
+            with patch("builtins.print") as printed:
+                prometheus.query("count(up)", at=1000)
+            printed.assert_not_called()
+
+            prometheus._latencies_since -= 60
+            with patch("builtins.print") as printed:
+                prometheus.query("sum(up)", at=1001)
+
+        lines = [call.args[0] for call in printed.call_args_list]
+        self.assertIn("3 requests in 60s", lines[0])
+        self.assertTrue(lines[1].endswith("sum(up)") or lines[2].endswith("sum(up)"))
+        self.assertEqual(len(lines), 3)
+        self.assertEqual(prometheus.latency_metrics(), {})
+
+    @patch("collector.tasks.r", new_callable=fakeredis.FakeRedis)
+    def test_termination_reasons_are_queried_together(self, redis_mock):
+        from collector.tasks import market_agreement_termination_reasons
+
+        grafana = self._grafana(delay=0.05)
+        for reason, value in (("Success", "12.4"), ("Expired", "3")):
+            grafana.values[
+                'sum(increase(market_agreements_provider_terminated_reason'
+                f'{{exported_job="community.1", reason="{reason}"}}[1h]))'
+            ] = value
+
+        with self.settings(GRAFANA_JOB_NAME="community.1"):
+            market_agreement_termination_reasons()
+
+        self.assertEqual(json.loads(redis_mock.get("market_agreement_termination_reasons")), {
+            "market_agreements_success": 12,
+            "market_agreements_cancelled": 1,
+            "market_agreements_expired": 3,
+            "market_agreements_requestorUnreachable": 1,
+            "market_agreements_debitnoteDeadline": 1,
+        })
+        self.assertEqual(len(grafana.queries), 5)
+        self.assertGreater(grafana.most_in_flight, 1)
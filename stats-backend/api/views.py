@@ -9,6 +9,7 @@ import urllib.parse
 from rest_framework import status
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
+from . import prometheus
 from .utils import get_stats_data, get_yastats_data
 import os
 import statistics
@@ -18,9 +19,11 @@ from collector.models import (
     NetworkStatsMax,
     NetworkStats,
     ProvidersComputing,
+    ProvidersComputingMax,
     Benchmark,
     Requestors,
 )
+from collector.retention import retention_cutoff
 from .models import APICounter
 from .serializers import (
     NodeSerializer,
@@ -33,7 +36,8 @@ from django.conf import settings
 import asyncio
 import redis
 import json
-from redis import asyncio as aioredis
+from core.async_redis import get_async_redis
+from core.cached_json import cached_json_response
 from asgiref.sync import sync_to_async
 from datetime import datetime
 import math
@@ -47,42 +51,21 @@ r = redis.Redis(connection_pool=pool)
 
 async def total_api_calls(request):
     if request.method == "GET":
-        pool = aioredis.ConnectionPool.from_url(
-            "redis://redis:6379/0", decode_responses=True
-        )
-        r = aioredis.Redis(connection_pool=pool)
-        content = await r.get("api_requests")
-        data = json.loads(content)
-        pool.disconnect()
-        return JsonResponse(data, safe=False, json_dumps_params={"indent": 4})
+        return await cached_json_response(request, "api_requests")
     else:
         return HttpResponse(status=400)
 
 
 async def median_prices(request):
     if request.method == "GET":
-        pool = aioredis.ConnectionPool.from_url(
-            "redis://redis:6379/0", decode_responses=True
-        )
-        r = aioredis.Redis(connection_pool=pool)
-        content = await r.get("network_median_pricing")
-        data = json.loads(content)
-        pool.disconnect()
-        return JsonResponse(data, safe=False, json_dumps_params={"indent": 4})
+        return await cached_json_response(request, "network_median_pricing")
     else:
         return HttpResponse(status=400)
 
 
 async def average_pricing(request):
     if request.method == "GET":
-        pool = aioredis.ConnectionPool.from_url(
-            "redis://redis:6379/0", decode_responses=True
-        )
-        r = aioredis.Redis(connection_pool=pool)
-        content = await r.get("network_average_pricing")
-        data = json.loads(content)
-        pool.disconnect()
-        return JsonResponse(data, safe=False, json_dumps_params={"indent": 4})
+        return await cached_json_response(request, "network_average_pricing")
     else:
         return HttpResponse(status=400)
 
@@ -92,16 +75,7 @@ async def statsmax(request):
     Retrieves network stats over time. (Providers, Cores, Memory, Disk)
     """
     if request.method == "GET":
-        pool = aioredis.ConnectionPool.from_url(
-            "redis://redis:6379/0", decode_responses=True
-        )
-        r = aioredis.Redis(connection_pool=pool)
-        content = await r.get(
-            "stats_max",
-        )
-        data = json.loads(content)
-        pool.disconnect()
-        return JsonResponse(data, safe=False, json_dumps_params={"indent": 4})
+        return await cached_json_response(request, "stats_max")
     else:
         return HttpResponse(status=400)
 
@@ -111,14 +85,7 @@ async def providercomputingmax(request):
     Retrieves providers computing over time. (Highest amount observed during the day)
     """
     if request.method == "GET":
-        pool = aioredis.ConnectionPool.from_url(
-            "redis://redis:6379/0", decode_responses=True
-        )
-        r = aioredis.Redis(connection_pool=pool)
-        content = await r.get("providers_computing_max")
-        data = json.loads(content)
-        pool.disconnect()
-        return JsonResponse(data, safe=False, json_dumps_params={"indent": 4})
+        return await cached_json_response(request, "providers_computing_max")
     else:
         return HttpResponse(status=400)
 
@@ -128,14 +95,7 @@ async def avgpricingmax(request):
     Retrieves Average pricing over time. (Start, CPU/h, Per/h)
     """
     if request.method == "GET":
-        pool = aioredis.ConnectionPool.from_url(
-            "redis://redis:6379/0", decode_responses=True
-        )
-        r = aioredis.Redis(connection_pool=pool)
-        content = await r.get("pricing_average_max")
-        data = json.loads(content)
-        pool.disconnect()
-        return JsonResponse(data, safe=False, json_dumps_params={"indent": 4})
+        return await cached_json_response(request, "pricing_average_max")
     else:
         return HttpResponse(status=400)
 
@@ -145,14 +105,7 @@ async def medianpricingmax(request):
     Retrieves Average pricing over time. (Start, CPU/h, Per/h)
     """
     if request.method == "GET":
-        pool = aioredis.ConnectionPool.from_url(
-            "redis://redis:6379/0", decode_responses=True
-        )
-        r = aioredis.Redis(connection_pool=pool)
-        content = await r.get("pricing_median_max")
-        data = json.loads(content)
-        pool.disconnect()
-        return JsonResponse(data, safe=False, json_dumps_params={"indent": 4})
+        return await cached_json_response(request, "pricing_median_max")
     else:
         return HttpResponse(status=400)
 
@@ -229,14 +182,7 @@ async def payments_last_n_hours_provider(request, yagna_id, hours):
 
 async def yagna_releases(request):
     if request.method == "GET":
-        pool = aioredis.ConnectionPool.from_url(
-            "redis://redis:6379/0", decode_responses=True
-        )
-        r = aioredis.Redis(connection_pool=pool)
-        content = await r.get("yagna_releases")
-        data = json.loads(content) if content else []
-        pool.disconnect()
-        return JsonResponse(data, safe=False, json_dumps_params={"indent": 4})
+        return await cached_json_response(request, "yagna_releases", default=[])
     else:
         return HttpResponse(status=400)
 
@@ -246,13 +192,15 @@ async def payments_earnings_provider(request, yagna_id):
     time_intervals = ["24", "168", "720", "2160"]
 
     earnings = {}
-    base_url = os.environ.get(
-        "STATS_URL") + "api/datasources/uid/dec5owmc8gt8ge/resources/api/v1/query"
-
-    for interval in time_intervals:
-        query_url = f'{base_url}?query=sum(increase(payment_amount_received%7Binstance%3D~"{yagna_id}"%2C%20job%3D~"{settings.GRAFANA_JOB_NAME}"%7D%5B{interval}h%5D)%2F10%5E9)&time={now}'
-        data = await get_yastats_data(query_url)
+    results = await prometheus.async_query_many(
+        [
+            f'sum(increase(payment_amount_received{{instance=~"{yagna_id}", job=~"{settings.GRAFANA_JOB_NAME}"}}[{interval}h])/10^9)'
+            for interval in time_intervals
+        ],
+        at=now,
+    )
 
+    for interval, data in zip(time_intervals, results):
         if data[1] == 200 and data[0]["data"]["result"]:
             earnings[interval] = data[0]["data"]["result"][0]["value"][1]
         else:
@@ -539,7 +487,19 @@ def computing_total(request):
     Retrieves data about a specific node.
     """
     if request.method == "GET":
-        data = ProvidersComputing.objects.all().order_by("-total")
+        # Days older than the raw sample retention (collector/retention.py)
+        # are represented by their daily maximum, whether or not their raw
+        # samples were deleted yet.
+        cutoff = retention_cutoff()
+        data = (
+            ProvidersComputing.objects.filter(date__gte=cutoff)
+            .values("date", "total")
+            .union(
+                ProvidersComputingMax.objects.filter(date__lt=cutoff).values("date", "total"),
+                all=True,
+            )
+            .order_by("-total", "-date")
+        )
         serializer = ProvidersComputingMaxSerializer(data, many=True)
         return JsonResponse(
             serializer.data, safe=False, json_dumps_params={"indent": 4}
@@ -553,14 +513,7 @@ async def stats_30m(request):
     Network stats past 30 minutes.
     """
     if request.method == "GET":
-        pool = aioredis.ConnectionPool.from_url(
-            "redis://redis:6379/0", decode_responses=True
-        )
-        r = aioredis.Redis(connection_pool=pool)
-        content = await r.get("stats_30m")
-        data = json.loads(content)
-        pool.disconnect()
-        return JsonResponse(data, safe=False, json_dumps_params={"indent": 4})
+        return await cached_json_response(request, "stats_30m")
     else:
         return HttpResponse(status=400)
 
@@ -588,14 +541,7 @@ async def general_stats(request):
     List network stats for online nodes.
     """
     if request.method == "GET":
-        pool = aioredis.ConnectionPool.from_url(
-            "redis://redis:6379/0", decode_responses=True
-        )
-        r = aioredis.Redis(connection_pool=pool)
-        content = await r.get("online_stats")
-        data = json.loads(content)
-        pool.disconnect()
-        return JsonResponse(data, safe=False, json_dumps_params={"indent": 4})
+        return await cached_json_response(request, "online_stats")
     else:
         return HttpResponse(status=400)
 
@@ -606,14 +552,7 @@ async def network_utilization(request):
     timestamps in ms along with providers computing.
     """
     if request.method == "GET":
-        pool = aioredis.ConnectionPool.from_url(
-            "redis://redis:6379/0", decode_responses=True
-        )
-        r = aioredis.Redis(connection_pool=pool)
-        content = await r.get("network_utilization")
-        data = json.loads(content)
-        pool.disconnect()
-        return JsonResponse(data, safe=False, json_dumps_params={"indent": 4})
+        return await cached_json_response(request, "network_utilization")
     else:
         return HttpResponse(status=400)
 
@@ -623,14 +562,7 @@ async def network_versions(request):
     Queries the networks nodes for their yagna versions
     """
     if request.method == "GET":
-        pool = aioredis.ConnectionPool.from_url(
-            "redis://redis:6379/0", decode_responses=True
-        )
-        r = aioredis.Redis(connection_pool=pool)
-        content = await r.get("network_versions")
-        data = json.loads(content)
-        pool.disconnect()
-        return JsonResponse(data, safe=False, json_dumps_params={"indent": 4})
+        return await cached_json_response(request, "network_versions")
     else:
         return HttpResponse(status=400)
 
@@ -640,14 +572,7 @@ async def providers_computing_currently(request):
     Returns how many providers are currently computing a task.
     """
     if request.method == "GET":
-        pool = aioredis.ConnectionPool.from_url(
-            "redis://redis:6379/0", decode_responses=True
-        )
-        r = aioredis.Redis(connection_pool=pool)
-        content = await r.get("computing_now")
-        data = json.loads(content)
-        pool.disconnect()
-        return JsonResponse(data, safe=False, json_dumps_params={"indent": 4})
+        return await cached_json_response(request, "computing_now")
     else:
         return HttpResponse(status=400)
 
@@ -657,14 +582,7 @@ async def providers_average_earnings(request):
     Returns providers average earnings per task in the last hour.
     """
     if request.method == "GET":
-        pool = aioredis.ConnectionPool.from_url(
-            "redis://redis:6379/0", decode_responses=True
-        )
-        r = aioredis.Redis(connection_pool=pool)
-        content = await r.get("provider_average_earnings")
-        data = json.loads(content)
-        pool.disconnect()
-        return JsonResponse(data, safe=False, json_dumps_params={"indent": 4})
+        return await cached_json_response(request, "provider_average_earnings")
     else:
         return HttpResponse(status=400)
 
@@ -674,14 +592,7 @@ async def network_earnings_24h(request):
     Returns the earnings for the whole network the last n hours.
     """
     if request.method == "GET":
-        pool = aioredis.ConnectionPool.from_url(
-            "redis://redis:6379/0", decode_responses=True
-        )
-        r = aioredis.Redis(connection_pool=pool)
-        content = await r.get("network_earnings_24h")
-        data = json.loads(content)
-        pool.disconnect()
-        return JsonResponse(data, safe=False, json_dumps_params={"indent": 4})
+        return await cached_json_response(request, "network_earnings_24h")
     else:
         return HttpResponse(status=400)
 
@@ -691,14 +602,7 @@ async def network_total_earnings(request):
     Returns the earnings for the whole network over time.
     """
     if request.method == "GET":
-        pool = aioredis.ConnectionPool.from_url(
-            "redis://redis:6379/0", decode_responses=True
-        )
-        r = aioredis.Redis(connection_pool=pool)
-        content = await r.get("network_total_earnings")
-        data = json.loads(content)
-        pool.disconnect()
-        return JsonResponse(data, safe=False, json_dumps_params={"indent": 4})
+        return await cached_json_response(request, "network_total_earnings")
     else:
         return HttpResponse(status=400)
 
@@ -708,14 +612,7 @@ async def network_earnings_6h(request):
     Returns the earnings for the whole network the last n hours.
     """
     if request.method == "GET":
-        pool = aioredis.ConnectionPool.from_url(
-            "redis://redis:6379/0", decode_responses=True
-        )
-        r = aioredis.Redis(connection_pool=pool)
-        content = await r.get("network_earnings_6h")
-        data = json.loads(content)
-        pool.disconnect()
-        return JsonResponse(data, safe=False, json_dumps_params={"indent": 4})
+        return await cached_json_response(request, "network_earnings_6h")
     else:
         return HttpResponse(status=400)
 
@@ -727,10 +624,7 @@ async def network_earnings_overview(request):
     """
     if request.method == "GET":
         time_frames = [6, 24, 168, 720, 2160]  # Time frames in hours
-        pool = aioredis.ConnectionPool.from_url(
-            "redis://redis:6379/0", decode_responses=True
-        )
-        r = aioredis.Redis(connection_pool=pool)
+        r = get_async_redis()
 
         all_data = {}
         for hours in time_frames:
@@ -750,7 +644,6 @@ async def network_earnings_overview(request):
         else:
             all_data["network_total_earnings"] = None  # Or handle as needed
 
-        pool.disconnect()
         return JsonResponse(all_data, safe=False, json_dumps_params={"indent": 4})
     else:
         return HttpResponse(status=400)
@@ -758,14 +651,7 @@ async def network_earnings_overview(request):
 
 async def network_earnings_overview_new(request):
     if request.method == "GET":
-        pool = aioredis.ConnectionPool.from_url(
-            "redis://redis:6379/0", decode_responses=True
-        )
-        r = aioredis.Redis(connection_pool=pool)
-        content = await r.get("network_earnings_overview_new")
-        data = json.loads(content)
-        pool.disconnect()
-        return JsonResponse(data, safe=False, json_dumps_params={"indent": 4})
+        return await cached_json_response(request, "network_earnings_overview_new")
     else:
         return HttpResponse(status=400)
 
@@ -775,14 +661,7 @@ async def requestors(request):
     Returns all the requestors seen on the network and the tasks requested amount.
     """
     if request.method == "GET":
-        pool = aioredis.ConnectionPool.from_url(
-            "redis://redis:6379/0", decode_responses=True
-        )
-        r = aioredis.Redis(connection_pool=pool)
-        content = await r.get("requestors")
-        data = json.loads(content)
-        pool.disconnect()
-        return JsonResponse(data, safe=False, json_dumps_params={"indent": 4})
+        return await cached_json_response(request, "requestors")
     else:
         return HttpResponse(status=400)
 
@@ -792,14 +671,7 @@ async def market_agreement_termination_reason(request):
     Returns the reasons for market agreements termination.
     """
     if request.method == "GET":
-        pool = aioredis.ConnectionPool.from_url(
-            "redis://redis:6379/0", decode_responses=True
-        )
-        r = aioredis.Redis(connection_pool=pool)
-        content = await r.get("market_agreement_termination_reasons")
-        data = json.loads(content)
-        pool.disconnect()
-        return JsonResponse(data, safe=False, json_dumps_params={"indent": 4})
+        return await cached_json_response(request, "market_agreement_termination_reasons")
     else:
         return HttpResponse(status=400)
 
@@ -809,14 +681,7 @@ async def paid_invoices_1h(request):
     Returns the percentage of invoices paid during the last hour.
     """
     if request.method == "GET":
-        pool = aioredis.ConnectionPool.from_url(
-            "redis://redis:6379/0", decode_responses=True
-        )
-        r = aioredis.Redis(connection_pool=pool)
-        content = await r.get("paid_invoices_1h")
-        data = json.loads(content)
-        pool.disconnect()
-        return JsonResponse(data, safe=False, json_dumps_params={"indent": 4})
+        return await cached_json_response(request, "paid_invoices_1h")
     else:
         return HttpResponse(status=400)
 
@@ -826,14 +691,7 @@ async def provider_invoice_accepted_percentage(request):
     Returns the percentage of invoices accepted by the provider that they have issued to the requestor.
     """
     if request.method == "GET":
-        pool = aioredis.ConnectionPool.from_url(
-            "redis://redis:6379/0", decode_responses=True
-        )
-        r = aioredis.Redis(connection_pool=pool)
-        content = await r.get("provider_accepted_invoice_percentage")
-        data = json.loads(content)
-        pool.disconnect()
-        return JsonResponse(data, safe=False, json_dumps_params={"indent": 4})
+        return await cached_json_response(request, "provider_accepted_invoice_percentage")
     else:
         return HttpResponse(status=400)
 
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class Api2Config(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api2'
+
+    def ready(self):
+        from . import signals  # noqa: F401
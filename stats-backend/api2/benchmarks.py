@@ -0,0 +1,218 @@
+"""
+Benchmarks for the hot paths of the api2 pipeline.
+
+They are not part of the regular test run (the module name does not match
+test*.py) and only print their measurements. Run them explicitly:
+
+    python manage.py test api2.benchmarks --settings=core.test_settings
+
+OFFER_SCAN_RECORDING may point at a JSON-lines file of real proposals, as
+written by `manage.py one_shot_offer_scan --record FILE`; the offer batch
+benchmark then measures that scan instead of synthetic proposals.
+
+The async Redis client benchmark needs a server listening on a socket, given
+as BENCH_REDIS_URL (e.g. redis://localhost:6379/15); it is skipped otherwise.
+Where no redis-server is at hand, fakeredis.TcpFakeServer stands in for one.
+"""
+
+import json
+import os
+import time
+import unittest
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from .testing import isolate_scanner_state, reference_windowed_series, synthetic_proposals
+
+
+class OfferScanBenchmark(TestCase):
+    PROPOSALS = 5000
+
+    def setUp(self):
+        from .models import GLM, EC2Instance
+
+        isolate_scanner_state(self)
+        GLM.objects.create(id=1, current_price=0.25)
+        for n, (vcpu, memory) in enumerate([(2, 4.0), (4, 16.0), (8, 32.0), (32, 128.0)]):
+            EC2Instance.objects.create(
+                name=f"bench{n}", vcpu=vcpu, memory=memory, price_usd=0.05 * vcpu
+            )
+
+    def _run(self, label, payload):
+        from .scanner import update_providers_info
+
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            update_providers_info(payload)
+            elapsed = time.perf_counter() - started
+        print(
+            f"\n{label}: {len(payload)} proposals in {elapsed:.2f}s, "
+            f"{len(queries.captured_queries)} queries"
+        )
+
+    def test_synthetic_scan(self):
+        payload = [json.dumps(p) for p in synthetic_proposals(self.PROPOSALS)]
+        self._run("first scan (all providers new)", payload)
+        self._run("repeat scan (nothing changed)", payload)
+
+
+def recorded_or_synthetic_proposals(count=5000):
+    path = os.environ.get("OFFER_SCAN_RECORDING")
+    if not path:
+        return "synthetic", synthetic_proposals(count)
+    with open(path) as recording:
+        return path, [json.loads(line) for line in recording if line.strip()]
+
+
+class OfferBatchEncodingBenchmark(TestCase):
+    ROUNDS = 5
+
+    def _measure(self, label, offers, encoding):
+        from kombu.utils.json import dumps, loads
+
+        from .offer_codec import decode_offer_batch, encode_offer_batch
+
+        encode_time = decode_time = 0.0
+        for _ in range(self.ROUNDS):
+            started = time.perf_counter()
+            # What the broker carries: the task argument inside Celery's
+            # JSON message body.
+            message = dumps([encode_offer_batch(offers, encoding=encoding)])
+            encode_time += time.perf_counter() - started
+
+            started = time.perf_counter()
+            decoded = decode_offer_batch(loads(message)[0])
+            decode_time += time.perf_counter() - started
+        self.assertEqual(len(decoded), len(offers))
+        print(
+            f"{label:>8}: {len(message.encode()):>10} bytes, "
+            f"encode {encode_time / self.ROUNDS * 1000:.1f}ms, "
+            f"decode {decode_time / self.ROUNDS * 1000:.1f}ms"
+        )
+
+    def test_offer_batch_formats(self):
+        source, offers = recorded_or_synthetic_proposals()
+        print(f"\n{len(offers)} proposals ({source})")
+        self._measure("json", offers, "json")
+        self._measure("compact", offers, "compact")
+
+
+class PricingWindowBenchmark(TestCase):
+    """The 24h pricing series (289 five-minute points) at rising task density."""
+
+    def test_window_density(self):
+        import random
+        from datetime import timedelta
+
+        from django.utils import timezone
+
+        from .rolling_stats import windowed_series
+
+        rng = random.Random(1)
+        end = timezone.now().replace(second=0, microsecond=0)
+        points = [end - timedelta(minutes=5 * i) for i in range(288, -1, -1)]
+        window = timedelta(days=1)
+        print()
+        for per_hour in (20, 200, 2000):
+            rows = sorted(
+                (
+                    end - timedelta(seconds=rng.uniform(0, 2 * 86400)),
+                    rng.uniform(0.01, 0.2),
+                    rng.uniform(0, 0.05),
+                    rng.choice([None, rng.random()]),
+                )
+                for _ in range(per_hour * 48)
+            )
+            started = time.perf_counter()
+            reference_windowed_series(rows, points, window)
+            per_point = time.perf_counter() - started
+
+            started = time.perf_counter()
+            windowed_series(rows, points, window, ("cpu", "env", "start"))
+            sliding = time.perf_counter() - started
+            print(
+                f"{per_hour:>5} tasks/h ({per_hour * 24:>6} per window): "
+                f"per-point {per_point * 1000:.1f}ms, sliding {sliding * 1000:.1f}ms"
+            )
+
+
+@unittest.skipUnless(os.environ.get("BENCH_REDIS_URL"), "BENCH_REDIS_URL is not set")
+class AsyncRedisClientBenchmark(TestCase):
+    """A cached-payload GET per request: a pool per request vs the shared client."""
+
+    REQUESTS = 5000
+    CONCURRENCY = 100
+
+    def _run(self, url, label, get):
+        import asyncio
+        from unittest.mock import patch
+
+        from redis import asyncio as aioredis
+        from redis.asyncio.connection import AbstractConnection, Connection
+
+        # Connections are counted on the client, so servers without INFO
+        # (fakeredis' TCP server, for one) can be measured as well.
+        connect, disconnect = Connection._connect, AbstractConnection.disconnect
+        open_connections, counts = set(), {"opened": 0, "peak": 0}
+
+        async def counted_connect(connection):
+            await connect(connection)
+            open_connections.add(id(connection))
+            counts["opened"] += 1
+            counts["peak"] = max(counts["peak"], len(open_connections))
+
+        async def counted_disconnect(connection, *args, **kwargs):
+            open_connections.discard(id(connection))
+            await disconnect(connection, *args, **kwargs)
+
+        async def run():
+            admin = aioredis.Redis.from_url(url)
+            await admin.set("bench_payload", json.dumps({"online": list(range(500))}))
+            await admin.aclose()
+            latencies = []
+            semaphore = asyncio.Semaphore(self.CONCURRENCY)
+
+            async def one():
+                async with semaphore:
+                    started = time.perf_counter()
+                    await get()
+                    latencies.append(time.perf_counter() - started)
+
+            with patch.object(Connection, "_connect", counted_connect), patch.object(
+                AbstractConnection, "disconnect", counted_disconnect
+            ):
+                started = time.perf_counter()
+                await asyncio.gather(*(one() for _ in range(self.REQUESTS)))
+                elapsed = time.perf_counter() - started
+            latencies.sort()
+            print(
+                f"{label:>18}: p50 {latencies[len(latencies) // 2] * 1000:.2f}ms, "
+                f"p99 {latencies[int(len(latencies) * 0.99)] * 1000:.2f}ms, "
+                f"{self.REQUESTS / elapsed:.0f} req/s, {counts['opened']} connections opened, "
+                f"peak {counts['peak']} open"
+            )
+
+        asyncio.run(run())
+
+    def test_latency_and_connections(self):
+        from redis import asyncio as aioredis
+
+        from core.async_redis import get_async_redis
+
+        url = os.environ["BENCH_REDIS_URL"]
+
+        async def pool_per_request():
+            pool = aioredis.ConnectionPool.from_url(url, decode_responses=True)
+            r = aioredis.Redis(connection_pool=pool)
+            json.loads(await r.get("bench_payload"))
+            await pool.disconnect()
+
+        async def shared_client():
+            json.loads(await get_async_redis().get("bench_payload"))
+
+        print(f"\n{self.REQUESTS} GETs, {self.CONCURRENCY} concurrent")
+        self._run(url, "pool per request", pool_per_request)
+        with self.settings(REDIS_URL=url):
+            self._run(url, "shared client", shared_client)
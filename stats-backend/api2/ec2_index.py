@@ -0,0 +1,124 @@
+import bisect
+from collections import defaultdict
+
+import redis
+
+from .models import EC2Instance
+
+pool = redis.ConnectionPool(host="redis", port=6379, db=0)
+r = redis.Redis(connection_pool=pool)
+
+# Bumped by store_ec2_instance_data whenever the EC2 table gains a row. Every
+# worker process compares it with the version its index was built from, so a
+# Vantage refresh reaches all scanners without any of them re-reading the
+# table on every scan.
+EC2_INDEX_VERSION_KEY = "ec2_instance_index_version"
+
+
+class EC2InstanceIndex:
+    """In-memory nearest-instance lookup over the EC2Instance table.
+
+    Answers the same question as
+
+        EC2Instance.objects.annotate(
+            cpu_diff=Abs(F("vcpu") - vcpu), memory_diff=Abs(F("memory") - memory)
+        ).order_by("cpu_diff", "memory_diff", "price_usd").first()
+
+    without a query per offer: instances are grouped by vCPU count, and each
+    group is kept sorted by memory so the closest memory size is a bisect.
+    Rows with a NULL vcpu, memory or price sort after every non-NULL value,
+    as they do in PostgreSQL; remaining ties go to the lowest id.
+    """
+
+    def __init__(self, instances, version=None):
+        self.version = version
+        groups = defaultdict(list)
+        for instance in instances:
+            groups[instance.vcpu].append(instance)
+        self._unknown_vcpu = groups.pop(None, [])
+        self._vcpus = sorted(groups)
+        self._groups = {}
+        for vcpu, members in groups.items():
+            known = sorted(
+                (i for i in members if i.memory is not None), key=lambda i: i.memory
+            )
+            self._groups[vcpu] = (
+                [i.memory for i in known],
+                known,
+                [i for i in members if i.memory is None],
+            )
+
+    @staticmethod
+    def _cheapest(instances):
+        return min(
+            instances,
+            key=lambda i: (i.price_usd is None, i.price_usd or 0, i.pk),
+        )
+
+    def _closest_memory(self, vcpu, memory):
+        """Best (memory_diff, instances) pair within one vCPU group."""
+        memories, known, unknown = self._groups[vcpu]
+        if not known:
+            return None, unknown
+        pos = bisect.bisect_left(memories, memory)
+        diff = min(
+            abs(memories[i] - memory) for i in (pos - 1, pos) if 0 <= i < len(memories)
+        )
+        # Every instance at exactly that distance, below and above the target.
+        lo = pos
+        while lo > 0 and abs(memories[lo - 1] - memory) == diff:
+            lo -= 1
+        hi = pos
+        while hi < len(memories) and abs(memories[hi] - memory) == diff:
+            hi += 1
+        return diff, known[lo:hi]
+
+    def nearest(self, vcpu, memory):
+        if not self._vcpus:
+            return self._cheapest(self._unknown_vcpu) if self._unknown_vcpu else None
+
+        pos = bisect.bisect_left(self._vcpus, vcpu)
+        neighbours = [self._vcpus[i] for i in (pos - 1, pos) if 0 <= i < len(self._vcpus)]
+        cpu_diff = min(abs(v - vcpu) for v in neighbours)
+
+        best_diff, candidates = None, []
+        for group in (v for v in neighbours if abs(v - vcpu) == cpu_diff):
+            diff, matches = self._closest_memory(group, memory)
+            if diff is None:
+                if best_diff is None:
+                    candidates.extend(matches)
+            elif best_diff is None or diff < best_diff:
+                best_diff, candidates = diff, list(matches)
+            elif diff == best_diff:
+                candidates.extend(matches)
+        return self._cheapest(candidates)
+
+
+_index = None
+
+
+def _current_version():
+    try:
+        return r.get(EC2_INDEX_VERSION_KEY) or b"0"
+    except redis.RedisError:
+        # Without the shared version we cannot tell whether another process
+        # changed the table, so rebuild rather than risk a stale index.
+        return None
+
+
+def get_ec2_index():
+    """The process-local index, rebuilt only when the EC2 table has changed."""
+    global _index
+    version = _current_version()
+    if _index is None or version is None or _index.version != version:
+        _index = EC2InstanceIndex(EC2Instance.objects.all(), version)
+    return _index
+
+
+def invalidate_ec2_index():
+    global _index
+    _index = None
+    try:
+        r.incr(EC2_INDEX_VERSION_KEY)
+    except redis.RedisError as e:
+        print(f"Could not bump the EC2 index version: {e}")
@@ -0,0 +1,329 @@
+"""
+Fetching GLM transfers from the erc20-api into GolemTransactions.
+
+The initial backfill covers March 2019 until now in 30-day ranges that start
+and end at UTC midnight, so no two ranges share a day of facts. Every range
+is a TransactionScrapeRange row, and its transfers, their facts and its
+completion are stored in one database transaction, so an interrupted
+backfill resumes with the ranges that are still open instead of starting
+over from 2019.
+
+Open ranges are fetched over a bounded thread pool (GLM_TX_BACKFILL_WORKERS),
+each at most BACKFILL_PREFETCH_BATCHES batches ahead. The pool threads only
+talk to the erc20-api: the calling thread stores every range, one after the
+other, so the fact tables are never rebuilt by two writers at once.
+
+Responses are parsed as a stream and handed to the inserts in batches of
+INSERT_BATCH_SIZE; busy windows are bisected (iter_transfer_batches).
+"""
+
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone as dt_timezone
+from queue import Queue
+
+import requests
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from .golem_senders import known_golem_senders
+from .models import GolemTransactions, TransactionScrapeRange, TransactionScraperIndex
+from .transaction_facts import hour_of, refresh_transaction_facts
+
+BACKFILL_START_EPOCH = 1553126400  # March 21, 2019, 00:00 UTC
+BACKFILL_WINDOW_SECONDS = 2592000  # 30 days
+BACKFILL_PREFETCH_BATCHES = 2
+# A running backfill touches the index after every range, which takes
+# seconds; one that has been quiet this long has died.
+BACKFILL_HEARTBEAT_TIMEOUT = timedelta(minutes=15)
+INSERT_BATCH_SIZE = 5000
+
+SINGLE_TRANSFER_CONTRACT = "0x0b220b82f3ea3b7f6d9a1d8ab58930c064a2b5bf"
+BATCHED_CONTRACT = "0x50100d4faf5f3b09987dea36dc2eddd57a3e561b"
+
+
+class _SplitWindow(Exception):
+    """The window has to be fetched in two halves."""
+
+
+# Statuses with which the erc20-api or its proxy gives up on a busy window.
+SPLIT_STATUSES = {413, 502, 504}
+
+
+def iter_json_array(chunks, key):
+    """Yield the items of the array under ``key`` from a stream of JSON text.
+
+    Only the array items are decoded, one at a time, so memory depends on
+    the size of one item rather than of the whole document.
+    """
+    decoder = json.JSONDecoder()
+    chunks = iter(chunks)
+    buffer, pos = "", 0
+
+    def read_more():
+        nonlocal buffer, pos
+        chunk = next(chunks, None)
+        if chunk is None:
+            return False
+        buffer, pos = buffer[pos:] + chunk, 0
+        return True
+
+    marker = f'"{key}"'
+    while True:
+        found = buffer.find(marker)
+        if found >= 0:
+            opening = buffer.find("[", found + len(marker))
+            if opening >= 0:
+                pos = opening + 1
+                break
+        if not read_more():
+            return
+
+    while True:
+        while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+            pos += 1
+        if pos == len(buffer):
+            if not read_more():
+                raise ValueError(f"Truncated JSON array {key!r}")
+            continue
+        if buffer[pos] == "]":
+            return
+        try:
+            item, pos = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            # The item continues in the next chunk.
+            if not read_more():
+                raise
+            continue
+        yield item
+
+
+def _stream_window(start_epoch, end_epoch, limit=None, deadline=None):
+    try:
+        with requests.get(
+            settings.ERC20_API_URL,
+            params={"chain": 137, "receiver": "all", "from": start_epoch, "to": end_epoch},
+            stream=True,
+            timeout=settings.ERC20_API_TIMEOUT,
+        ) as response:
+            if response.status_code in SPLIT_STATUSES:
+                raise _SplitWindow(f"status {response.status_code}")
+            if response.status_code != 200:
+                raise Exception(
+                    f"Failed to fetch data. Status code: {response.status_code}"
+                )
+            response.encoding = response.encoding or "utf-8"
+            chunks = response.iter_content(chunk_size=65536, decode_unicode=True)
+            for count, transfer in enumerate(iter_json_array(chunks, "transfers"), 1):
+                if limit is not None and count > limit:
+                    raise _SplitWindow(f"more than {limit} transfers")
+                if deadline is not None and time.monotonic() > deadline:
+                    raise _SplitWindow("too slow")
+                yield transfer
+    except requests.Timeout:
+        raise _SplitWindow("timed out")
+
+
+def iter_transfer_batches(start_epoch, end_epoch, batch_size=INSERT_BATCH_SIZE):
+    """Yield the transfers with start_epoch <= blockTimestamp <= end_epoch in batches.
+
+    A window whose response has more than ERC20_MAX_TRANSFERS_PER_REQUEST
+    transfers, or takes longer than ERC20_API_TIMEOUT, is abandoned and
+    fetched as two halves instead, so at most that many transfers are held
+    in memory however busy the chain was. A single second cannot be split
+    further; it is streamed straight into batches.
+    """
+    windows = [(start_epoch, end_epoch)]
+    while windows:
+        start, end = windows.pop()
+        if start >= end:
+            try:
+                transfers = _stream_window(start, end)
+                batch = []
+                for transfer in transfers:
+                    batch.append(transfer)
+                    if len(batch) == batch_size:
+                        yield batch
+                        batch = []
+            except _SplitWindow as e:
+                raise Exception(f"Failed to fetch {start}-{end}: {e}")
+            if batch:
+                yield batch
+            continue
+        try:
+            transfers = list(
+                _stream_window(
+                    start,
+                    end,
+                    limit=settings.ERC20_MAX_TRANSFERS_PER_REQUEST,
+                    deadline=time.monotonic() + settings.ERC20_API_TIMEOUT,
+                )
+            )
+        except _SplitWindow as e:
+            middle = (start + end) // 2
+            print(f"Splitting {start}-{end} ({e})")
+            windows.append((middle + 1, end))
+            windows.append((start, middle))
+            continue
+        for i in range(0, len(transfers), batch_size):
+            yield transfers[i: i + batch_size]
+
+
+def golem_transaction(transfer, known_senders):
+    if transfer["toAddr"] == SINGLE_TRANSFER_CONTRACT:
+        transaction_type = "singleTransfer"
+    elif transfer["toAddr"] == BATCHED_CONTRACT:
+        transaction_type = "batched"
+    else:
+        transaction_type = None
+    return GolemTransactions(
+        txhash=transfer["txHash"],
+        scanner_id=transfer["id"],
+        amount=int(transfer["tokenAmount"]) / 1e18,
+        transaction_type=transaction_type,
+        timestamp=datetime.fromtimestamp(transfer["blockTimestamp"], tz=dt_timezone.utc),
+        receiver=transfer["receiverAddr"],
+        sender=transfer["fromAddr"],
+        tx_from_golem=transfer["fromAddr"] in known_senders,
+    )
+
+
+def plan_backfill_ranges(now_epoch):
+    """Add the ranges between the last planned one and now."""
+    last_end = TransactionScrapeRange.objects.aggregate(last=Max("end_epoch"))["last"]
+    start_epoch = BACKFILL_START_EPOCH if last_end is None else last_end + 1
+    ranges = []
+    while start_epoch < now_epoch:
+        # Windows end where the next whole window after BACKFILL_START_EPOCH
+        # begins, also after a range that was cut short at "now".
+        end_epoch = (
+            start_epoch
+            - (start_epoch - BACKFILL_START_EPOCH) % BACKFILL_WINDOW_SECONDS
+            + BACKFILL_WINDOW_SECONDS
+            - 1
+        )
+        ranges.append(
+            TransactionScrapeRange(start_epoch=start_epoch, end_epoch=min(end_epoch, now_epoch))
+        )
+        start_epoch = end_epoch + 1
+    TransactionScrapeRange.objects.bulk_create(ranges, ignore_conflicts=True)
+
+
+def scrape_range(pending_range, batches=None):
+    """Store a range's transfers and their facts, and mark it complete.
+
+    ``batches`` are the range's transfers if they were fetched elsewhere.
+    Everything happens in one transaction, so an attempt that fails part way
+    leaves neither transfers without facts nor a half-stored range behind.
+    """
+    if batches is None:
+        batches = iter_transfer_batches(pending_range.start_epoch, pending_range.end_epoch)
+    transfers, hours = 0, set()
+    with transaction.atomic():
+        for batch in batches:
+            senders = known_golem_senders()
+            transactions = [golem_transaction(t, senders) for t in batch]
+            # Recent transfers may already be stored by fetch_latest_glm_tx.
+            GolemTransactions.objects.bulk_create(transactions, ignore_conflicts=True)
+            hours.update(hour_of(tx.timestamp) for tx in transactions)
+            transfers += len(batch)
+        refresh_transaction_facts(hours)
+        pending_range.transfers = transfers
+        pending_range.completed_at = timezone.now()
+        pending_range.save(update_fields=["transfers", "completed_at"])
+        TransactionScraperIndex.objects.filter(id=1).update(
+            indexing_heartbeat_at=pending_range.completed_at
+        )
+    print(
+        f"Range {pending_range.start_epoch}-{pending_range.end_epoch}: "
+        f"{transfers} transfers"
+    )
+    return transfers
+
+
+class _PrefetchedRange:
+    """A range's transfer batches, fetched on a pool thread a few batches ahead."""
+
+    def __init__(self, pending_range):
+        self.range = pending_range
+        self.queue = Queue(maxsize=BACKFILL_PREFETCH_BATCHES)
+        self.finished = False
+
+    def fetch(self):
+        try:
+            for batch in iter_transfer_batches(self.range.start_epoch, self.range.end_epoch):
+                self.queue.put(batch)
+        except Exception as e:
+            self.queue.put(e)
+        self.queue.put(None)
+
+    def batches(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                self.finished = True
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+    def discard(self):
+        """Let the fetching thread run to its end after the range failed."""
+        while not self.finished:
+            self.finished = self.queue.get() is None
+
+
+def backfill_golem_transactions(now_epoch=None, workers=None):
+    """Fetch every open range and return a summary of the run.
+
+    Ranges that fail stay open for the next run; the first error is raised
+    once the remaining ranges have been attempted.
+    """
+    now_epoch = now_epoch or int(timezone.now().timestamp())
+    workers = workers or settings.GLM_TX_BACKFILL_WORKERS
+    plan_backfill_ranges(now_epoch)
+    pending = list(
+        TransactionScrapeRange.objects.filter(completed_at__isnull=True).order_by("start_epoch")
+    )
+
+    started = time.monotonic()
+    outcomes, errors = [], []
+    if workers == 1:
+        for pending_range in pending:
+            try:
+                outcomes.append(scrape_range(pending_range))
+            except Exception as e:
+                errors.append(e)
+    else:
+        prefetched = [_PrefetchedRange(pending_range) for pending_range in pending]
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            # The pool starts the ranges in this order, so the range stored
+            # next is always being fetched.
+            for fetching in prefetched:
+                executor.submit(fetching.fetch)
+            for fetching in prefetched:
+                try:
+                    outcomes.append(scrape_range(fetching.range, fetching.batches()))
+                except Exception as e:
+                    errors.append(e)
+                    fetching.discard()
+    transfers, completed = sum(outcomes), len(outcomes)
+    elapsed = time.monotonic() - started
+
+    summary = {
+        "ranges": completed,
+        "failed_ranges": len(errors),
+        "transfers": transfers,
+        "seconds": round(elapsed, 3),
+        "transfers_per_second": round(transfers / elapsed, 1) if elapsed else 0.0,
+    }
+    print(
+        f"Backfilled {transfers} transfers from {completed} ranges in {elapsed:.1f}s "
+        f"({summary['transfers_per_second']} transfers/s), {len(errors)} ranges failed"
+    )
+    if errors:
+        raise errors[0]
+    return summary
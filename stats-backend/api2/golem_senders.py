@@ -0,0 +1,131 @@
+"""
+The set of addresses whose GLM transfers count as Golem payments.
+
+A transfer is tagged tx_from_golem when its sender is a known requestor
+(collector.Requestors) or relay node (RelayNodes). Instead of querying both
+tables with every fetched batch and every get_transfer_sum request, the
+addresses live in a Redis set shared by all processes, and each process
+keeps a copy that it reloads only when the set's version changes.
+
+Both tables only ever gain senders one at a time, through save(); the
+post_save handlers (api2/signals.py) re-tag the transfers new addresses
+already sent, which were stored as non-Golem, and then add them to the set.
+sync_known_senders rebuilds the set from the database periodically, for rows
+written without signals, and re-tags the transfers of the senders that the
+previously published set was missing.
+
+An exact set is small enough here (tens of thousands of 42-character
+addresses), so no probabilistic filter sits in front of it.
+"""
+
+import redis
+from django.db import transaction
+from django.db.models.functions import TruncHour
+
+from collector.models import Requestors
+
+from .models import GolemTransactions, RelayNodes
+
+pool = redis.ConnectionPool(host="redis", port=6379, db=0)
+r = redis.Redis(connection_pool=pool)
+
+KNOWN_SENDERS_KEY = "golem_known_senders"
+KNOWN_SENDERS_VERSION_KEY = "golem_known_senders_version"
+
+_cache = None  # (version, frozenset of addresses)
+
+
+def _senders_in_database():
+    return frozenset(Requestors.objects.values_list("node_id", flat=True)).union(
+        RelayNodes.objects.values_list("node_id", flat=True)
+    )
+
+
+def _publish(senders):
+    pipe = r.pipeline()
+    pipe.delete(KNOWN_SENDERS_KEY)
+    if senders:
+        pipe.sadd(KNOWN_SENDERS_KEY, *senders)
+    pipe.incr(KNOWN_SENDERS_VERSION_KEY)
+    return pipe.execute()[-1]
+
+
+def known_golem_senders():
+    """The current sender set, from the process cache when it is up to date."""
+    global _cache
+    try:
+        version = r.get(KNOWN_SENDERS_VERSION_KEY)
+        if _cache is not None and _cache[0] == version:
+            return _cache[1]
+        if version is None:
+            senders = _senders_in_database()
+            version = str(_publish(senders)).encode()
+        else:
+            senders = frozenset(member.decode() for member in r.smembers(KNOWN_SENDERS_KEY))
+    except redis.RedisError as e:
+        print(f"Known sender set unavailable, reading the database: {e}")
+        senders, version = _senders_in_database(), None
+    _cache = (version, senders)
+    return senders
+
+
+def retag_sender_transactions(addresses):
+    """Mark the stored transfers of newly known senders as Golem transfers."""
+    from .transaction_facts import refresh_transaction_facts
+
+    untagged = GolemTransactions.objects.filter(sender__in=addresses, tx_from_golem=False)
+    with transaction.atomic():
+        hours = list(
+            untagged.annotate(hour=TruncHour("timestamp"))
+            .values_list("hour", flat=True)
+            .distinct()
+        )
+        retagged = untagged.update(tx_from_golem=True)
+        refresh_transaction_facts(hours)
+    return retagged
+
+
+def add_known_sender(address):
+    """Re-tag what a new sender already sent, then publish it.
+
+    A sender is published only once its transfers are re-tagged, so one whose
+    re-tag failed is still missing from the set and sync_known_senders re-tags
+    it later. Transfers stored while the first re-tag ran were tagged against
+    the old set, hence the second pass after publishing.
+    """
+    retagged = retag_sender_transactions([address])
+    try:
+        added = r.sadd(KNOWN_SENDERS_KEY, address)
+        if added:
+            r.incr(KNOWN_SENDERS_VERSION_KEY)
+    except redis.RedisError as e:
+        print(f"Could not publish known sender {address}: {e}")
+        return retagged
+    if added:
+        retagged += retag_sender_transactions([address])
+    return retagged
+
+
+def sync_known_senders():
+    """Rebuild the shared set from the database and re-tag what it missed.
+
+    Only senders missing from the previously published set are re-tagged;
+    every sender is, when there is no previous set to compare against.
+    """
+    global _cache
+    senders = _senders_in_database()
+    published = None
+    try:
+        pipe = r.pipeline()
+        pipe.get(KNOWN_SENDERS_VERSION_KEY)
+        pipe.smembers(KNOWN_SENDERS_KEY)
+        version, members = pipe.execute()
+        if version is not None:
+            published = {member.decode() for member in members}
+        _cache = (str(_publish(senders)).encode(), senders)
+    except redis.RedisError as e:
+        print(f"Could not publish the known sender set: {e}")
+    added = senders if published is None else senders - published
+    if not added:
+        return 0
+    return retag_sender_transactions(added)
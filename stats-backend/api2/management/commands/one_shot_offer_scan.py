@@ -28,19 +28,33 @@ class Command(BaseCommand):
             nargs="*",
             default=["public", "ray-on-golem-heads"],
         )
+        parser.add_argument(
+            "--record",
+            metavar="FILE",
+            help="Also write every proposal to FILE as JSON lines "
+            "(input for the offer batch benchmark in api2.benchmarks).",
+        )
 
     def handle(self, *args, **options):
         self._wait_for_yagna()
+        record_to = open(options["record"], "w") if options["record"] else None
 
         async def scan_all():
             # One daemon serves several concurrent demand subscriptions, so
             # the subnets scan in parallel instead of stacking their 60s
             # windows.
             await asyncio.gather(
-                *(monitor_nodes_status(subnet) for subnet in options["subnets"])
+                *(
+                    monitor_nodes_status(subnet, record_to=record_to)
+                    for subnet in options["subnets"]
+                )
             )
 
-        asyncio.run(scan_all())
+        try:
+            asyncio.run(scan_all())
+        finally:
+            if record_to is not None:
+                record_to.close()
         self.stdout.write("scan complete")
 
     def _wait_for_yagna(self, timeout=90):
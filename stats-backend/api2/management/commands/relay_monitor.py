@@ -1,12 +1,14 @@
 # yourapp/management/commands/relay_monitor.py
 
 import asyncio
+import signal
 import aiohttp
 import requests
 from datetime import datetime
 from django.core.management.base import BaseCommand
 from django.db.models import Q
 from api2.models import Node
+from api2.relay import RelayEventBuffer, node_prefix, sweep_relay_nodes
 from api2.tasks import bulk_update_node_statuses
 from django.conf import settings
 
@@ -24,26 +26,59 @@ class Command(BaseCommand):
     def handle(self, *args, **options):
         self.relay_url = settings.RELAY_CONFIG[settings.NETWORK_TYPE]['url']
         self.log_message(f'Starting relay monitor for {settings.NETWORK_TYPE} network ({self.relay_url})...')
-        asyncio.run(self.main())
+        try:
+            asyncio.run(self.main())
+        except asyncio.CancelledError:
+            self.log_message('Relay monitor stopped')
 
     async def main(self):
-        await self.initial_relay_nodes_scan()
-        await self.listen_for_relay_events()
+        self.events = RelayEventBuffer(lambda batch: bulk_update_node_statuses.delay(batch))
+        # Stop through the finally below rather than dying with events unsent.
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+        flusher = asyncio.create_task(self.flush_relay_events())
+        try:
+            await self.initial_relay_nodes_scan()
+            await self.listen_for_relay_events()
+        finally:
+            flusher.cancel()
+            self.flush_events()
+            self.log_message(f"Relay event metrics: {self.events.metrics()}")
+
+    async def flush_relay_events(self):
+        while True:
+            await asyncio.sleep(settings.RELAY_EVENT_FLUSH_SECONDS)
+            self.flush_events()
+
+    def flush_events(self):
+        try:
+            flushed = self.events.flush()
+        except Exception as e:
+            self.log_message(f"Failed to queue node status updates: {e}", is_error=True)
+            return
+        if flushed:
+            metrics = self.events.metrics()
+            self.log_message(
+                f"Queued status update for {flushed} nodes "
+                f"({metrics['events_received']} events in {metrics['batches_flushed']} batches so far)"
+            )
 
     async def initial_relay_nodes_scan(self):
         self.log_message("Starting initial relay nodes scan...")
         nodes_to_update = {}
+        failed_prefixes = set()
 
         if settings.NETWORK_TYPE == "central":
             nodes_to_update.update(self.scan_golembase_nodes())
         else:
-            nodes_to_update.update(self.scan_yacn2_nodes())
+            nodes, failed_prefixes = await self.scan_yacn2_nodes()
+            nodes_to_update.update(nodes)
 
         self.log_message("Querying database for online providers...")
         online_providers = set(Node.objects.filter(online=True).values_list('node_id', flat=True))
         offline_count = 0
         for provider_id in online_providers:
-            if provider_id not in nodes_to_update:
+            # Providers under a prefix the relay didn't answer for are unknown, not offline.
+            if provider_id not in nodes_to_update and node_prefix(provider_id) not in failed_prefixes:
                 nodes_to_update[provider_id] = False
                 offline_count += 1
 
@@ -55,21 +90,16 @@ class Command(BaseCommand):
             bulk_update_node_statuses.delay(nodes_to_update_list)
         self.log_message("Initial relay nodes scan completed")
 
-    def scan_yacn2_nodes(self):
+    async def scan_yacn2_nodes(self):
         nodes = {}
         self.log_message("Scanning hybrid (yacn2) nodes...")
-        for prefix in range(256):
-            try:
-                response = requests.get(f"{self.relay_url}/nodes/{prefix:02x}", timeout=5)
-                response.raise_for_status()
-                data = response.json()
-                for node_id, sessions in data.items():
-                    node_id = node_id.strip().lower()
-                    is_online = bool(sessions) and any('seen' in item for item in sessions if item)
-                    nodes[node_id] = is_online
-            except requests.RequestException as e:
-                self.log_message(f"Error fetching data for prefix {prefix:02x} from hybrid relay: {e}", is_error=True)
-        return nodes
+        listing, failed = await sweep_relay_nodes(self.relay_url)
+        for node_id, sessions in listing.items():
+            is_online = bool(sessions) and any('seen' in item for item in sessions if item)
+            nodes[node_id] = is_online
+        for prefix, error in failed.items():
+            self.log_message(f"Error fetching data for prefix {prefix} from hybrid relay: {error}", is_error=True)
+        return nodes, set(failed)
 
     def scan_golembase_nodes(self):
         nodes = {}
@@ -135,7 +165,7 @@ class Command(BaseCommand):
 
         if event_type == 'new-node':
             self.log_message(f"New node detected: {node_id}")
-            bulk_update_node_statuses.delay([(node_id, True)])
+            self.events.add(node_id, True)
         elif event_type == 'lost-node':
             self.log_message(f"Node lost: {node_id}")
-            bulk_update_node_statuses.delay([(node_id, False)])
\ No newline at end of file
+            self.events.add(node_id, False)
\ No newline at end of file
@@ -0,0 +1,76 @@
+from django.db import migrations, models
+
+
+def backfill_node_uptime(apps, schema_editor):
+    # Replays the existing history once, the same way calculate_uptime_percentage
+    # used to on every call, and stores where the replay ended for each node.
+    NodeStatusHistory = apps.get_model("api2", "NodeStatusHistory")
+    NodeUptime = apps.get_model("api2", "NodeUptime")
+
+    batch = []
+    current = None
+
+    def finish(state):
+        batch.append(
+            NodeUptime(
+                node_id=state["node_id"],
+                first_seen_at=state["first_seen_at"],
+                online_seconds=state["online_seconds"],
+                is_online=state["last_online_time"] is not None,
+                last_transition_at=state["last_online_time"] or state["last_timestamp"],
+            )
+        )
+        if len(batch) >= 5000:
+            NodeUptime.objects.bulk_create(batch)
+            batch.clear()
+
+    rows = (
+        NodeStatusHistory.objects.order_by("node_id", "timestamp")
+        .values_list("node_id", "is_online", "timestamp")
+        .iterator(chunk_size=10000)
+    )
+    for node_id, is_online, timestamp in rows:
+        if current is None or current["node_id"] != node_id:
+            if current is not None:
+                finish(current)
+            current = {
+                "node_id": node_id,
+                "first_seen_at": timestamp,
+                "online_seconds": 0.0,
+                "last_online_time": None,
+                "last_timestamp": timestamp,
+            }
+        if is_online:
+            current["last_online_time"] = timestamp
+        elif current["last_online_time"] is not None:
+            current["online_seconds"] += (
+                timestamp - current["last_online_time"]
+            ).total_seconds()
+            current["last_online_time"] = None
+        current["last_timestamp"] = timestamp
+
+    if current is not None:
+        finish(current)
+    NodeUptime.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api2", "0042_offervariantsighting"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="NodeUptime",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("node_id", models.CharField(max_length=42, unique=True)),
+                ("first_seen_at", models.DateTimeField()),
+                ("online_seconds", models.FloatField(default=0)),
+                ("is_online", models.BooleanField(default=False)),
+                ("last_transition_at", models.DateTimeField()),
+            ],
+        ),
+        migrations.RunPython(backfill_node_uptime, migrations.RunPython.noop),
+    ]
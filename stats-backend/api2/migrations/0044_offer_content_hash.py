@@ -0,0 +1,18 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api2", "0043_nodeuptime"),
+    ]
+
+    operations = [
+        # Left empty on existing rows; the next scan that sees each offer
+        # fills it in without touching updated_at.
+        migrations.AddField(
+            model_name="offer",
+            name="content_hash",
+            field=models.CharField(blank=True, max_length=32, null=True),
+        ),
+    ]
@@ -0,0 +1,22 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api2", "0044_offer_content_hash"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="GolemTransactionsDaily",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("day", models.DateTimeField(db_index=True)),
+                ("transaction_type", models.CharField(blank=True, max_length=42, null=True)),
+                ("tx_from_golem", models.BooleanField()),
+                ("count", models.IntegerField()),
+                ("total_amount", models.FloatField()),
+            ],
+        ),
+    ]
@@ -0,0 +1,78 @@
+from datetime import timedelta
+
+from django.db import migrations, models
+from django.db.models import Count, F, FloatField, Sum
+from django.db.models.functions import TruncDay, TruncHour
+from django.utils import timezone
+
+# Keep in sync with api2.transaction_facts.HOURLY_FACT_DAYS.
+HOURLY_FACT_DAYS = 100
+
+
+def rebuild_transaction_facts(apps, schema_editor):
+    # The only backfill of the fact tables: 0045 creates the daily table
+    # empty, and hourly rows cover the last HOURLY_FACT_DAYS days.
+    GolemTransactions = apps.get_model("api2", "GolemTransactions")
+    GolemTransactionsDaily = apps.get_model("api2", "GolemTransactionsDaily")
+    GolemTransactionsHourly = apps.get_model("api2", "GolemTransactionsHourly")
+
+    def aggregate(queryset, bucket_name, trunc):
+        return (
+            queryset.annotate(**{bucket_name: trunc("timestamp")})
+            .values(bucket_name, "transaction_type", "tx_from_golem")
+            .annotate(
+                count=Count("scanner_id"),
+                total_amount=Sum("amount"),
+                sum_squares=Sum(F("amount") * F("amount"), output_field=FloatField()),
+            )
+            .order_by()
+        )
+
+    GolemTransactionsDaily.objects.all().delete()
+    GolemTransactionsDaily.objects.bulk_create(
+        (
+            GolemTransactionsDaily(**row)
+            for row in aggregate(GolemTransactions.objects.all(), "day", TruncDay).iterator()
+        ),
+        batch_size=5000,
+    )
+    cutoff = (timezone.now() - timedelta(days=HOURLY_FACT_DAYS)).replace(
+        hour=0, minute=0, second=0, microsecond=0
+    )
+    GolemTransactionsHourly.objects.bulk_create(
+        (
+            GolemTransactionsHourly(**row)
+            for row in aggregate(
+                GolemTransactions.objects.filter(timestamp__gte=cutoff), "hour", TruncHour
+            ).iterator()
+        ),
+        batch_size=5000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api2", "0045_golemtransactionsdaily"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="golemtransactionsdaily",
+            name="sum_squares",
+            field=models.FloatField(default=0),
+        ),
+        migrations.CreateModel(
+            name="GolemTransactionsHourly",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("hour", models.DateTimeField(db_index=True)),
+                ("transaction_type", models.CharField(blank=True, max_length=42, null=True)),
+                ("tx_from_golem", models.BooleanField()),
+                ("count", models.IntegerField()),
+                ("total_amount", models.FloatField()),
+                ("sum_squares", models.FloatField()),
+            ],
+        ),
+        migrations.RunPython(rebuild_transaction_facts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,26 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api2", "0046_golemtransactionshourly"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="transactionscraperindex",
+            name="indexing_heartbeat_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name="TransactionScrapeRange",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("start_epoch", models.BigIntegerField(unique=True)),
+                ("end_epoch", models.BigIntegerField()),
+                ("transfers", models.IntegerField(default=0)),
+                ("completed_at", models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+    ]
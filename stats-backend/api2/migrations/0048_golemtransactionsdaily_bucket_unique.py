@@ -0,0 +1,21 @@
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api2", "0047_transactionscraperange"),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name="golemtransactionsdaily",
+            constraint=models.UniqueConstraint(
+                models.F("day"),
+                Coalesce("transaction_type", models.Value("")),
+                models.F("tx_from_golem"),
+                name="golemtransactionsdaily_bucket_unique",
+            ),
+        ),
+    ]
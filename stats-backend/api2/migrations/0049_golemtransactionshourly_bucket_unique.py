@@ -0,0 +1,21 @@
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api2", "0048_golemtransactionsdaily_bucket_unique"),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name="golemtransactionshourly",
+            constraint=models.UniqueConstraint(
+                models.F("hour"),
+                Coalesce("transaction_type", models.Value("")),
+                models.F("tx_from_golem"),
+                name="golemtransactionshourly_bucket_unique",
+            ),
+        ),
+    ]
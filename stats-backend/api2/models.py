@@ -3,6 +3,7 @@ from datetime import timedelta
 from django.conf import settings
 from django.db import models
 from django.utils import timezone
+from django.db.models import F, Value
 from django.db.models.functions import Extract, Coalesce, Lag
 from metamask.models import UserProfile
 
@@ -72,6 +73,9 @@ class Offer(models.Model):
     # Last scan that observed this offer on the market, as opposed to
     # updated_at, which only moves when the offer's contents change.
     last_seen_at = models.DateTimeField(null=True, blank=True, db_index=True)
+    # offer_content_hash() of the variant stored in `properties`, so a scan
+    # can tell an unchanged offer without normalizing both sides.
+    content_hash = models.CharField(max_length=32, null=True, blank=True)
     monthly_price_glm = models.FloatField(null=True, blank=True)
     monthly_price_usd = models.FloatField(null=True, blank=True)
     hourly_price_glm = models.FloatField(null=True, blank=True)
@@ -150,6 +154,41 @@ class NodeStatusHistory(models.Model):
         ]
 
 
+class NodeUptime(models.Model):
+    """Running uptime totals for a node, advanced on every status transition.
+
+    Replaying a node's whole NodeStatusHistory to answer "how much of its life
+    was it online" gets slower every day the node exists. This keeps the
+    replay's state instead: online time of every closed online interval, plus
+    the current state and when it started, so the percentage at any moment
+    is a constant-time calculation. bulk_update_node_statuses moves it forward
+    in the same transaction that writes the history rows.
+    """
+
+    node_id = models.CharField(max_length=42, unique=True)
+    first_seen_at = models.DateTimeField()
+    online_seconds = models.FloatField(default=0)
+    is_online = models.BooleanField(default=False)
+    last_transition_at = models.DateTimeField()
+
+    def record_transition(self, is_online, at):
+        if self.is_online and not is_online:
+            self.online_seconds += (at - self.last_transition_at).total_seconds()
+        self.is_online = is_online
+        self.last_transition_at = at
+
+    def uptime_percentage(self, now=None):
+        if now is None:
+            now = timezone.now()
+        total_seconds = (now - self.first_seen_at).total_seconds()
+        if total_seconds <= 0:
+            return 0
+        online_seconds = self.online_seconds
+        if self.is_online:
+            online_seconds += (now - self.last_transition_at).total_seconds()
+        return (online_seconds / total_seconds) * 100
+
+
 class ProviderWithTask(models.Model):
     instance = models.ForeignKey(
         Node, on_delete=models.CASCADE, related_name="tasks_received"
@@ -208,7 +247,74 @@ class GolemTransactions(models.Model):
         ]
 
 
+class GolemTransactionsDaily(models.Model):
+    """GolemTransactions counted and summed per UTC day, type and origin.
+
+    Maintained by api2.transaction_facts.record_transactions in the same
+    transaction as the inserts; the transaction charts are built from it.
+    """
+
+    day = models.DateTimeField(db_index=True)
+    transaction_type = models.CharField(max_length=42, null=True, blank=True)
+    tx_from_golem = models.BooleanField()
+    count = models.IntegerField()
+    total_amount = models.FloatField()
+    sum_squares = models.FloatField(default=0)
+
+    class Meta:
+        constraints = [
+            # Writers delete and re-insert whole days; a second row for the
+            # same bucket means two of them raced. transaction_type is
+            # coalesced because NULLs never conflict in a unique index.
+            models.UniqueConstraint(
+                F("day"),
+                Coalesce("transaction_type", Value("")),
+                F("tx_from_golem"),
+                name="golemtransactionsdaily_bucket_unique",
+            ),
+        ]
+
+
+class GolemTransactionsHourly(models.Model):
+    """The same facts per UTC hour, kept for the last HOURLY_FACT_DAYS days."""
+
+    hour = models.DateTimeField(db_index=True)
+    transaction_type = models.CharField(max_length=42, null=True, blank=True)
+    tx_from_golem = models.BooleanField()
+    count = models.IntegerField()
+    total_amount = models.FloatField()
+    sum_squares = models.FloatField()
+
+    class Meta:
+        constraints = [
+            # As for GolemTransactionsDaily, per hour.
+            models.UniqueConstraint(
+                F("hour"),
+                Coalesce("transaction_type", Value("")),
+                F("tx_from_golem"),
+                name="golemtransactionshourly_bucket_unique",
+            ),
+        ]
+
+
 class TransactionScraperIndex(models.Model):
     indexed_before = models.BooleanField(default=False)
     latest_timestamp_indexed = models.DateTimeField(null=True, blank=True)
-    currently_indexing = models.BooleanField(default=False)
\ No newline at end of file
+    currently_indexing = models.BooleanField(default=False)
+    # Touched by the backfill after every range; a run whose heartbeat has
+    # gone quiet is considered dead and the next one takes over.
+    indexing_heartbeat_at = models.DateTimeField(null=True, blank=True)
+
+
+class TransactionScrapeRange(models.Model):
+    """One time range of the initial GolemTransactions backfill.
+
+    Both ends are inclusive epoch seconds, as the erc20-api expects them.
+    A range is done once its transfers are stored; completed_at is set in
+    the same transaction that brings their facts up to date.
+    """
+
+    start_epoch = models.BigIntegerField(unique=True)
+    end_epoch = models.BigIntegerField()
+    transfers = models.IntegerField(default=0)
+    completed_at = models.DateTimeField(null=True, blank=True)
@@ -0,0 +1,76 @@
+"""
+Wire format for offer batches sent to update_providers_info.
+
+A batch used to be a list of JSON strings, one per proposal, so every message
+repeated keys like "golem.com.pricing.model.linear.coeffs" thousands of times
+and then went through JSON twice more in the broker. The compact format keeps
+each distinct key set ("shape") once, stores every proposal as its shape
+index plus values, and zlib-compresses the result:
+
+    "ofz1:" + base64(zlib({"keys": [...], "shapes": [[key_index, ...], ...],
+                           "rows": [[shape_index, value, ...], ...]}))
+
+The result is a plain ASCII string, so it travels through Celery's JSON
+serializer unchanged. Both formats are accepted on decode, and compact is
+the default (OFFER_BATCH_ENCODING). Workers older than this module only
+understand the JSON list and would iterate a compact batch character by
+character, but they cannot take the new update_providers_info arguments
+either, so the scanner and every worker are upgraded together. A staggered
+rollout can set OFFER_BATCH_ENCODING=json on the scanner until the last old
+worker is gone.
+"""
+
+import base64
+import json
+import zlib
+
+from django.conf import settings
+
+COMPACT_PREFIX = "ofz1:"
+
+
+def _encode_compact(offers):
+    key_ids = {}
+    shape_ids = {}
+    keys, shapes, rows = [], [], []
+    for offer in offers:
+        shape = tuple(offer)
+        shape_id = shape_ids.get(shape)
+        if shape_id is None:
+            indexes = []
+            for key in shape:
+                if key not in key_ids:
+                    key_ids[key] = len(keys)
+                    keys.append(key)
+                indexes.append(key_ids[key])
+            shape_id = shape_ids[shape] = len(shapes)
+            shapes.append(indexes)
+        rows.append([shape_id, *offer.values()])
+    body = json.dumps(
+        {"keys": keys, "shapes": shapes, "rows": rows}, separators=(",", ":")
+    )
+    return COMPACT_PREFIX + base64.b64encode(zlib.compress(body.encode(), 6)).decode()
+
+
+def _decode_compact(payload):
+    body = json.loads(zlib.decompress(base64.b64decode(payload[len(COMPACT_PREFIX):])))
+    keys = body["keys"]
+    shapes = [[keys[i] for i in shape] for shape in body["shapes"]]
+    return [dict(zip(shapes[row[0]], row[1:])) for row in body["rows"]]
+
+
+def encode_offer_batch(offers, encoding=None):
+    """Encode a list of proposal dicts for update_providers_info."""
+    encoding = encoding or settings.OFFER_BATCH_ENCODING
+    if encoding == "compact":
+        return _encode_compact(offers)
+    return [json.dumps(offer) for offer in offers]
+
+
+def decode_offer_batch(payload):
+    """The proposal dicts of a batch in either format."""
+    if isinstance(payload, str):
+        if not payload.startswith(COMPACT_PREFIX):
+            raise ValueError("Unknown offer batch encoding")
+        return _decode_compact(payload)
+    return [json.loads(item) if isinstance(item, str) else item for item in payload]
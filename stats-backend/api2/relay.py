@@ -0,0 +1,129 @@
+"""
+Listing every node known to a hybrid (yacn2) relay.
+
+The relay answers GET /nodes/<prefix> with the nodes whose id starts with
+that byte, so a full listing takes 256 requests. relay_monitor and
+fetch_and_store_relay_nodes used to issue them one after another, each on a
+new connection, so one slow prefix held up the whole scan. sweep_relay_nodes
+runs them concurrently (RELAY_SWEEP_CONCURRENCY at a time) over one
+keep-alive session, retries a failing prefix RELAY_SWEEP_RETRIES times with
+exponential backoff, and merges the answers.
+
+Prefixes that still fail are reported instead of raised, so callers can
+tell "not listed" from "not known" (see node_prefix).
+
+relay_monitor also follows the relay's new-node/lost-node events. Queuing a
+bulk_update_node_statuses task per event meant thousands of one-row tasks
+whenever the relay restarted; RelayEventBuffer keeps the last state of every
+node instead and hands them over as one batch per flush.
+"""
+
+import asyncio
+
+import aiohttp
+from django.conf import settings
+
+PREFIXES = [f"{prefix:02x}" for prefix in range(256)]
+
+RETRY_BACKOFF_SECONDS = 0.5
+
+
+def node_prefix(node_id):
+    """The /nodes/<prefix> listing a node id appears in."""
+    return node_id.strip().lower().removeprefix("0x")[:2]
+
+
+async def _fetch_prefix(session, base_url, prefix, retries):
+    for attempt in range(retries + 1):
+        try:
+            async with session.get(f"{base_url}/nodes/{prefix}") as response:
+                response.raise_for_status()
+                listing = await response.json(content_type=None)
+            if not isinstance(listing, dict):
+                raise ValueError(f"Unexpected listing for prefix {prefix}")
+            return listing
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError):
+            if attempt == retries:
+                raise
+            await asyncio.sleep(RETRY_BACKOFF_SECONDS * 2 ** attempt)
+
+
+async def sweep_relay_nodes(base_url, concurrency=None, retries=None, timeout=None):
+    """List all the relay's nodes.
+
+    Returns ``(nodes, failed)``: ``{node_id: sessions}`` with lower-cased
+    ids from every prefix that answered, and ``{prefix: error}`` for those
+    that did not after all retries.
+    """
+    concurrency = concurrency or settings.RELAY_SWEEP_CONCURRENCY
+    retries = settings.RELAY_SWEEP_RETRIES if retries is None else retries
+    timeout = aiohttp.ClientTimeout(total=timeout or settings.RELAY_SWEEP_TIMEOUT)
+    base_url = base_url.rstrip("/")
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def fetch(session, prefix):
+        async with semaphore:
+            return await _fetch_prefix(session, base_url, prefix, retries)
+
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        results = await asyncio.gather(
+            *(fetch(session, prefix) for prefix in PREFIXES), return_exceptions=True
+        )
+
+    nodes, failed = {}, {}
+    for prefix, result in zip(PREFIXES, results):
+        if isinstance(result, BaseException):
+            failed[prefix] = result
+            continue
+        for node_id, sessions in result.items():
+            nodes[node_id.strip().lower()] = sessions
+    return nodes, failed
+
+
+class RelayEventBuffer:
+    """Node status events, coalesced until the next flush.
+
+    ``send`` gets a list of ``(node_id, online)`` with the last state
+    reported for each node since the previous flush. The owner calls flush()
+    every RELAY_EVENT_FLUSH_SECONDS and once more on shutdown; add() flushes
+    by itself when RELAY_EVENT_BUFFER_NODES nodes are waiting.
+    """
+
+    def __init__(self, send, max_nodes=None):
+        self.send = send
+        self.max_nodes = max_nodes or settings.RELAY_EVENT_BUFFER_NODES
+        self.pending = {}
+        self.events_received = 0
+        self.batches_flushed = 0
+        self.nodes_flushed = 0
+
+    def add(self, node_id, online):
+        self.events_received += 1
+        self.pending[node_id] = online
+        if len(self.pending) >= self.max_nodes:
+            self.flush()
+
+    def flush(self):
+        """Send what is waiting; returns the number of nodes sent."""
+        if not self.pending:
+            return 0
+        batch, self.pending = list(self.pending.items()), {}
+        try:
+            self.send(batch)
+        except Exception:
+            # Kept for the next flush, unless a newer state arrived meanwhile.
+            for node_id, online in batch:
+                self.pending.setdefault(node_id, online)
+            raise
+        self.batches_flushed += 1
+        self.nodes_flushed += len(batch)
+        return len(batch)
+
+    def metrics(self):
+        return {
+            "events_received": self.events_received,
+            "batches_flushed": self.batches_flushed,
+            "nodes_flushed": self.nodes_flushed,
+            "pending": len(self.pending),
+        }
@@ -0,0 +1,78 @@
+"""
+Trailing-window average and median over time-ordered rows.
+
+The pricing charts evaluate the 24h average and median of ProviderWithTask
+prices at a few hundred points. Slicing the window and sorting it again for
+every point costs O(points x window); here a single pass moves the window
+forward, each row entering and leaving a sorted container once, and the
+median is read off the middle of the container.
+"""
+
+from sortedcontainers import SortedList
+
+
+class RollingStats:
+    """Mean and median of a multiset that values are added to and removed from."""
+
+    __slots__ = ("_values", "_total")
+
+    def __init__(self):
+        self._values = SortedList()
+        self._total = 0.0
+
+    def __len__(self):
+        return len(self._values)
+
+    def add(self, value):
+        self._values.add(value)
+        self._total += value
+
+    def remove(self, value):
+        self._values.remove(value)
+        self._total -= value
+        if not self._values:
+            # Don't carry rounding residue into the next non-empty window.
+            self._total = 0.0
+
+    def mean(self):
+        return self._total / len(self._values) if self._values else 0
+
+    def median(self):
+        count = len(self._values)
+        if not count:
+            return 0
+        middle = count // 2
+        if count % 2:
+            return self._values[middle]
+        return (self._values[middle - 1] + self._values[middle]) / 2
+
+
+def windowed_series(rows, points, window, fields):
+    """Average and median of each field over the window ending at each point.
+
+    ``rows`` are ``(timestamp, value, value, ...)`` tuples sorted by
+    timestamp, with one value per name in ``fields``; None values are
+    skipped. ``points`` must be ascending. Each window covers the rows with
+    ``point - window <= timestamp <= point``. Returns one dict per point with
+    ``average_<field>`` and ``median_<field>`` keys.
+    """
+    stats = [RollingStats() for _ in fields]
+    series = []
+    head = tail = 0
+    for point in points:
+        while head < len(rows) and rows[head][0] <= point:
+            for field_stats, value in zip(stats, rows[head][1:]):
+                if value is not None:
+                    field_stats.add(value)
+            head += 1
+        while tail < head and rows[tail][0] < point - window:
+            for field_stats, value in zip(stats, rows[tail][1:]):
+                if value is not None:
+                    field_stats.remove(value)
+            tail += 1
+        entry = {}
+        for name, field_stats in zip(fields, stats):
+            entry[f"average_{name}"] = field_stats.mean()
+            entry[f"median_{name}"] = field_stats.median()
+        series.append(entry)
+    return series
@@ -7,10 +7,11 @@ import redis
 import pathlib
 import sys
 import subprocess
+import time
 import requests
 from datetime import datetime, timedelta
 from django.utils import timezone
-from .models import Node, NodeStatusHistory, GLM, EC2Instance, Offer, OfferVariantSighting
+from .models import Node, NodeStatusHistory, GLM, Offer, OfferVariantSighting
 from asgiref.sync import sync_to_async
 from yapapi import props as yp
 from yapapi.config import ApiConfig
@@ -19,11 +20,12 @@ from yapapi.props.builder import DemandBuilder
 from yapapi.rest import Configuration, Market
 from core.celery import app
 from django.db.models import Q
-from django.db.models import Case, When, Value, F
-from django.db.models.functions import Abs
+from django.db.models import Case, When, Value
 from django.db import transaction
 import calendar
 from .utils import identify_network_by_offer, identify_wallet_and_network
+from .ec2_index import get_ec2_index
+from .offer_codec import decode_offer_batch, encode_offer_batch
 from django.db import transaction
 from django.db.models import OuterRef, Subquery
 from concurrent.futures import ThreadPoolExecutor
@@ -61,13 +63,16 @@ def select_current_variants(variants_by_key, now):
     """Pick one offer per (provider, runtime) from this scan's proposals.
 
     ``variants_by_key`` maps (provider_id, runtime) to {content_hash: data} —
-    every distinct version of the offer that arrived in this scan. Providers
+    every distinct version of the offer that arrived in this scan (data is
+    None for a variant the sender reported as seen but unchanged). Providers
     frequently deliver two: the pre-change offer next to the post-change one.
     The winner is the variant that appeared on the market most recently
     (largest first_seen_at in OfferVariantSighting), so an operator's edit wins
     immediately and keeps winning, instead of alternating with the stale copy
     by arrival order. Ties (e.g. both variants first recorded in the same
     scan) break on the hash, which is arbitrary but stable — no oscillation.
+
+    Returns {(provider_id, runtime): (content_hash, data)} for the winners.
     """
     known = {}  # (provider, runtime) -> {content_hash: sighting}
     for s in OfferVariantSighting.objects.filter(
@@ -110,35 +115,59 @@ def select_current_variants(variants_by_key, now):
         candidates.sort(key=lambda c: (c[0], c[1]))
         # A None winner means the current best variant was absent from this
         # batch; keep the stored contents and only mark the offer as seen.
-        winners[(provider_id, runtime)] = candidates[-1][2]
+        winners[(provider_id, runtime)] = (candidates[-1][1], candidates[-1][2])
 
     if to_create:
         OfferVariantSighting.objects.bulk_create(to_create, ignore_conflicts=True)
     if to_touch:
         OfferVariantSighting.objects.bulk_update(to_touch, ["last_seen_at"])
+    return winners
+
+
+def finish_offer_scan(now):
+    """Bookkeeping that belongs to a whole scan rather than to one chunk."""
     # Variants no provider has advertised for a day are gone for good; without
     # pruning the table would grow with every price change ever made.
     OfferVariantSighting.objects.filter(
         last_seen_at__lt=now - timedelta(days=1)).delete()
-    return winners
 
 
 @app.task
-def update_providers_info(node_props):
+def update_providers_info(node_props, scan_complete=True, still_seen=None):
+    """Ingest a batch of proposals, in either offer_codec format.
+
+    A scan may deliver its proposals over several calls; only the last one
+    carries ``scan_complete`` and runs the per-scan bookkeeping. Callers that
+    send a whole scan at once keep the default.
+
+    ``still_seen`` lists (node_id, runtime, content_hash) of offers the sender
+    already delivered in full and knows to be unchanged; they are only marked
+    as observed by this scan.
+    """
     now = timezone.now()
     days_in_current_month = calendar.monthrange(now.year, now.month)[1]
     seconds_current_month = days_in_current_month * 24 * 60 * 60
     hours_in_current_month = days_in_current_month * 24
     glm_usd_value = GLM.objects.get(id=1)
+    # Built once per process and reused until the EC2 table changes, instead
+    # of one nearest-instance query per vm offer.
+    ec2_index = get_ec2_index()
 
     # Collect provider_ids and data
     provider_data_list = []
-    for prop in node_props:
-        data = json.loads(prop)
+    for data in decode_offer_batch(node_props):
         provider_id = data["node_id"]
         provider_data_list.append((provider_id, data))
 
     provider_ids = [provider_id for provider_id, _ in provider_data_list]
+    still_seen = [tuple(entry) for entry in still_seen or []]
+    provider_ids += [provider_id for provider_id, _, _ in still_seen]
+    if not provider_ids:
+        # Typically the closing marker of a chunked scan with nothing left
+        # in its buffer.
+        if scan_complete:
+            finish_offer_scan(now)
+        return
 
     # Get existing Nodes
     existing_nodes = Node.objects.filter(node_id__in=provider_ids)
@@ -148,21 +177,18 @@ def update_providers_info(node_props):
     existing_provider_ids = set(existing_nodes_dict.keys())
     new_provider_ids = set(provider_ids) - existing_provider_ids
 
-    # Create new Node instances if any
-    new_nodes = []
-    for provider_id in new_provider_ids:
-        node, created = Node.objects.get_or_create(
-            node_id=provider_id,
-            defaults={'type': 'provider'}
+    # Create new Node instances if any. One INSERT ... ON CONFLICT DO NOTHING
+    # for all of them, so a provider another scan inserted in the meantime is
+    # not an error. Django does not return primary keys for conflict-tolerant
+    # inserts, so the new rows are read back with a single keyed query.
+    if new_provider_ids:
+        Node.objects.bulk_create(
+            [Node(node_id=provider_id, type='provider')
+             for provider_id in new_provider_ids],
+            ignore_conflicts=True
         )
-        if created:
-            new_nodes.append(node)
-        existing_nodes_dict[node.node_id] = node
-
-    # Update existing_nodes_dict with newly created nodes
-    updated_nodes = Node.objects.filter(node_id__in=new_provider_ids)
-    for node in updated_nodes:
-        existing_nodes_dict[node.node_id] = node
+        for node in Node.objects.filter(node_id__in=new_provider_ids):
+            existing_nodes_dict[node.node_id] = node
 
     # Now process offers. One scan routinely delivers several proposals for
     # the same (provider, runtime) — commonly a pre-change offer alongside the
@@ -174,6 +200,9 @@ def update_providers_info(node_props):
         runtime = data["golem.runtime.name"]
         offer_key = (provider_id, runtime)
         variants_by_key.setdefault(offer_key, {})[offer_content_hash(data)] = data
+    for provider_id, runtime, content_hash in still_seen:
+        variants_by_key.setdefault((provider_id, runtime), {}).setdefault(
+            content_hash, None)
 
     offer_data = select_current_variants(variants_by_key, now)
     offer_keys = list(offer_data)
@@ -181,8 +210,7 @@ def update_providers_info(node_props):
     # Get existing Offers
     existing_offers = Offer.objects.filter(
         provider__node_id__in=provider_ids,
-        runtime__in=[data["golem.runtime.name"]
-                     for _, data in provider_data_list]
+        runtime__in={runtime for _, runtime in variants_by_key}
     ).select_related('provider')
 
     existing_offers_dict = {
@@ -192,35 +220,41 @@ def update_providers_info(node_props):
     existing_offer_keys = set(existing_offers_dict.keys())
     new_offer_keys = set(offer_keys) - existing_offer_keys
 
-    # Create new Offer instances if any
-    new_offers = []
-    for offer_key in new_offer_keys:
-        provider_id, runtime = offer_key
-        provider = existing_nodes_dict[provider_id]
-        offer, created = Offer.objects.get_or_create(
-            provider=provider,
-            runtime=runtime,
-            defaults={
-                'properties': offer_data[offer_key],
-                'last_seen_at': now,
-            }
+    # Create new Offer instances if any, the same way as the nodes above:
+    # one conflict-tolerant insert, then only the new keys are read back.
+    if new_offer_keys:
+        Offer.objects.bulk_create(
+            [
+                Offer(
+                    provider=existing_nodes_dict[provider_id],
+                    runtime=runtime,
+                    properties=offer_data[(provider_id, runtime)][1],
+                    content_hash=(
+                        offer_data[(provider_id, runtime)][0]
+                        if offer_data[(provider_id, runtime)][1] is not None
+                        else None
+                    ),
+                    last_seen_at=now,
+                )
+                for provider_id, runtime in new_offer_keys
+            ],
+            ignore_conflicts=True
         )
-        if created:
-            new_offers.append(offer)
-        existing_offers_dict[(provider_id, runtime)] = offer
-
-    # Update existing_offers_dict with newly created offers
-    updated_offers = Offer.objects.filter(
-        provider__node_id__in=provider_ids).select_related('provider')
-    existing_offers_dict.update(
-        {(offer.provider.node_id, offer.runtime): offer for offer in updated_offers})
+        created_offers = Offer.objects.filter(
+            provider__node_id__in={key[0] for key in new_offer_keys},
+            runtime__in={key[1] for key in new_offer_keys}
+        ).select_related('provider')
+        for offer in created_offers:
+            offer_key = (offer.provider.node_id, offer.runtime)
+            if offer_key in new_offer_keys:
+                existing_offers_dict[offer_key] = offer
 
     # Now process and update offers
     offers_to_update = []  # offers whose contents changed
     offers_seen_only = []  # unchanged, but observed again in this scan
     # offer_data is keyed by (provider, runtime), so each offer is handled once
     # even when the same provider sends several proposals for one runtime.
-    for offer_key, data in offer_data.items():
+    for offer_key, (content_hash, data) in offer_data.items():
         provider_id, runtime = offer_key
         offer = existing_offers_dict.get(offer_key)
         if not offer:
@@ -273,10 +307,7 @@ def update_providers_info(node_props):
             vcpu_needed = data.get("golem.inf.cpu.threads", 0)
             memory_needed = data.get("golem.inf.mem.gib", 0.0)
             # Find closest EC2 instance
-            closest_ec2 = EC2Instance.objects.annotate(
-                cpu_diff=Abs(F("vcpu") - vcpu_needed),
-                memory_diff=Abs(F("memory") - memory_needed),
-            ).order_by("cpu_diff", "memory_diff", "price_usd").first()
+            closest_ec2 = ec2_index.nearest(vcpu_needed, memory_needed)
 
             if closest_ec2 and monthly_pricing:
                 offer_price_usd = min(
@@ -295,21 +326,32 @@ def update_providers_info(node_props):
                         'times_cheaper': float(ec2_monthly_price) / offer_price_usd if offer_is_cheaper else None,
                     }
                     for field, value in comparison.items():
-                        if getattr(offer, field) != value:
+                        if field in ('overpriced_compared_to', 'cheaper_than'):
+                            # Compare the foreign keys by id: reading the
+                            # related instance would be a query per offer.
+                            current = getattr(offer, f'{field}_id')
+                            compared = value.pk if value else None
+                        else:
+                            current, compared = getattr(offer, field), value
+                        if current != compared:
                             setattr(offer, field, value)
                             changed = True
                 else:
                     print("EC2 monthly price is zero, cannot compare offer prices.")
 
-        # Always update the offer if any properties have changed
-        # Compare existing properties with new data
-        normalized_existing = normalize_properties((offer.properties or {}).copy())
-        normalized_new = normalize_properties(data.copy())
-
-        if normalized_existing != normalized_new:
-            print(f"DETECTED CHANGE Updating offer {offer.id}")
-            offer.properties = data
-            changed = True
+        # Always update the offer if any properties have changed. The stored
+        # hash of the last winning variant settles the common case of an
+        # unchanged offer with a string compare; the normalized comparison
+        # only runs when the hashes differ (or none was stored yet).
+        if offer.content_hash != content_hash:
+            normalized_existing = normalize_properties((offer.properties or {}).copy())
+            normalized_new = normalize_properties(data.copy())
+
+            if normalized_existing != normalized_new:
+                print(f"DETECTED CHANGE Updating offer {offer.id}")
+                offer.properties = data
+                changed = True
+            offer.content_hash = content_hash
 
         # Record that this scan saw the offer, whether or not it changed. This
         # is what separates "the provider still advertises this" from "this is
@@ -331,12 +373,12 @@ def update_providers_info(node_props):
                 'monthly_price_glm', 'monthly_price_usd', 'hourly_price_glm', 'hourly_price_usd',
                 'is_overpriced', 'overpriced_compared_to', 'times_more_expensive',
                 'suggest_env_per_hour_price', 'cheaper_than', 'times_cheaper',
-                'properties', 'updated_at', 'last_seen_at'
+                'properties', 'content_hash', 'updated_at', 'last_seen_at'
             ]
         )
 
     if offers_seen_only:
-        Offer.objects.bulk_update(offers_seen_only, ['last_seen_at'])
+        Offer.objects.bulk_update(offers_seen_only, ['last_seen_at', 'content_hash'])
 
     # Update Nodes
     nodes_to_update = []
@@ -359,6 +401,8 @@ def update_providers_info(node_props):
             # Include updated_at in the fields list
             ['wallet', 'network', 'type', 'updated_at']
         )
+    if scan_complete:
+        finish_offer_scan(now)
     print(f"Done updating {len(provider_ids)} providers")
 
 import base64
@@ -423,11 +467,63 @@ def transform_golem_base_offer(offer_data):
         print(f"Error transforming golem-base offer: {e}")
         return None
 
+# Per-entity state of the golem-base scraper between runs: entity key ->
+# JSON [fingerprint of the raw value, node_id, runtime, content_hash].
+GOLEM_BASE_FINGERPRINTS_KEY = "golem_base_offer_fingerprints"
+# While this key exists the scraper trusts the fingerprints. It expires every
+# GOLEM_BASE_FULL_SYNC_SECONDS, and the next run then re-sends every offer in
+# full, so prices derived from the GLM rate get recomputed for unchanged
+# offers too and any drift between redis and the database is repaired.
+GOLEM_BASE_FULL_SYNC_KEY = "golem_base_offer_full_sync"
+GOLEM_BASE_FULL_SYNC_SECONDS = 3600
+# Changed entities are decoded and ingested by ingest_golem_base_offers in
+# chunks of this size, spread over the celery worker pool.
+GOLEM_BASE_INGEST_CHUNK = 250
+
+
+def golem_base_entity_fingerprint(entity):
+    return hashlib.md5(entity.get('value', '').encode()).hexdigest()
+
+
+@app.task
+def ingest_golem_base_offers(entities):
+    """Decode and ingest a chunk of new or changed golem-base entities.
+
+    The chunk comes in offer_codec's compact format. The task is as new as
+    the format, so no worker without offer_codec can receive it.
+
+    The fingerprints are recorded only once the offers are stored, so an
+    entity whose ingestion failed is sent again by the next scraper run.
+    """
+    offers = []
+    fingerprints = {}
+    for entity in decode_offer_batch(entities):
+        transformed = transform_golem_base_offer(entity)
+        if not transformed:
+            continue
+        offers.append(transformed)
+        fingerprint = golem_base_entity_fingerprint(entity)
+        fingerprints[entity.get('key') or fingerprint] = json.dumps([
+            fingerprint,
+            transformed.get('node_id'),
+            transformed.get('golem.runtime.name'),
+            offer_content_hash(transformed),
+        ])
+    if offers:
+        update_providers_info(offers, scan_complete=False)
+        r.hset(GOLEM_BASE_FINGERPRINTS_KEY, mapping=fingerprints)
+
+
 @app.task
 def golem_base_offer_scraper():
     """
-    Fetches offers from the golem-base RPC endpoint, transforms them,
-    and passes them to the update_providers_info task.
+    Fetches offers from the golem-base RPC endpoint and forwards what changed.
+
+    Every entity's raw value is fingerprinted and compared with the previous
+    run. New or changed entities go to ingest_golem_base_offers in chunks, so
+    decoding and ingestion run in parallel on the worker pool; unchanged ones
+    only travel as a (node_id, runtime, content_hash) "still seen" list. The
+    work per run follows the churn of the market, not its size.
     """
     config = settings.OFFER_SCRAPER_CONFIG.get("golembase", {})
     url = config.get("rpc_url")
@@ -436,6 +532,8 @@ def golem_base_offer_scraper():
         return
 
     headers = {'Content-Type': 'application/json'}
+    # golembase_queryEntities has no paging parameters; the whole result set
+    # arrives in one response.
     payload = {
         "jsonrpc": "2.0",
         "id": 1,
@@ -452,19 +550,43 @@ def golem_base_offer_scraper():
         response = requests.post(url, headers=headers, json=payload, auth=auth)
         response.raise_for_status()
         offers = response.json().get('result', [])
-        
-        transformed_offers = []
-        for offer in offers:
-            transformed = transform_golem_base_offer(offer)
-            if transformed:
-                transformed_offers.append(json.dumps(transformed))
-        
-        if transformed_offers:
-            print(f"Found {len(transformed_offers)} offers from golem-base. Sending to update_providers_info.")
-            update_providers_info.delay(transformed_offers)
-
     except requests.exceptions.RequestException as e:
         print(f"Error fetching offers from golem-base: {e}")
+        return
+
+    known = {
+        key.decode(): json.loads(value)
+        for key, value in r.hgetall(GOLEM_BASE_FINGERPRINTS_KEY).items()
+    }
+    trust_known = r.set(
+        GOLEM_BASE_FULL_SYNC_KEY, 1, ex=GOLEM_BASE_FULL_SYNC_SECONDS, nx=True
+    ) is None
+
+    changed = []
+    still_seen = []
+    current_keys = set()
+    for offer in offers:
+        fingerprint = golem_base_entity_fingerprint(offer)
+        entity_key = offer.get('key') or fingerprint
+        current_keys.add(entity_key)
+        previous = known.get(entity_key)
+        if trust_known and previous and previous[0] == fingerprint:
+            still_seen.append(previous[1:])
+        else:
+            changed.append(offer)
+
+    gone = set(known) - current_keys
+    if gone:
+        r.hdel(GOLEM_BASE_FINGERPRINTS_KEY, *gone)
+
+    for start in range(0, len(changed), GOLEM_BASE_INGEST_CHUNK):
+        ingest_golem_base_offers.delay(encode_offer_batch(
+            changed[start:start + GOLEM_BASE_INGEST_CHUNK], encoding="compact"))
+    # The still-seen list doubles as this run's scan-complete marker.
+    update_providers_info.delay([], scan_complete=True, still_seen=still_seen)
+    print(
+        f"Found {len(offers)} offers on golem-base: {len(changed)} new or "
+        f"changed, {len(still_seen)} unchanged, {len(gone)} gone.")
 
 
 examples_dir = pathlib.Path(__file__).resolve().parent.parent
@@ -472,8 +594,56 @@ sys.path.append(str(examples_dir))
 from .yapapi_utils import build_parser, print_env_info, format_usage  # noqa: E402
 
 
+class OfferChunker:
+    """Hands a running scan's proposals to update_providers_info in chunks.
+
+    Collecting a whole 60s scan before sending it meant one broker message of
+    tens of megabytes, all of it held in the scanner's memory, and no offer
+    updated until the scan was over. Proposals are flushed once
+    OFFER_SCAN_CHUNK_SIZE have piled up or the oldest has waited
+    OFFER_SCAN_CHUNK_SECONDS; complete() sends the rest together with the
+    scan-complete marker.
+    """
+
+    def __init__(self, max_size=None, max_age=None, clock=time.monotonic,
+                 record_to=None):
+        self.max_size = max_size or settings.OFFER_SCAN_CHUNK_SIZE
+        self.max_age = max_age or settings.OFFER_SCAN_CHUNK_SECONDS
+        self.clock = clock
+        # Optional text file that receives every proposal as a JSON line, for
+        # replaying a real scan in api2.benchmarks.
+        self.record_to = record_to
+        self.pending = []
+        self.oldest_at = None
+        self.proposals_sent = 0
+        self.chunks_sent = 0
+
+    def add(self, data):
+        if not self.pending:
+            self.oldest_at = self.clock()
+        self.pending.append(data)
+        if self.record_to is not None:
+            self.record_to.write(json.dumps(data) + "\n")
+        if (len(self.pending) >= self.max_size or
+                self.clock() - self.oldest_at >= self.max_age):
+            self.flush()
+
+    def flush(self, scan_complete=False):
+        if not self.pending and not scan_complete:
+            return
+        update_providers_info.delay(
+            encode_offer_batch(self.pending), scan_complete=scan_complete)
+        self.proposals_sent += len(self.pending)
+        self.chunks_sent += 1
+        self.pending = []
+        self.oldest_at = None
+
+    def complete(self):
+        self.flush(scan_complete=True)
+
+
 async def list_offers(
-    conf: Configuration, subnet_tag: str, current_scan_providers, node_props
+    conf: Configuration, subnet_tag: str, current_scan_providers, chunker
 ):
     async with conf.market() as client:
         market_api = Market(client)
@@ -493,11 +663,11 @@ async def list_offers(
                 data["wallet"] = wallet
                 data["network"] = network
                 data["node_id"] = event.issuer
-                node_props.append(json.dumps(data))
+                chunker.add(data)
 
 
-async def monitor_nodes_status(subnet_tag: str = "public"):
-    node_props = []
+async def monitor_nodes_status(subnet_tag: str = "public", record_to=None):
+    chunker = OfferChunker(record_to=record_to)
     current_scan_providers = set()
 
     # Call list_offers with a timeout
@@ -508,7 +678,7 @@ async def monitor_nodes_status(subnet_tag: str = "public"):
                     app_key="stats"
                 )),
                 subnet_tag=subnet_tag,
-                node_props=node_props,
+                chunker=chunker,
                 current_scan_providers=current_scan_providers,
             ),
             timeout=60,  # 60-second timeout for each scan
@@ -517,6 +687,8 @@ async def monitor_nodes_status(subnet_tag: str = "public"):
         print("Scan timeout reached")
     print(
         f"In the current scan, we found {len(current_scan_providers)} providers")
-# Delay update_nodes_data call using Celery
 
-    update_providers_info.delay(node_props)
+    # Whatever is still buffered goes out with the scan-complete marker.
+    chunker.complete()
+    print(
+        f"Sent {chunker.proposals_sent} proposals in {chunker.chunks_sent} chunks")
@@ -1,32 +1,11 @@
-from .models import Node, Offer, EC2Instance, NodeStatusHistory
-from datetime import timedelta
-from django.utils import timezone
+from .models import NodeUptime
 
 
 def calculate_uptime_percentage(node_id, node=None):
-    if node is None:
-        node = Node.objects.get(node_id=node_id)
-    statuses = NodeStatusHistory.objects.filter(node_id=node_id).order_by("timestamp")
-    first_online_status = statuses.first()
-    
-    if not first_online_status:
+    # The ledger is kept current by bulk_update_node_statuses, so this no
+    # longer depends on how much status history the node has accumulated.
+    # `node` is accepted for the existing call sites but isn't needed.
+    ledger = NodeUptime.objects.filter(node_id=node_id).first()
+    if ledger is None:
         return 0  # Return 0% if the node has never been online
-    online_duration = timedelta(0)
-    last_online_time = None
-
-    for status in statuses:
-        if status.is_online:
-            last_online_time = status.timestamp
-        elif last_online_time:
-            online_duration += status.timestamp - last_online_time
-            last_online_time = None
-
-    # Check if the node is currently online and add the duration
-    if last_online_time is not None:
-        online_duration += timezone.now() - last_online_time
-
-    total_duration = timezone.now() - first_online_status.timestamp
-    uptime_percentage = (
-        online_duration.total_seconds() / total_duration.total_seconds()
-    ) * 100
-    return uptime_percentage
+    return ledger.uptime_percentage()
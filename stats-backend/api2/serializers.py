@@ -1,5 +1,8 @@
+from django.db import models
+from django.db.models import Prefetch, prefetch_related_objects
+from django.utils import timezone
 from rest_framework import serializers
-from .models import Node, Offer, EC2Instance, NodeStatusHistory
+from .models import Node, Offer, EC2Instance, NodeStatusHistory, NodeUptime
 from .scoring import calculate_uptime_percentage
 
 
@@ -62,12 +65,46 @@ class OfferSerializer(serializers.ModelSerializer):
         return data
 
 
+class NodeListSerializer(serializers.ListSerializer):
+    """many=True for NodeSerializer with a fixed number of queries.
+
+    The online list is thousands of nodes, and per node the serializer would
+    otherwise query its offers, both EC2 comparisons of every offer and its
+    uptime. Here the offers (with their EC2 rows) and the uptime ledgers are
+    loaded for the whole page at once and handed to the child serializer on
+    the node objects.
+    """
+
+    def to_representation(self, data):
+        iterable = data.all() if isinstance(data, models.manager.BaseManager) else data
+        nodes = list(iterable)
+        prefetch_related_objects(
+            nodes,
+            Prefetch(
+                "offer_set",
+                queryset=Offer.objects.select_related(
+                    "overpriced_compared_to", "cheaper_than"
+                ).order_by("id"),
+                to_attr="prefetched_offers",
+            ),
+        )
+        ledgers = NodeUptime.objects.in_bulk(
+            [node.node_id for node in nodes], field_name="node_id"
+        )
+        now = timezone.now()
+        for node in nodes:
+            ledger = ledgers.get(node.node_id)
+            node.prefetched_uptime = ledger.uptime_percentage(now) if ledger else 0
+        return super().to_representation(nodes)
+
+
 class NodeSerializer(serializers.ModelSerializer):
     runtimes = serializers.SerializerMethodField("get_offers")
     uptime = serializers.SerializerMethodField("get_uptime")
 
     class Meta:
         model = Node
+        list_serializer_class = NodeListSerializer
         fields = [
             "uptime",
             "earnings_total",
@@ -83,8 +120,12 @@ class NodeSerializer(serializers.ModelSerializer):
         ]
 
     def get_offers(self, node):
-        offers = Offer.objects.filter(provider=node)
+        offers = getattr(node, "prefetched_offers", None)
+        if offers is None:
+            offers = Offer.objects.filter(provider=node)
         return {offer.runtime: OfferSerializer(offer).data for offer in offers}
 
     def get_uptime(self, node):
+        if hasattr(node, "prefetched_uptime"):
+            return node.prefetched_uptime
         return calculate_uptime_percentage(node.node_id, node)
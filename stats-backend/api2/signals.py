@@ -0,0 +1,19 @@
+from django.db import transaction
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from collector.models import Requestors
+
+from .models import RelayNodes
+
+
+@receiver(post_save, sender=Requestors)
+@receiver(post_save, sender=RelayNodes)
+def publish_new_golem_sender(sender, instance, created, **kwargs):
+    # Existing senders are saved again on every scrape; only new ones change
+    # the known sender set (see api2/golem_senders.py).
+    if created:
+        from .tasks import add_known_golem_sender
+
+        node_id = instance.node_id
+        transaction.on_commit(lambda: add_known_golem_sender.delay(node_id))
@@ -2,10 +2,8 @@ from .models import NodeStatusHistory, Node
 from django.db.models import Case, When, Value, BooleanField
 from django.conf import settings
 from collector.models import ProvidersComputing
-from django.db.models.functions import TruncDay, Coalesce
+from django.db.models.functions import TruncDay
 from django.db.models import IntegerField, ExpressionWrapper, Case, When, Avg
-from django.utils.timezone import utc
-from collector.models import Requestors
 from .models import TransactionScraperIndex, GolemTransactions
 from .models import RelayNodes
 import urllib.parse
@@ -19,19 +17,20 @@ from django.db import models
 from django.db.models.fields.json import KeyTextTransform
 from django.db.models import Subquery, OuterRef
 from datetime import timedelta
-from django.db.models import Max, Sum
+from django.db.models import Max
 import numpy as np
 from django.db.models import Q
 from numpy import median
 from django.db.models import Avg
 from .utils import identify_network_by_offer
 from .models import ProviderWithTask, Node, Offer, PricingSnapshot
+from api import prometheus
 from api.utils import get_stats_data
 import time
 from .scanner import monitor_nodes_status
 import asyncio
 from django.db import transaction
-from .scoring import calculate_uptime_percentage
+from .models import NodeUptime
 from django.db.models.functions import Cast
 from django.db.models import (
     FloatField,
@@ -39,7 +38,19 @@ from django.db.models import (
 from datetime import timedelta
 import datetime
 from django.db.models import Avg, Max
-from collector.models import NetworkStats, ProvidersComputingMax
+from collector.models import NetworkStats, NetworkStatsRollup, ProvidersComputingMax
+from collector.rollups import rollup_runtimes, rollup_series
+from .rolling_stats import windowed_series
+from .transaction_facts import record_transactions, transaction_chart_payloads
+from core.cached_json import store_json_payload
+from .golem_senders import add_known_sender, known_golem_senders, sync_known_senders
+from .relay import sweep_relay_nodes
+from .glm_transfers import (
+    BACKFILL_HEARTBEAT_TIMEOUT,
+    backfill_golem_transactions,
+    golem_transaction,
+    iter_transfer_batches,
+)
 from collections import defaultdict
 from django.db.models.functions import TruncHour, TruncDay
 from core.celery import app
@@ -60,7 +71,6 @@ from collector.models import Node as NodeV1
 from django.db.models import F
 from django.db.models.functions import Abs
 from django.core.serializers.json import DjangoJSONEncoder
-from django.core.exceptions import ObjectDoesNotExist
 
 from decimal import Decimal
 from .utils import (
@@ -112,9 +122,17 @@ def online_nodes_uptime_donut_data():
             },
         }
 
+        # One query for every online node's uptime ledger instead of a
+        # history replay per node.
+        ledgers = NodeUptime.objects.filter(
+            node_id__in=Node.objects.filter(online=True).values("node_id")
+        ).in_bulk(field_name="node_id")
+        now = timezone.now()
+
         def update_uptime_data(nodes, network):
             for node in nodes:
-                uptime_percentage = calculate_uptime_percentage(node.node_id)
+                ledger = ledgers.get(node.node_id)
+                uptime_percentage = ledger.uptime_percentage(now) if ledger else 0
                 if uptime_percentage >= 80:
                     uptime_data[network]["80_and_over"] += 1
                 elif 50 <= uptime_percentage < 80:
@@ -129,7 +147,7 @@ def online_nodes_uptime_donut_data():
         update_uptime_data(nodes_testnet, "testnet")
 
         # Save the result in a cache or similar storage
-        r.set("online_nodes_uptime_donut_data", json.dumps(uptime_data))
+        store_json_payload(r, "online_nodes_uptime_donut_data", json.dumps(uptime_data))
     except Exception as e:
         print(f"Error: {e}")
 
@@ -190,7 +208,7 @@ def compare_ec2_and_golem():
                 }
             )
 
-        r.set("ec2_comparison", json.dumps(
+        store_json_payload(r, "ec2_comparison", json.dumps(
             comparison_results, cls=DecimalEncoder))
 
         # Columnar copy for the compressed endpoint.
@@ -202,7 +220,8 @@ def compare_ec2_and_golem():
             if comparison_results
             else {}
         )
-        r.set(
+        store_json_payload(
+            r,
             "ec2_comparison_columnar",
             json.dumps(columnar, cls=DecimalEncoder, separators=(",", ":")),
         )
@@ -212,41 +231,33 @@ def compare_ec2_and_golem():
 
 @app.task
 def network_historical_stats_to_redis_v2():
+    # Averages come from the rollup tiers (collector/rollups.py): hourly
+    # buckets for "1d", daily buckets for everything longer, so "1y" and
+    # "All" no longer scan years of 10-second samples.
     now = timezone.now()
-    runtime_names = NetworkStats.objects.values_list(
-        "runtime", flat=True).distinct()
+    runtime_names = rollup_runtimes(NetworkStatsRollup.DAILY)
     formatted_data = {
         runtime: {"1d": [], "7d": [], "1m": [], "1y": [], "All": []}
         for runtime in runtime_names
     }
 
-    def data_with_granularity(runtime_name, start_date, end_date, granularity):
-        stats = (
-            NetworkStats.objects.filter(
-                runtime=runtime_name, date__range=(start_date, end_date)
-            )
-            .annotate(timestamp=granularity("date"))
-            .values("timestamp")
-            .annotate(
-                online=Avg("online"),
-                cores=Avg("cores"),
-                memory=Avg("memory"),
-                disk=Avg("disk"),
-                gpus=Avg("gpus"),
+    def data_with_granularity(runtime_name, start_date, end_date, resolution):
+        stats = [
+            dict(averages, timestamp=bucket)
+            for bucket, averages in rollup_series(
+                runtime_name, resolution, start_date, end_date
             )
-            .order_by("timestamp")
+        ]
+        latest_stat = (
+            NetworkStats.objects.filter(
+                runtime=runtime_name, date__lt=end_date)
+            .order_by("-date")
+            .values("online", "cores", "memory", "disk", "gpus")
+            .first()
         )
-        if granularity in [TruncDay, TruncHour]:
-            latest_stat = (
-                NetworkStats.objects.filter(
-                    runtime=runtime_name, date__lt=end_date)
-                .order_by("-date")
-                .values("online", "cores", "memory", "disk", "gpus")
-                .first()
-            )
-            if latest_stat:
-                latest_stat["timestamp"] = end_date - timedelta(microseconds=1)
-                stats = list(stats) + [latest_stat]
+        if latest_stat:
+            latest_stat["timestamp"] = end_date - timedelta(microseconds=1)
+            stats.append(latest_stat)
         return stats
 
     def append_data(formatted_data, runtime_name, data_source, key):
@@ -267,22 +278,17 @@ def network_historical_stats_to_redis_v2():
             ("7d", now - timedelta(days=7)),
             ("1m", now - timedelta(days=30)),
             ("1y", now - timedelta(days=365)),
-            (
-                "All",
-                NetworkStats.objects.filter(
-                    runtime=runtime_name).earliest("date").date,
-            ),
+            ("All", None),
         ]
         for key, start_date in time_intervals:
-            data = data_with_granularity(
-                runtime_name,
-                start_date,
-                now,
-                TruncDay if key not in ["1d"] else TruncHour,
+            resolution = (
+                NetworkStatsRollup.HOURLY if key == "1d" else NetworkStatsRollup.DAILY
             )
+            data = data_with_granularity(
+                runtime_name, start_date, now, resolution)
             append_data(formatted_data, runtime_name, data, key)
 
-    r.set("network_historical_stats_v2", json.dumps(formatted_data))
+    store_json_payload(r, "network_historical_stats_v2", json.dumps(formatted_data))
 
     # Columnar copy for the compressed endpoint: per timeframe, one array per
     # field instead of a list of row objects. Same values, ~6x smaller raw.
@@ -294,7 +300,8 @@ def network_historical_stats_to_redis_v2():
         }
         for runtime, intervals in formatted_data.items()
     }
-    r.set(
+    store_json_payload(
+        r,
         "network_historical_stats_v2_columnar",
         json.dumps(columnar_data, separators=(",", ":")),
     )
@@ -317,7 +324,7 @@ def v2_network_online_to_redis():
 
     # Serialize and save to Redis
     test = json.dumps(serialized_data, default=str)
-    r.set("v2_online", test)
+    store_json_payload(r, "v2_online", test, max_age=20)
 
 
 @app.task
@@ -354,7 +361,8 @@ def v2_network_online_to_redis_flatmap():
     data = NodeV1.objects.filter(online=True)
     serializer = FlatNodeSerializer(data, many=True)
     test = json.dumps(serializer.data)
-    r.set("v2_online_flatmap", test)
+    # Not on a schedule, so no promise of when it changes next.
+    store_json_payload(r, "v2_online_flatmap", test, max_age=0)
 
 
 @app.task
@@ -368,7 +376,7 @@ def v2_cheapest_offer():
     serializer = OfferSerializer(data, many=True)
     sorted_data = json.dumps(serializer.data, default=str)
 
-    r.set("v2_cheapest_offer", sorted_data)
+    store_json_payload(r, "v2_cheapest_offer", sorted_data, max_age=30)
 
 
 @app.task
@@ -787,7 +795,7 @@ def v2_network_stats_to_redis():
     stats_by_runtime["totalOnlineTestnet"] = total_online_testnet
 
     serialized = json.dumps(stats_by_runtime, default=dict)
-    r.set("online_stats_by_runtime", serialized)
+    store_json_payload(r, "online_stats_by_runtime", serialized, max_age=10)
 
     for runtime, data in stats_by_runtime.items():
         if isinstance(data, dict):
@@ -955,7 +963,7 @@ def median_and_average_pricing_past_hour():
                 )["start_price__avg"] or 0,
             }
 
-        r.set("pricing_past_hour_v2", json.dumps(pricing_data))
+        store_json_payload(r, "pricing_past_hour_v2", json.dumps(pricing_data))
     except Exception as e:
         # Better error logging
         print(f"Error in median_and_average_pricing_past_hour: {e}")
@@ -1007,7 +1015,7 @@ def chart_pricing_data_for_frontend():
         }
         networks_data[network] = data
 
-    r.set("pricing_data_charted_v2", json.dumps(networks_data))
+    store_json_payload(r, "pricing_data_charted_v2", json.dumps(networks_data), max_age=600)
 
 
 @app.task
@@ -1061,7 +1069,8 @@ def sum_highest_runtime_resources():
         f"Total storage: {total_storage}"
         f"Total gpus: {total_gpus}"
     )
-    r.set(
+    store_json_payload(
+        r,
         "v2_network_online_stats",
         json.dumps(
             {
@@ -1112,7 +1121,7 @@ def get_online_counts():
     }
 
     result = {"data": formatted_data, "stats": stats}
-    r.set("v2_online_counts", json.dumps(result))
+    store_json_payload(r, "v2_online_counts", json.dumps(result), max_age=30)
 
 
 @app.task
@@ -1144,7 +1153,7 @@ def count_cpu_vendors():
 
     cpu_vendors_json = json.dumps(cpu_vendors_count)
 
-    r.set("cpu_vendors_count", cpu_vendors_json)
+    store_json_payload(r, "cpu_vendors_count", cpu_vendors_json, max_age=20)
 
 
 @app.task
@@ -1177,7 +1186,7 @@ def count_cpu_architecture():
 
     cpu_architecture_json = json.dumps(cpu_architecture_count)
 
-    r.set("cpu_architecture_count", cpu_architecture_json)
+    store_json_payload(r, "cpu_architecture_count", cpu_architecture_json, max_age=20)
 
 
 @app.task
@@ -1219,55 +1228,41 @@ def online_nodes_computing():
 
 @app.task
 def fetch_and_store_relay_nodes():
-    base_url = "http://yacn2.dev.golem.network:9000/nodes/"
+    nodes, failed = asyncio.run(
+        sweep_relay_nodes(settings.RELAY_CONFIG["hybrid"]["url"])
+    )
+    for prefix, error in failed.items():
+        print(f"Error fetching data for prefix {prefix}: {error}")
 
-    for prefix in range(256):
+    for node_id, sessions in nodes.items():
         try:
-            response = requests.get(f"{base_url}{prefix:02x}")
-            response.raise_for_status()
-            data = response.json()
+            if not sessions:
+                continue
 
-            for node_id, sessions in data.items():
-                try:
-                    if not sessions:
-                        continue
-                        
-                    node_id = node_id.strip().lower()
-                    
-                    # Handle case where sessions[0] or peer key doesn't exist
-                    if not sessions[0] or "peer" not in sessions[0]:
-                        continue
-                        
-                    peer = sessions[0]["peer"]
-                    if not peer or ":" not in peer:
-                        continue
-                        
-                    ip_port = peer.split(":")
-                    if len(ip_port) != 2:
-                        continue
-                        
-                    try:
-                        ip, port = ip_port[0], int(ip_port[1])
-                    except (IndexError, ValueError):
-                        continue
-
-                    obj, created = RelayNodes.objects.update_or_create(
-                        node_id=node_id, defaults={
-                            "ip_address": ip, "port": port}
-                    )
-
-                except Exception as node_error:
-                    print(f"Error processing node {node_id}: {node_error}")
-                    continue
+            # Handle case where sessions[0] or peer key doesn't exist
+            if not sessions[0] or "peer" not in sessions[0]:
+                continue
 
-        except requests.RequestException as e:
-            print(f"Error fetching data for prefix {prefix:02x}: {e}")
-            continue
-        except ValueError as e:
-            print(f"Error parsing JSON for prefix {prefix:02x}: {e}")
-            continue
-        except Exception as e:
-            print(f"Unexpected error for prefix {prefix:02x}: {e}")
+            peer = sessions[0]["peer"]
+            if not peer or ":" not in peer:
+                continue
+
+            ip_port = peer.split(":")
+            if len(ip_port) != 2:
+                continue
+
+            try:
+                ip, port = ip_port[0], int(ip_port[1])
+            except (IndexError, ValueError):
+                continue
+
+            obj, created = RelayNodes.objects.update_or_create(
+                node_id=node_id, defaults={
+                    "ip_address": ip, "port": port}
+            )
+
+        except Exception as node_error:
+            print(f"Error processing node {node_id}: {node_error}")
             continue
 
 
@@ -1289,131 +1284,39 @@ def init_golem_tx_scraping():
         print("Initial indexing has already been completed. Use fetch_latest_glm_tx for updates.")
         return
 
-    # Check if indexing is already in progress
-    if index.currently_indexing:
+    # Check if indexing is already in progress. A run whose heartbeat went
+    # quiet died without resetting the flag; take over from its checkpoints.
+    if index.currently_indexing and index.indexing_heartbeat_at is not None and (
+        timezone.now() - index.indexing_heartbeat_at < BACKFILL_HEARTBEAT_TIMEOUT
+    ):
         print("Indexing is already in progress. Please wait for it to complete.")
         return
 
+    index.currently_indexing = True
+    index.indexing_heartbeat_at = timezone.now()
+    index.save(update_fields=["currently_indexing", "indexing_heartbeat_at"])
     try:
-        # Set currently_indexing flag
-        index.currently_indexing = True
-        index.save()
-
-        current_time_epoch = int(datetime.datetime.utcnow().replace(tzinfo=utc).timestamp())
-        print(f"Current time epoch: {current_time_epoch}")
-
-        start_epoch = 1553165313  # March 21, 2019
-        print(f"Initial start epoch: {start_epoch}")
-
-        end_epoch = start_epoch + 2592000  # 30 days in seconds
-        print(f"End epoch: {end_epoch}")
-
-        URL_TEMPLATE = "http://erc20-api/erc20/api/stats/transfers?chain=137&receiver=all&from={}&to={}"
-
-        try:
-            latest_timestamp = 0
-            while start_epoch < current_time_epoch:
-                print(f"Fetching data from {start_epoch} to {end_epoch}")
-                url = URL_TEMPLATE.format(
-                    start_epoch, min(end_epoch, current_time_epoch)
-                )
-                print(f"Making request to URL: {url}")
-                response = requests.get(url)
-                if response.status_code != 200:
-                    print(f"Error response from API: {response.status_code}")
-                    print(url)
-                    raise Exception(
-                        f"Failed to fetch data. Status code: {response.status_code}"
-                    )
-
-                data = response.json()
-                transfers = data.get("transfers", [])
-                print(f"Retrieved {len(transfers)} transfers")
-                if not transfers:
-                    print("No transfers found, moving to next time period")
-                    start_epoch = end_epoch + 1
-                    end_epoch += 2592000
-                    continue
-
-                BATCH_SIZE = 5000
-                from_addrs = {t["fromAddr"] for t in transfers}
-                print(f"Found {len(from_addrs)} unique sender addresses")
-                known_senders = set(
-                    Requestors.objects.filter(node_id__in=from_addrs).values_list(
-                        "node_id", flat=True
-                    )
-                ).union(
-                    RelayNodes.objects.filter(node_id__in=from_addrs).values_list(
-                        "node_id", flat=True
-                    )
-                )
-                print(f"Found {len(known_senders)} known senders")
-
-                for i in range(0, len(transfers), BATCH_SIZE):
-                    print(
-                        f"Processing batch {i//BATCH_SIZE + 1} of {(len(transfers)-1)//BATCH_SIZE + 1}")
-                    with transaction.atomic():
-                        batch = transfers[i: i + BATCH_SIZE]
-                        golem_transactions = []
-                        for t in batch:
-                            timestamp = datetime.datetime.fromtimestamp(t["blockTimestamp"], tz=utc)
-                            latest_timestamp = max(
-                                latest_timestamp, t["blockTimestamp"])
-                            transaction_type = (
-                                "batched"
-                                if t["toAddr"]
-                                == "0x50100d4faf5f3b09987dea36dc2eddd57a3e561b"
-                                else (
-                                    "singleTransfer"
-                                    if t["toAddr"]
-                                    == "0x0b220b82f3ea3b7f6d9a1d8ab58930c064a2b5bf"
-                                    else None
-                                )
-                            )
-
-                            golem_transactions.append(
-                                GolemTransactions(
-                                    txhash=t["txHash"],
-                                    scanner_id=t["id"],
-                                    amount=int(t["tokenAmount"]) / 1e18,
-                                    timestamp=timestamp,
-                                    transaction_type=transaction_type,
-                                    receiver=t["receiverAddr"],
-                                    sender=t["fromAddr"],
-                                    tx_from_golem=t["fromAddr"] in known_senders,
-                                )
-                            )
-                        print(
-                            f"Bulk creating {len(golem_transactions)} transactions")
-                        GolemTransactions.objects.bulk_create(
-                            golem_transactions, ignore_conflicts=True
-                        )
-
-                start_epoch = end_epoch + 1
-                end_epoch += 2592000
-                print(f"Moving to next time period: {start_epoch} to {end_epoch}")
-
-            print("Reached current time, updating index")
-            index.indexed_before = True
-            index.currently_indexing = False  # Reset the flag
-            if latest_timestamp > 0:
-                index.latest_timestamp_indexed = datetime.datetime.fromtimestamp(latest_timestamp, tz=utc)
-            index.save()
-            print(f"Index updated with latest timestamp: {latest_timestamp}")
-
-        except Exception as e:
-            # Make sure to reset the flag even if there's an error
-            index.currently_indexing = False
-            index.save()
-            print(f"Error occurred in data processing: {str(e)}")
-            raise e
-
+        # Completed ranges are checkpointed in TransactionScrapeRange, so
+        # after a failure the next run continues with the open ones.
+        summary = backfill_golem_transactions()
+
+        print("Reached current time, updating index")
+        index.indexed_before = True
+        latest = GolemTransactions.objects.aggregate(latest=Max("timestamp"))["latest"]
+        if latest is not None:
+            index.latest_timestamp_indexed = latest
+        print(f"Index updated with latest timestamp: {latest}")
+        return summary
     except Exception as e:
-        # Make sure to reset the flag even if there's an error in the outer try block
-        index.currently_indexing = False
-        index.save()
-        print(f"Error occurred in task setup: {str(e)}")
+        print(f"Error occurred in data processing: {str(e)}")
         raise e
+    finally:
+        # Make sure to reset the flag even if there's an error
+        index.currently_indexing = False
+        index.save(
+            update_fields=[
+                "indexed_before", "latest_timestamp_indexed", "currently_indexing"]
+        )
 
 @app.task
 def fetch_latest_glm_tx():
@@ -1427,59 +1330,23 @@ def fetch_latest_glm_tx():
         latest_timestamp = int(index.latest_timestamp_indexed.timestamp())
         print(f"Fetching transactions from {latest_timestamp} to {epoch_now}")
 
-        url = f"http://erc20-api/erc20/api/stats/transfers?chain=137&receiver=all&from={latest_timestamp}&to={epoch_now}"
-        print(f"Making request to URL: {url}")
-        response = requests.get(url)
-        if response.status_code != 200:
-            print(f"Error response from API: {response.status_code}")
-            raise Exception(
-                f"Failed to fetch updates. Status code: {response.status_code}"
-            )
-
-        data = response.json()
-        print("Response data:", data)
-        transfers = data.get("transfers", [])
-        if not transfers:
+        latest_block_timestamp = 0
+        inserted = 0
+        for transfers in iter_transfer_batches(latest_timestamp, epoch_now):
+            known_senders = known_golem_senders()
+            golem_transactions = []
+            for t in transfers:
+                latest_block_timestamp = max(
+                    latest_block_timestamp, t["blockTimestamp"])
+                golem_transactions.append(golem_transaction(t, known_senders))
+            print(f"Bulk creating {len(golem_transactions)} transactions")
+            record_transactions(golem_transactions)
+            inserted += len(golem_transactions)
+
+        if not inserted:
             print("No new transactions")
             return
 
-        latest_block_timestamp = 0
-        golem_transactions = []
-        from_addrs = {t["fromAddr"] for t in transfers}
-        print(f"Found {len(from_addrs)} unique sender addresses")
-        known_senders = set(
-            Requestors.objects.filter(node_id__in=from_addrs).values_list(
-                "node_id", flat=True
-            )
-        )
-        print(f"Found {len(known_senders)} known senders")
-
-        for t in transfers:
-            timestamp = datetime.datetime.fromtimestamp(t["blockTimestamp"], tz=timezone.utc)
-            latest_block_timestamp = max(
-                latest_block_timestamp, t["blockTimestamp"])
-            if t["toAddr"] == "0x0b220b82f3ea3b7f6d9a1d8ab58930c064a2b5bf":
-                transaction_type = "singleTransfer"
-            elif t["toAddr"] == "0x50100d4faf5f3b09987dea36dc2eddd57a3e561b":
-                transaction_type = "batched"
-            else:
-                transaction_type = None
-            golem_transactions.append(
-                GolemTransactions(
-                    txhash=t["txHash"],
-                    scanner_id=t["id"],
-                    amount=int(t["tokenAmount"]) / 1e18,
-                    transaction_type=transaction_type,
-                    timestamp=timestamp,
-                    receiver=t["receiverAddr"],
-                    sender=t["fromAddr"],
-                    tx_from_golem=t["fromAddr"] in known_senders,
-                )
-            )
-
-        print(f"Bulk creating {len(golem_transactions)} transactions")
-        GolemTransactions.objects.bulk_create(
-            golem_transactions, ignore_conflicts=True)
         index.latest_timestamp_indexed = datetime.datetime.fromtimestamp(latest_block_timestamp + 1, tz=timezone.utc)
         index.save()
         print(
@@ -1490,305 +1357,24 @@ def fetch_latest_glm_tx():
 
 
 @app.task
-def average_transaction_value_over_time():
-    def aggregate_average_value(start_date, end_date):
-        return (
-            GolemTransactions.objects.filter(
-                timestamp__range=(start_date, end_date))
-            .annotate(date=TruncDay("timestamp"))
-            .values("date")
-            .annotate(
-                on_golem=Coalesce(
-                    Avg(
-                        "amount",
-                        filter=Q(tx_from_golem=True),
-                        output_field=FloatField(),
-                    ),
-                    0,
-                    output_field=FloatField(),
-                ),
-                not_golem=Coalesce(
-                    Avg(
-                        "amount",
-                        filter=Q(tx_from_golem=False),
-                        output_field=FloatField(),
-                    ),
-                    0,
-                    output_field=FloatField(),
-                ),
-            )
-            .order_by("date")
-        )
-
-    now = timezone.now()
-    formatted_data = {
-        "7d": [],
-        "14d": [],
-        "1m": [],
-        "3m": [],
-        "6m": [],
-        "1y": [],
-        "All": [],
-    }
-    intervals = {
-        "7d": (now - timedelta(days=7), now),
-        "14d": (now - timedelta(days=14), now),
-        "1m": (now - timedelta(days=30), now),
-        "3m": (now - timedelta(days=90), now),
-        "6m": (now - timedelta(days=180), now),
-        "1y": (now - timedelta(days=365), now),
-        "All": (GolemTransactions.objects.earliest("timestamp").timestamp, now),
-    }
-
-    for period, (start_date, end_date) in intervals.items():
-        data = aggregate_average_value(start_date, end_date)
-        formatted_data[period] = list(data)
-
-    r.set(
-        "average_transaction_value_over_time",
-        json.dumps(formatted_data, cls=DjangoJSONEncoder),
-    )
+def transaction_charts_to_redis():
+    # All six GolemTransactions charts, built from the daily fact table in
+    # one pass (see api2/transaction_facts.py).
+    for key, formatted_data in transaction_chart_payloads().items():
+        store_json_payload(r, key, json.dumps(formatted_data, cls=DjangoJSONEncoder))
 
 
 @app.task
-def daily_transaction_type_counts():
-    def aggregate_counts(start_date, end_date):
-        return (
-            GolemTransactions.objects.filter(
-                timestamp__range=(start_date, end_date))
-            .annotate(date=TruncDay("timestamp"))
-            .values("date")
-            .annotate(
-                singleTransfer=Count(
-                    "scanner_id", filter=Q(transaction_type="singleTransfer")
-                ),
-                batched=Count("scanner_id", filter=Q(
-                    transaction_type="batched")),
-            )
-            .order_by("date")
-        )
-
-    now = timezone.now()
-    formatted_data = {
-        "7d": [],
-        "14d": [],
-        "1m": [],
-        "3m": [],
-        "6m": [],
-        "1y": [],
-        "All": [],
-    }
-    intervals = {
-        "7d": (now - timedelta(days=7), now),
-        "14d": (now - timedelta(days=14), now),
-        "1m": (now - timedelta(days=30), now),
-        "3m": (now - timedelta(days=90), now),
-        "6m": (now - timedelta(days=180), now),
-        "1y": (now - timedelta(days=365), now),
-        "All": (GolemTransactions.objects.earliest("timestamp").timestamp, now),
-    }
-
-    for period, (start_date, end_date) in intervals.items():
-        data = aggregate_counts(start_date, end_date)
-        formatted_data[period] = list(data)
-
-    r.set(
-        "daily_transaction_type_counts",
-        json.dumps(formatted_data, cls=DjangoJSONEncoder),
-    )
+def add_known_golem_sender(address):
+    retagged = add_known_sender(address)
+    if retagged:
+        print(f"Re-tagged {retagged} transactions from new Golem sender {address}")
 
 
 @app.task
-def transaction_type_comparison():
-    now = timezone.now()
-    formatted_data = {
-        "7d": [],
-        "14d": [],
-        "1m": [],
-        "3m": [],
-        "6m": [],
-        "1y": [],
-        "All": [],
-    }
-    intervals = {
-        "7d": (now - timedelta(days=7), now),
-        "14d": (now - timedelta(days=14), now),
-        "1m": (now - timedelta(days=30), now),
-        "3m": (now - timedelta(days=90), now),
-        "6m": (now - timedelta(days=180), now),
-        "1y": (now - timedelta(days=365), now),
-        "All": (GolemTransactions.objects.earliest("timestamp").timestamp, now),
-    }
-
-    def aggregate_types(start_date, end_date):
-        return (
-            GolemTransactions.objects.filter(
-                timestamp__range=(start_date, end_date),
-                transaction_type__in=["singleTransfer", "batched"],
-            )
-            .values("transaction_type")
-            .annotate(total=Count("scanner_id"))
-            .order_by("transaction_type")
-        )
-
-    for period, (start_date, end_date) in intervals.items():
-        data = aggregate_types(start_date, end_date)
-        formatted_data[period] = list(data)
-
-    r.set(
-        "transaction_type_comparison", json.dumps(
-            formatted_data, cls=DjangoJSONEncoder)
-    )
-
-
-@app.task
-def amount_transferred_over_time():
-    def aggregate_amount(start_date, end_date):
-        return (
-            GolemTransactions.objects.filter(
-                timestamp__range=(start_date, end_date))
-            .annotate(date=TruncDay("timestamp"))
-            .values("date")
-            .annotate(total_amount=Sum("amount"))
-            .order_by("date")
-        )
-
-    now = timezone.now()
-    formatted_data = {
-        "7d": [],
-        "14d": [],
-        "1m": [],
-        "3m": [],
-        "6m": [],
-        "1y": [],
-        "All": [],
-    }
-    intervals = {
-        "7d": (now - timedelta(days=7), now),
-        "14d": (now - timedelta(days=14), now),
-        "1m": (now - timedelta(days=30), now),
-        "3m": (now - timedelta(days=90), now),
-        "6m": (now - timedelta(days=180), now),
-        "1y": (now - timedelta(days=365), now),
-        "All": (GolemTransactions.objects.earliest("timestamp").timestamp, now),
-    }
-
-    for period, (start_date, end_date) in intervals.items():
-        data = aggregate_amount(start_date, end_date)
-        formatted_data[period] = list(data)
-
-    r.set(
-        "amount_transferred_over_time",
-        json.dumps(formatted_data, cls=DjangoJSONEncoder),
-    )
-
-
-@app.task
-def transaction_volume_over_time():
-    def aggregate_transactions(start_date, end_date):
-        return (
-            GolemTransactions.objects.filter(
-                timestamp__range=(start_date, end_date))
-            .annotate(date=TruncDay("timestamp"))
-            .values("date")
-            .annotate(
-                # Count rows by PK — Count("amount", distinct=True) collapsed
-                # same-day transfers of identical value into one.
-                on_golem=Count("scanner_id", filter=Q(tx_from_golem=True)),
-                not_golem=Count("scanner_id", filter=Q(tx_from_golem=False)),
-            )
-            .order_by("date")
-        )
-
-    now = timezone.now()
-    formatted_data = {
-        "7d": [],
-        "14d": [],
-        "1m": [],
-        "3m": [],
-        "6m": [],
-        "1y": [],
-        "All": [],
-    }
-    intervals = {
-        "7d": (now - timedelta(days=7), now),
-        "14d": (now - timedelta(days=14), now),
-        "1m": (now - timedelta(days=30), now),
-        "3m": (now - timedelta(days=90), now),
-        "6m": (now - timedelta(days=180), now),
-        "1y": (now - timedelta(days=365), now),
-        "All": (GolemTransactions.objects.earliest("timestamp").timestamp, now),
-    }
-
-    for period, (start_date, end_date) in intervals.items():
-        data = aggregate_transactions(start_date, end_date)
-        formatted_data[period] = list(data)
-
-    r.set(
-        "transaction_volume_over_time",
-        json.dumps(formatted_data, cls=DjangoJSONEncoder),
-    )
-
-
-@app.task
-def daily_volume_golem_vs_chain():
-    def aggregate_volume(start_date, end_date):
-        return (
-            GolemTransactions.objects.filter(
-                timestamp__range=(start_date, end_date))
-            .annotate(date=TruncDay("timestamp"))
-            .values("date")
-            .annotate(
-                on_golem=Coalesce(
-                    Sum(
-                        "amount",
-                        filter=Q(tx_from_golem=True),
-                        output_field=FloatField(),
-                    ),
-                    0,
-                    output_field=FloatField(),
-                ),
-                not_golem=Coalesce(
-                    Sum(
-                        "amount",
-                        filter=Q(tx_from_golem=False),
-                        output_field=FloatField(),
-                    ),
-                    0,
-                    output_field=FloatField(),
-                ),
-            )
-            .order_by("date")
-        )
-
-    now = timezone.now()
-    formatted_data = {
-        "7d": [],
-        "14d": [],
-        "1m": [],
-        "3m": [],
-        "6m": [],
-        "1y": [],
-        "All": [],
-    }
-    intervals = {
-        "7d": (now - timedelta(days=7), now),
-        "14d": (now - timedelta(days=14), now),
-        "1m": (now - timedelta(days=30), now),
-        "3m": (now - timedelta(days=90), now),
-        "6m": (now - timedelta(days=180), now),
-        "1y": (now - timedelta(days=365), now),
-        "All": (GolemTransactions.objects.earliest("timestamp").timestamp, now),
-    }
-
-    for period, (start_date, end_date) in intervals.items():
-        data = aggregate_volume(start_date, end_date)
-        formatted_data[period] = list(data)
-
-    r.set(
-        "daily_volume_golem_vs_chain", json.dumps(
-            formatted_data, cls=DjangoJSONEncoder)
-    )
+def sync_known_golem_senders():
+    retagged = sync_known_senders()
+    print(f"Known Golem senders synced, {retagged} transactions re-tagged")
 
 
 @app.task
@@ -1824,7 +1410,8 @@ def computing_total_over_time():
         )
         formatted_data[period] = list(data)
 
-    r.set(
+    store_json_payload(
+        r,
         "computing_total_over_time", json.dumps(
             formatted_data, cls=DjangoJSONEncoder)
     )
@@ -1845,78 +1432,37 @@ def _format_network_stats_entry(timestamp, entry):
 
 @app.task
 def network_stats_combined_hourly():
-    # Last 7 days of raw NetworkStats samples (~10s cadence per runtime)
-    # averaged into hourly points. Intermediate series consumed by
-    # network_stats_combined_5min when it composes the combined payload.
-    # Runtimes with no samples in the window are omitted entirely so retired
-    # ones don't show up as empty charts.
-    now = timezone.now()
-    runtime_names = NetworkStats.objects.filter(
-        date__gte=now - timedelta(days=7)
-    ).values_list("runtime", flat=True).distinct()
+    # Last 7 days of NetworkStats as hourly averages, read from the hourly
+    # rollup tier. Intermediate series consumed by network_stats_combined_5min
+    # when it composes the combined payload. Runtimes with no samples in the
+    # window are omitted entirely so retired ones don't show up as empty charts.
+    since = timezone.now() - timedelta(days=7)
     data = {}
-    for runtime_name in runtime_names:
-        stats = (
-            NetworkStats.objects.filter(
-                runtime=runtime_name, date__gte=now - timedelta(days=7)
-            )
-            .annotate(timestamp=TruncHour("date"))
-            .values("timestamp")
-            .annotate(
-                online=Avg("online"),
-                cores=Avg("cores"),
-                memory=Avg("memory"),
-                disk=Avg("disk"),
-                gpus=Avg("gpus"),
-            )
-            .order_by("timestamp")
-        )
+    for runtime_name in rollup_runtimes(NetworkStatsRollup.HOURLY, since=since):
         data[runtime_name] = [
-            _format_network_stats_entry(entry["timestamp"], entry) for entry in stats
+            _format_network_stats_entry(bucket, averages)
+            for bucket, averages in rollup_series(
+                runtime_name, NetworkStatsRollup.HOURLY, since
+            )
         ]
     r.set("network_stats_combined_hourly", json.dumps(data))
 
 
 @app.task
 def network_stats_combined_5min():
-    # Last 24h of raw NetworkStats samples averaged into 5-minute buckets,
-    # merged with the cached hourly 7d series into the combined columnar
-    # payload served by /v2/network/historical/stats/combined.
+    # Last 24h of NetworkStats from the 5-minute rollup tier, merged with the
+    # cached hourly 7d series into the combined columnar payload served by
+    # /v2/network/historical/stats/combined.
     now = timezone.now()
-    runtime_names = NetworkStats.objects.filter(
-        date__gte=now - timedelta(days=7)
-    ).values_list("runtime", flat=True).distinct()
     hourly = json.loads(r.get("network_stats_combined_hourly") or "{}")
     combined = {}
-    for runtime_name in runtime_names:
-        buckets = {}
-        rows = NetworkStats.objects.filter(
-            runtime=runtime_name, date__gte=now - timedelta(days=1)
-        ).values_list("date", "online", "cores", "memory", "disk", "gpus")
-        for date, online, cores, memory, disk, gpus in rows:
-            bucket = date.replace(
-                minute=date.minute - date.minute % 5, second=0, microsecond=0
-            )
-            acc = buckets.setdefault(bucket, [0, 0.0, 0.0, 0.0, 0.0, 0.0])
-            acc[0] += 1
-            acc[1] += online or 0
-            acc[2] += cores or 0
-            acc[3] += memory or 0
-            acc[4] += disk or 0
-            acc[5] += gpus or 0
+    for runtime_name in rollup_runtimes(
+        NetworkStatsRollup.HOURLY, since=now - timedelta(days=7)
+    ):
         series = [
-            _format_network_stats_entry(
-                bucket,
-                {
-                    "online": online / n,
-                    "cores": cores / n,
-                    "memory": memory / n,
-                    "disk": disk / n,
-                    "gpus": gpus / n,
-                },
-            )
-            for bucket, (n, online, cores, memory, disk, gpus) in sorted(
-                buckets.items()
+            _format_network_stats_entry(bucket, averages)
+            for bucket, averages in rollup_series(
+                runtime_name, NetworkStatsRollup.FIVE_MINUTES, now - timedelta(days=1)
             )
         ]
         combined[runtime_name] = {
@@ -1929,7 +1475,8 @@ def network_stats_combined_5min():
         }
         for runtime, frames in combined.items()
     }
-    r.set(
+    store_json_payload(
+        r,
         "network_historical_stats_combined",
         json.dumps(columnar, separators=(",", ":")),
     )
@@ -1939,8 +1486,6 @@ def _pricing_windowed_series(network, points):
     # Each point is the avg/median over the trailing 24h of ProviderWithTask
     # rows — the same statistic as the daily PricingSnapshot, evaluated
     # rolling. Task density (~20/h) is too sparse for per-bucket stats.
-    from bisect import bisect_left, bisect_right
-
     earliest = min(points) - timedelta(days=1)
     rows = list(
         ProviderWithTask.objects.filter(
@@ -1948,23 +1493,12 @@ def _pricing_windowed_series(network, points):
         .order_by("created_at")
         .values_list("created_at", "cpu_per_hour", "env_per_hour", "start_price")
     )
-    times = [row[0] for row in rows]
-    series = []
-    for point in points:
-        window = rows[
-            bisect_left(times, point - timedelta(days=1)): bisect_right(times, point)
-        ]
-        entry = {"date": point.timestamp()}
-        for key, values in (
-            ("cpu", [row[1] for row in window if row[1] is not None]),
-            ("env", [row[2] for row in window if row[2] is not None]),
-            ("start", [row[3] for row in window if row[3] is not None]),
-        ):
-            entry[f"average_{key}"] = sum(values) / \
-                len(values) if values else 0
-            entry[f"median_{key}"] = float(median(values)) if values else 0
-        series.append(entry)
-    return series
+    # Points are ascending, which lets the window slide over rows once.
+    series = windowed_series(
+        rows, points, timedelta(days=1), ("cpu", "env", "start"))
+    return [
+        {"date": point.timestamp(), **entry} for point, entry in zip(points, series)
+    ]
 
 
 @app.task
@@ -1996,22 +1530,11 @@ def pricing_combined_5min():
         }
         for network in ["mainnet", "testnet"]
     }
-    r.set("pricing_data_combined", json.dumps(combined))
+    store_json_payload(r, "pricing_data_combined", json.dumps(combined))
 
 
 def _prometheus_query_range(query, start, end, step):
-    url = (
-        f"{os.environ.get('STATS_URL')}"
-        "api/datasources/uid/dec5owmc8gt8ge/resources/api/v1/query_range"
-    )
-    headers = {
-        "Authorization": f"Bearer {os.environ.get('GRAFANA_SERVICE_TOKEN')}"}
-    response = requests.post(
-        url,
-        headers=headers,
-        data={"query": query, "start": start, "end": end, "step": step},
-    )
-    payload = response.json()
+    payload, _ = prometheus.query_range(query, start, end, step)
     if payload.get("status") != "success":
         return []
     return payload["data"]["result"]
@@ -2085,7 +1608,7 @@ def network_versions_combined_5min():
         "24h": _fill_versions(day_points, versions),
         "7d": _fill_versions(hourly, versions),
     }
-    r.set("network_versions_combined", json.dumps(combined))
+    store_json_payload(r, "network_versions_combined", json.dumps(combined))
 
 
 @app.task
@@ -2191,42 +1714,90 @@ def extract_wallets_and_ids():
 
 @app.task
 def bulk_update_node_statuses(nodes_data):
-    status_history_to_create = []
-    nodes_to_update = []
+    # Set-based: one locking read for the whole batch instead of a
+    # SELECT ... FOR UPDATE per node, so the number of queries does not grow
+    # with the batch. Later entries for the same node win.
+    statuses = dict(nodes_data)
+    if not statuses:
+        return
 
     with transaction.atomic():
-        for node_id, is_online in nodes_data:
-            try:
-                node = Node.objects.select_for_update().get(node_id=node_id)
-                # Only do something if the status actually changed
-                if node.online != is_online:
-                    node.online = is_online
-                    nodes_to_update.append(node)
-                    status_history_to_create.append(
-                        NodeStatusHistory(node_id=node_id, is_online=is_online)
-                    )
-            except ObjectDoesNotExist:
-                # New node, so presumably its status changed from "unknown" to is_online
-                node = Node(node_id=node_id, online=is_online,
-                            type="requestor")
-                nodes_to_update.append(node)
-                status_history_to_create.append(
-                    NodeStatusHistory(node_id=node_id, is_online=is_online)
-                )
+        # Locked in node_id order, so overlapping batches queue up behind each
+        # other instead of deadlocking.
+        current = dict(
+            Node.objects.select_for_update()
+            .filter(node_id__in=statuses)
+            .order_by("node_id")
+            .values_list("node_id", "online")
+        )
+        # New nodes, so presumably their status changed from "unknown".
+        new_nodes = sorted(node_id for node_id in statuses if node_id not in current)
 
-        # Bulk create new nodes (only those _state.adding == True)
         Node.objects.bulk_create(
-            [n for n in nodes_to_update if n._state.adding],
-            ignore_conflicts=True
-        )
-        # Bulk update existing nodes
-        Node.objects.bulk_update(
-            [n for n in nodes_to_update if not n._state.adding],
-            ['online']
+            [
+                Node(node_id=node_id, online=statuses[node_id], type="requestor")
+                for node_id in new_nodes
+            ],
+            ignore_conflicts=True,
         )
-
-        # Bulk create status history ONLY for changed/new statuses
+        if new_nodes:
+            # A concurrent batch may have created some of them first; the
+            # inserts above waited for it to commit and skipped them. It also
+            # recorded their first status and started their uptime ledger,
+            # so they are existing nodes here, not new ones.
+            created_elsewhere = NodeUptime.objects.filter(node_id__in=new_nodes)
+            current.update(
+                Node.objects.select_for_update()
+                .filter(node_id__in=created_elsewhere.values("node_id"))
+                .order_by("node_id")
+                .values_list("node_id", "online")
+            )
+        changed = [
+            node_id for node_id, is_online in statuses.items()
+            if node_id not in current or current[node_id] != is_online
+        ]
+        # By node_id, so a new node that a concurrent batch created first still
+        # ends up with this batch's state.
+        for is_online in (True, False):
+            Node.objects.filter(
+                node_id__in=[node_id for node_id in changed if statuses[node_id] == is_online]
+            ).update(online=is_online)
+
+        # Status history ONLY for changed/new statuses
+        status_history_to_create = [
+            NodeStatusHistory(node_id=node_id, is_online=statuses[node_id])
+            for node_id in changed
+        ]
         NodeStatusHistory.objects.bulk_create(status_history_to_create)
+        _advance_uptime_ledgers(status_history_to_create)
+
+
+def _advance_uptime_ledgers(transitions):
+    # Moves each node's NodeUptime forward by the transitions just written to
+    # NodeStatusHistory, using their stored timestamps so the ledger and the
+    # history stay in agreement. Runs inside the caller's transaction.
+    if not transitions:
+        return
+    ledgers = NodeUptime.objects.select_for_update().in_bulk(
+        {status.node_id for status in transitions}, field_name="node_id"
+    )
+    new_ledgers = {}
+    for status in transitions:
+        ledger = ledgers.get(status.node_id) or new_ledgers.get(status.node_id)
+        if ledger is None:
+            new_ledgers[status.node_id] = NodeUptime(
+                node_id=status.node_id,
+                first_seen_at=status.timestamp,
+                is_online=status.is_online,
+                last_transition_at=status.timestamp,
+            )
+            continue
+        ledger.record_transition(status.is_online, status.timestamp)
+
+    NodeUptime.objects.bulk_create(new_ledgers.values(), ignore_conflicts=True)
+    NodeUptime.objects.bulk_update(
+        ledgers.values(), ["online_seconds", "is_online", "last_transition_at"]
+    )
 
 
 PORTAL_REPUTATION_REDIS_PREFIX = "portal_reputation_v1:"
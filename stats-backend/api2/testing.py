@@ -0,0 +1,73 @@
+"""
+Helpers shared by the api2 tests and benchmarks.
+"""
+
+from bisect import bisect_left, bisect_right
+from unittest.mock import patch
+
+import fakeredis
+from numpy import median
+
+
+def isolate_scanner_state(testcase):
+    """Give the scanner a private redis and drop its process-local caches."""
+    for target, value in (
+        ("api2.ec2_index.r", fakeredis.FakeRedis()),
+        ("api2.ec2_index._index", None),
+        ("api2.scanner.r", fakeredis.FakeRedis()),
+        ("api2.golem_senders.r", fakeredis.FakeRedis()),
+        ("api2.golem_senders._cache", None),
+    ):
+        patcher = patch(target, value)
+        patcher.start()
+        testcase.addCleanup(patcher.stop)
+
+
+def synthetic_proposals(count, runtimes=("vm", "wasmtime")):
+    """Scan-shaped proposals: one per (provider, runtime), as the market sends."""
+    proposals = []
+    for i in range(count):
+        runtime = runtimes[i % len(runtimes)]
+        proposals.append(
+            {
+                "golem.runtime.name": runtime,
+                "golem.inf.cpu.threads": 2 ** (i % 6),
+                "golem.inf.mem.gib": float(4 * (1 + i % 16)),
+                "golem.inf.storage.gib": 100.0 + i % 50,
+                "golem.inf.cpu.brand": "AMD Ryzen 9 5950X 16-Core Processor",
+                "golem.inf.cpu.vendor": "AuthenticAMD",
+                "golem.inf.cpu.architecture": "x86_64",
+                "golem.com.usage.vector": [
+                    "golem.usage.cpu_sec",
+                    "golem.usage.duration_sec",
+                ],
+                "golem.com.pricing.model.linear.coeffs": [
+                    0.00001 * (1 + i % 7),
+                    0.000002 * (1 + i % 5),
+                    0.0,
+                ],
+                "golem.com.payment.platform.erc20-polygon-glm.address": f"0x{i:040x}",
+                "golem.node.id.name": f"provider-{i}",
+                "node_id": f"0x{i // len(runtimes):040x}",
+                "wallet": f"0x{i // len(runtimes):040x}",
+                "network": "mainnet",
+            }
+        )
+    return proposals
+
+
+def reference_windowed_series(rows, points, window):
+    """Every window sliced and summarized from scratch, for comparison."""
+    times = [row[0] for row in rows]
+    series = []
+    for point in points:
+        selected = rows[
+            bisect_left(times, point - window): bisect_right(times, point)
+        ]
+        entry = {}
+        for i, key in enumerate(("cpu", "env", "start"), start=1):
+            values = [row[i] for row in selected if row[i] is not None]
+            entry[f"average_{key}"] = sum(values) / len(values) if values else 0
+            entry[f"median_{key}"] = float(median(values)) if values else 0
+        series.append(entry)
+    return series
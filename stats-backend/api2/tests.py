@@ -1,81 +1,285 @@
 import gzip
 import json
 from datetime import timedelta
-from unittest.mock import AsyncMock, patch
+from unittest.mock import patch
 
-from django.test import TestCase
+import fakeredis
+import fakeredis.aioredis
+from django.test import TestCase, TransactionTestCase, skipUnlessDBFeature
 from django.utils import timezone
 
+from api2.testing import isolate_scanner_state, reference_windowed_series, synthetic_proposals
 from collector.models import NetworkStats
+from core.testing import FakeHTTPServer
+
+
+def fake_payload_cache(testcase):
+    """Serve the views from a fake redis; returns a sync client for producers."""
+    server = fakeredis.FakeServer()
+    patcher = patch(
+        "core.cached_json.get_async_redis",
+        return_value=fakeredis.aioredis.FakeRedis(server=server),
+    )
+    patcher.start()
+    testcase.addCleanup(patcher.stop)
+    return fakeredis.FakeRedis(server=server)
 
 
 class CompressedRedisEndpointTestsMixin:
     """Shared cases for endpoints serving compact redis JSON with gzip."""
 
     url = None
+    key = None
     payload = None
 
-    def _mock_aioredis(self, aioredis_mock, content):
-        aioredis_mock.Redis.return_value.get = AsyncMock(return_value=content)
+    def setUp(self):
+        self.cache = fake_payload_cache(self)
 
-    @patch("api2.views.aioredis")
-    def test_serves_gzip_when_accepted(self, aioredis_mock):
-        self._mock_aioredis(aioredis_mock, self.payload)
-        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING="gzip")
+    def _store(self):
+        from core.cached_json import store_json_payload
+
+        store_json_payload(self.cache, self.key, self.payload)
+
+    def test_serves_stored_gzip_when_accepted(self):
+        self._store()
+        with patch("core.cached_json.gzip.compress", side_effect=AssertionError):
+            response = self.client.get(self.url, HTTP_ACCEPT_ENCODING="gzip, deflate")
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertIn("Accept-Encoding", response["Vary"])
+        self.assertEqual(response.content, self.cache.get(f"{self.key}:gzip"))
         self.assertEqual(
             json.loads(gzip.decompress(response.content)), json.loads(self.payload)
         )
 
-    @patch("api2.views.aioredis")
-    def test_serves_plain_json_without_gzip(self, aioredis_mock):
-        self._mock_aioredis(aioredis_mock, self.payload)
-        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING="identity")
+    def test_serves_plain_json_without_gzip(self):
+        self._store()
+        for accept in ("identity", "gzip;q=0, identity"):
+            response = self.client.get(self.url, HTTP_ACCEPT_ENCODING=accept)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn("Content-Encoding", response)
+            self.assertEqual(response.content, self.payload.encode())
+
+    def test_prefers_brotli_when_stored(self):
+        self._store()
+        self.cache.set(f"{self.key}:br", b"brotli bytes")
+        self.cache.hset(f"{self.key}:meta", "encodings", "br,gzip")
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING="gzip, br")
+        self.assertEqual(response["Content-Encoding"], "br")
+        self.assertEqual(response.content, b"brotli bytes")
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+
+    def test_keys_without_variants_are_served_plain(self):
+        self.cache.set(self.key, self.payload)
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING="gzip")
         self.assertEqual(response.status_code, 200)
         self.assertNotIn("Content-Encoding", response)
-        self.assertEqual(json.loads(response.content), json.loads(self.payload))
+        self.assertEqual(response.content, self.payload.encode())
 
-    @patch("api2.views.aioredis")
-    def test_503_when_key_missing(self, aioredis_mock):
-        self._mock_aioredis(aioredis_mock, None)
+    def test_503_when_key_missing(self):
         response = self.client.get(self.url)
         self.assertEqual(response.status_code, 503)
 
 
+class StoreJsonPayloadTests(TestCase):
+    def test_variants_follow_the_payload(self):
+        import hashlib
+
+        from core.cached_json import store_json_payload
+
+        cache = fakeredis.FakeRedis()
+        large = json.dumps({"nodes": [{"id": n, "online": True} for n in range(100)]})
+        store_json_payload(cache, "v2_online", large)
+        self.assertEqual(cache.get("v2_online"), large.encode())
+        self.assertEqual(gzip.decompress(cache.get("v2_online:gzip")), large.encode())
+        self.assertEqual(
+            cache.hget("v2_online:meta", "sha256").decode(),
+            hashlib.sha256(large.encode()).hexdigest(),
+        )
+
+        # Too small to be worth compressing: the old variant goes away.
+        store_json_payload(cache, "v2_online", "[]")
+        self.assertIsNone(cache.get("v2_online:gzip"))
+        self.assertEqual(cache.hget("v2_online:meta", "encodings"), b"")
+
+
 class NetworkHistoricalStatsCompressedTests(
     CompressedRedisEndpointTestsMixin, TestCase
 ):
     url = "/v2/network/historical/stats/compressed"
+    key = "network_historical_stats_v2_columnar"
     payload = json.dumps(
-        {"vm": {"1d": {"date": [1.0], "online": [5]}}}, separators=(",", ":")
+        {"vm": {"1d": {"date": [float(i) for i in range(200)], "online": [5] * 200}}},
+        separators=(",", ":"),
     )
 
 
 class Ec2ComparisonCompressedTests(CompressedRedisEndpointTestsMixin, TestCase):
     url = "/v2/network/comparison/compressed"
+    key = "ec2_comparison_columnar"
     payload = json.dumps(
-        {"ec2_instance_name": ["t3.micro"], "ec2_vcpu": [2]}, separators=(",", ":")
+        {"ec2_instance_name": ["t3.micro"] * 100, "ec2_vcpu": [2] * 100},
+        separators=(",", ":"),
     )
 
 
+class CachedJsonPassthroughTests(TestCase):
+    stored = b'{"nodes":[{"node_id":"0xabc","online":true,"price":0.1}],"count":1}'
+
+    def setUp(self):
+        self.cache = fake_payload_cache(self)
+        self.cache.set("v2_online", self.stored)
+
+    def test_stored_bytes_are_served_as_they_are(self):
+        response = self.client.get("/v2/network/online")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "application/json")
+        self.assertEqual(response.content, self.stored)
+
+    def test_pretty_opt_in(self):
+        response = self.client.get("/v2/network/online?pretty=1")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.content.decode(), json.dumps(json.loads(self.stored), indent=4)
+        )
+
+    def test_cache_miss_statuses_are_unchanged(self):
+        self.assertEqual(self.client.get("/v2/network/offers/cheapest").status_code, 500)
+        response = self.client.get("/v2/network/pricing/historical")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content), {})
+
+
+class ConditionalCachedJsonTests(TestCase):
+    url = "/v2/network/online"
+
+    def setUp(self):
+        self.cache = fake_payload_cache(self)
+        self._produce({"nodes": [{"id": n} for n in range(300)]}, at=1000.0)
+
+    def _produce(self, payload, at):
+        from core.cached_json import store_json_payload
+
+        with patch("core.cached_json.time.time", return_value=at):
+            store_json_payload(self.cache, "v2_online", json.dumps(payload), max_age=20)
+
+    def _get(self, at=1005.0, **headers):
+        with patch("core.cached_json.time.time", return_value=at):
+            return self.client.get(self.url, **headers)
+
+    def test_validators_and_freshness(self):
+        response = self._get(at=1005.0)
+        self.assertEqual(response.status_code, 200)
+        digest = self.cache.hget("v2_online:meta", "sha256").decode()
+        self.assertEqual(response["ETag"], f'W/"{digest}"')
+        self.assertEqual(response["Last-Modified"], "Thu, 01 Jan 1970 00:16:40 GMT")
+        self.assertEqual(response["Cache-Control"], "max-age=15")
+        # A producer that is late leaves nothing to cache.
+        self.assertEqual(self._get(at=1100.0)["Cache-Control"], "max-age=0")
+
+    def test_unchanged_payload_is_not_sent_again(self):
+        etag = self._get()["ETag"]
+        for headers in (
+            {"HTTP_IF_NONE_MATCH": etag},
+            {"HTTP_IF_NONE_MATCH": f'"other", {etag}', "HTTP_ACCEPT_ENCODING": "gzip"},
+            {"HTTP_IF_NONE_MATCH": etag.removeprefix("W/")},
+            {"HTTP_IF_MODIFIED_SINCE": "Thu, 01 Jan 1970 00:16:40 GMT"},
+        ):
+            with patch.object(
+                fakeredis.aioredis.FakeRedis, "get", side_effect=AssertionError
+            ):
+                response = self._get(**headers)
+            self.assertEqual(response.status_code, 304, headers)
+            self.assertEqual(response.content, b"")
+            self.assertEqual(response["ETag"], etag)
+
+    def test_changed_payload_is_sent(self):
+        etag = self._get()["ETag"]
+        self.assertEqual(self._get(HTTP_IF_NONE_MATCH='"other"').status_code, 200)
+        self.assertEqual(
+            self._get(HTTP_IF_MODIFIED_SINCE="Thu, 01 Jan 1970 00:16:39 GMT").status_code,
+            200,
+        )
+
+        self._produce({"nodes": []}, at=1020.0)
+        response = self._get(at=1021.0, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertEqual(json.loads(response.content), {"nodes": []})
+
+
+class SharedAsyncRedisClientTests(TestCase):
+    def setUp(self):
+        patcher = patch("core.async_redis._clients", {})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_one_bounded_client_per_event_loop(self):
+        import asyncio
+
+        from redis.asyncio import BlockingConnectionPool
+
+        from core.async_redis import _clients, get_async_redis
+
+        async def twice():
+            return get_async_redis(), get_async_redis()
+
+        with self.settings(ASYNC_REDIS_MAX_CONNECTIONS=7):
+            first, again = asyncio.run(twice())
+            self.assertIs(first, again)
+            self.assertIsInstance(first.connection_pool, BlockingConnectionPool)
+            self.assertEqual(first.connection_pool.max_connections, 7)
+
+            second, _ = asyncio.run(twice())
+        self.assertIsNot(first, second)
+        # The first loop is closed by now, and its client was dropped.
+        self.assertEqual(list(_clients.values()), [second])
+
+    def test_views_share_the_loop_client(self):
+        import asyncio
+
+        from django.test import RequestFactory
+
+        from api2.views import online_stats
+        from api.views import network_versions
+
+        client = fakeredis.aioredis.FakeRedis(decode_responses=True)
+        factory = RequestFactory()
+
+        async def serve():
+            await client.set("v2_network_online_stats", '{"online": 3}')
+            await client.set("network_versions", '[{"version": "0.15.2"}]')
+            return [
+                await online_stats(factory.get("/v2/network/online/stats")),
+                await network_versions(factory.get("/v1/network/versions")),
+                await online_stats(factory.get("/v2/network/online/stats")),
+            ]
+
+        with patch("core.async_redis._new_client", return_value=client) as new_client:
+            responses = asyncio.run(serve())
+        new_client.assert_called_once_with()
+        self.assertEqual([json.loads(r.content) for r in responses], [
+            {"online": 3}, [{"version": "0.15.2"}], {"online": 3}
+        ])
+
+
 class NetworkHistoricalStatsColumnarTaskTests(TestCase):
-    @patch("api2.tasks.r")
+    @patch("api2.tasks.r", new_callable=fakeredis.FakeRedis)
     def test_writes_columnar_copy_matching_row_format(self, redis_mock):
         from api2.tasks import network_historical_stats_to_redis_v2
+        from collector.rollups import refresh_network_stats_rollups
 
         NetworkStats.objects.create(
             online=3, cores=24, memory=64 * 1024, disk=512 * 1024, runtime="vm", gpus=1
         )
+        refresh_network_stats_rollups()
         network_historical_stats_to_redis_v2()
 
-        stored = {
-            call.args[0]: json.loads(call.args[1])
-            for call in redis_mock.set.call_args_list
-        }
-        rows = stored["network_historical_stats_v2"]
-        columnar = stored["network_historical_stats_v2_columnar"]
+        rows = json.loads(redis_mock.get("network_historical_stats_v2"))
+        columnar = json.loads(redis_mock.get("network_historical_stats_v2_columnar"))
 
+        self.assertEqual(set(rows.keys()), {"vm"})
         self.assertEqual(set(rows.keys()), set(columnar.keys()))
         for runtime, intervals in rows.items():
             for key, row_list in intervals.items():
@@ -105,6 +309,7 @@ class OfferFreshnessTests(TestCase):
     def setUp(self):
         from api2.models import GLM, Node, Offer
 
+        isolate_scanner_state(self)
         GLM.objects.create(id=1, current_price=0.1)
         self.node = Node.objects.create(node_id="0xabc", type="provider")
         self.offer = Offer.objects.create(
@@ -195,6 +400,30 @@ class OfferFreshnessTests(TestCase):
         self.assertEqual(self.offer.properties["golem.inf.cpu.threads"], 16)
         self.assertGreater(self.offer.updated_at, before)
 
+    def test_scan_records_content_hash_and_skips_normalizing_unchanged_offers(self):
+        from api2.scanner import (
+            normalize_properties,
+            offer_content_hash,
+            update_providers_info,
+        )
+
+        # The first scan backfills the hash without treating it as a change.
+        update_providers_info(self._scan_payload())
+        self.offer.refresh_from_db()
+        self.assertEqual(
+            self.offer.content_hash, offer_content_hash(self.VM_PROPERTIES)
+        )
+        updated_at = self.offer.updated_at
+
+        with patch(
+            "api2.scanner.normalize_properties", wraps=normalize_properties
+        ) as normalize:
+            update_providers_info(self._scan_payload())
+        # Only hashing the incoming proposal; no comparison against storage.
+        self.assertEqual(normalize.call_count, 1)
+        self.offer.refresh_from_db()
+        self.assertEqual(self.offer.updated_at, updated_at)
+
 
 class OfferVariantSelectionTests(TestCase):
     """A scan carrying old+new versions of the same offer must pick the newer,
@@ -203,6 +432,7 @@ class OfferVariantSelectionTests(TestCase):
     def setUp(self):
         from api2.models import GLM, Node
 
+        isolate_scanner_state(self)
         GLM.objects.create(id=1, current_price=0.1)
         self.node = Node.objects.create(node_id="0xabc", type="provider")
 
@@ -320,3 +550,1467 @@ class OfferVariantSelectionTests(TestCase):
         # But the offer still counts as observed by that scan.
         self.assertGreaterEqual(offer.last_seen_at, seen_before)
         self.assertTrue(offer.is_fresh)
+
+
+class NodeUptimeLedgerTests(TestCase):
+    """The incremental ledger must give the same answer as replaying the
+    node's full status history."""
+
+    def setUp(self):
+        from api2.models import Node
+
+        Node.objects.create(node_id="0xabc", type="provider")
+        self.start = timezone.now() - timedelta(days=10)
+
+    def _record(self, at, *statuses):
+        from api2.tasks import bulk_update_node_statuses
+
+        with patch("django.utils.timezone.now", return_value=at):
+            bulk_update_node_statuses(list(statuses))
+
+    def _replayed_percentage(self, node_id, now):
+        from api2.models import NodeStatusHistory
+
+        statuses = NodeStatusHistory.objects.filter(node_id=node_id).order_by(
+            "timestamp"
+        )
+        online = timedelta(0)
+        last_online_time = None
+        for status in statuses:
+            if status.is_online:
+                last_online_time = status.timestamp
+            elif last_online_time:
+                online += status.timestamp - last_online_time
+                last_online_time = None
+        if last_online_time is not None:
+            online += now - last_online_time
+        total = now - statuses.first().timestamp
+        return online.total_seconds() / total.total_seconds() * 100
+
+    def test_ledger_matches_history_replay(self):
+        from api2.models import NodeUptime
+
+        self._record(self.start, ("0xabc", True), ("0xnew", True))
+        self._record(self.start + timedelta(days=2), ("0xabc", False))
+        self._record(self.start + timedelta(days=3), ("0xabc", True), ("0xnew", False))
+        # Repeating the current state is not a transition.
+        self._record(self.start + timedelta(days=4), ("0xabc", True))
+        self._record(self.start + timedelta(days=7), ("0xabc", False), ("0xnew", True))
+
+        now = self.start + timedelta(days=9, hours=6)
+        for node_id in ("0xabc", "0xnew"):
+            ledger = NodeUptime.objects.get(node_id=node_id)
+            self.assertAlmostEqual(
+                ledger.uptime_percentage(now),
+                self._replayed_percentage(node_id, now),
+            )
+
+    def test_unknown_node_has_zero_uptime(self):
+        from api2.scoring import calculate_uptime_percentage
+
+        self.assertEqual(calculate_uptime_percentage("0xabc"), 0)
+
+
+class BulkNodeStatusTests(TestCase):
+    def _batch(self, count, offset=0):
+        # A third each of new, changed and unchanged nodes.
+        from api2.models import Node
+
+        statuses = []
+        for i in range(offset, offset + count):
+            node_id = f"0x{i:040x}"
+            if i % 3:
+                Node.objects.create(node_id=node_id, online=i % 3 == 1)
+            statuses.append((node_id, True))
+        return statuses
+
+    def test_query_count_does_not_grow_with_batch_size(self):
+        from api2.tasks import bulk_update_node_statuses
+
+        small, large = self._batch(3), self._batch(30, offset=3)
+        with self.assertNumQueries(9) as small_queries:
+            bulk_update_node_statuses(small)
+        with self.assertNumQueries(len(small_queries)):
+            bulk_update_node_statuses(large)
+
+    def test_only_transitions_are_recorded(self):
+        from api2.models import Node, NodeStatusHistory
+        from api2.tasks import bulk_update_node_statuses
+
+        statuses = self._batch(6)
+        # Later entries for the same node win.
+        bulk_update_node_statuses([(statuses[0][0], False)] + statuses)
+
+        self.assertEqual(
+            set(Node.objects.filter(online=True).values_list("node_id", flat=True)),
+            {node_id for node_id, _ in statuses},
+        )
+        self.assertEqual(
+            Node.objects.get(node_id=statuses[0][0]).type, "requestor"
+        )
+        # Nodes 0 and 3 are new, 2 and 5 came online, 1 and 4 already were.
+        self.assertEqual(
+            sorted(NodeStatusHistory.objects.values_list("node_id", "is_online")),
+            [(statuses[i][0], True) for i in (0, 2, 3, 5)],
+        )
+
+    def test_overlapping_batches_in_turn(self):
+        from api2.models import Node, NodeStatusHistory
+        from api2.tasks import bulk_update_node_statuses
+
+        bulk_update_node_statuses([("0xa", True), ("0xb", True)])
+        bulk_update_node_statuses([("0xb", False), ("0xc", False)])
+
+        self.assertEqual(
+            dict(Node.objects.values_list("node_id", "online")),
+            {"0xa": True, "0xb": False, "0xc": False},
+        )
+        self.assertEqual(
+            list(
+                NodeStatusHistory.objects.filter(node_id="0xb")
+                .order_by("id")
+                .values_list("is_online", flat=True)
+            ),
+            [True, False],
+        )
+
+
+class BulkNodeStatusConcurrencyTests(TransactionTestCase):
+    def _update(self, batch):
+        import time
+
+        from django.db import OperationalError
+
+        from api2.tasks import bulk_update_node_statuses
+
+        for attempt in range(100):
+            try:
+                return bulk_update_node_statuses.run(batch)
+            except OperationalError as e:
+                # SQLite locks whole tables rather than rows, so a batch that
+                # collides rolls back and runs again, as a retried task would.
+                if "locked" not in str(e):
+                    raise
+                time.sleep(0.01)
+
+    def test_overlapping_batches_run_concurrently(self):
+        import threading
+
+        from django.db import connection
+
+        from api2.models import Node, NodeStatusHistory, NodeUptime
+
+        node_ids = [f"0x{i:040x}" for i in range(200)]
+        for node_id in node_ids[:100]:
+            Node.objects.create(node_id=node_id, online=False)
+        # The same nodes in opposite orders, half of them still unknown, and
+        # unknown nodes that two batches report in the same state.
+        batches = [
+            [(node_id, True) for node_id in node_ids],
+            [(node_id, False) for node_id in reversed(node_ids[50:150])],
+            [(node_id, True) for node_id in reversed(node_ids[150:])],
+        ]
+        barrier = threading.Barrier(len(batches))
+        errors = []
+
+        def run(batch):
+            try:
+                barrier.wait()
+                self._update(batch)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=run, args=(batch,)) for batch in batches]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        # Whichever batch went last, every node's state is its last transition.
+        online = dict(Node.objects.values_list("node_id", "online"))
+        ledgers = dict(NodeUptime.objects.values_list("node_id", "is_online"))
+        for node_id in node_ids:
+            last = (
+                NodeStatusHistory.objects.filter(node_id=node_id)
+                .order_by("-id")
+                .values_list("is_online", flat=True)
+                .first()
+            )
+            self.assertEqual(online[node_id], last, node_id)
+            self.assertEqual(ledgers[node_id], last, node_id)
+        # Reported twice as online, but recorded once.
+        for node_id in node_ids[150:]:
+            self.assertEqual(NodeStatusHistory.objects.filter(node_id=node_id).count(), 1)
+
+
+@skipUnlessDBFeature("has_select_for_update")
+class BulkNodeStatusRowLockTests(BulkNodeStatusConcurrencyTests):
+    """The same batches without retries, really interleaving on row locks and
+    on the unique index of the nodes they create."""
+
+    def _update(self, batch):
+        from api2.tasks import bulk_update_node_statuses
+
+        bulk_update_node_statuses.run(batch)
+
+
+class NodeListSerializerTests(TestCase):
+    """Serializing the online list must not cost queries per node."""
+
+    def setUp(self):
+        from api2.models import EC2Instance
+
+        self.ec2 = EC2Instance.objects.create(
+            name="t3.large", vcpu=2, memory=8.0, price_usd="0.08"
+        )
+        self.now = timezone.now()
+
+    def _make_nodes(self, count, offset=0):
+        from api2.models import Node, NodeUptime, Offer
+
+        for i in range(offset, offset + count):
+            node = Node.objects.create(node_id=f"0x{i:040x}", online=True)
+            for runtime in ("vm", "wasmtime"):
+                Offer.objects.create(
+                    provider=node,
+                    runtime=runtime,
+                    properties={"golem.runtime.name": runtime},
+                    last_seen_at=self.now,
+                    is_overpriced=True,
+                    overpriced_compared_to=self.ec2,
+                    cheaper_than=self.ec2,
+                )
+            if i % 2 == 0:
+                NodeUptime.objects.create(
+                    node_id=node.node_id,
+                    first_seen_at=self.now - timedelta(days=2),
+                    online_seconds=3600.0,
+                    is_online=True,
+                    last_transition_at=self.now - timedelta(hours=5),
+                )
+
+    def _serialize_online(self):
+        from api2.models import Node
+        from api2.serializers import NodeSerializer
+
+        return NodeSerializer(
+            Node.objects.filter(online=True).order_by("node_id"), many=True
+        ).data
+
+    def test_query_count_does_not_grow_with_node_count(self):
+        self._make_nodes(1)
+        with self.assertNumQueries(3):
+            self._serialize_online()
+
+        self._make_nodes(9, offset=1)
+        with self.assertNumQueries(3):
+            data = self._serialize_online()
+        self.assertEqual(len(data), 10)
+
+    def test_output_matches_per_node_serialization(self):
+        from api2.models import Node
+        from api2.serializers import NodeSerializer
+
+        self._make_nodes(4)
+        with patch("django.utils.timezone.now", return_value=self.now):
+            batched = json.dumps(self._serialize_online(), default=str)
+            single = json.dumps(
+                [
+                    NodeSerializer(node).data
+                    for node in Node.objects.filter(online=True).order_by("node_id")
+                ],
+                default=str,
+            )
+        self.assertEqual(batched, single)
+
+
+class EC2InstanceIndexTests(TestCase):
+    """The in-memory index must pick the same instance the ORM query did."""
+
+    def setUp(self):
+        isolate_scanner_state(self)
+
+    def _orm_nearest(self, vcpu, memory):
+        from django.db.models import F
+        from django.db.models.functions import Abs
+
+        from api2.models import EC2Instance
+
+        return (
+            EC2Instance.objects.annotate(
+                cpu_diff=Abs(F("vcpu") - vcpu),
+                memory_diff=Abs(F("memory") - memory),
+            )
+            .order_by("cpu_diff", "memory_diff", "price_usd", "id")
+            .first()
+        )
+
+    def test_matches_orm_ordering(self):
+        from api2.ec2_index import get_ec2_index
+        from api2.models import EC2Instance
+
+        specs = [
+            (2, 4.0, "0.05"), (2, 8.0, "0.09"), (2, 8.0, "0.08"),
+            (4, 8.0, "0.17"), (4, 16.0, "0.20"), (8, 16.0, "0.34"),
+            (8, 32.0, "0.40"), (16, 64.0, "0.77"), (16, 32.0, "0.68"),
+            (64, 256.0, "2.50"),
+        ]
+        for n, (vcpu, memory, price) in enumerate(specs):
+            EC2Instance.objects.create(
+                name=f"i{n}", vcpu=vcpu, memory=memory, price_usd=price
+            )
+
+        index = get_ec2_index()
+        for vcpu in (0, 1, 2, 3, 4, 6, 7, 12, 20, 40, 128):
+            for memory in (0.0, 2.0, 6.0, 8.0, 12.0, 24.0, 48.0, 512.0):
+                self.assertEqual(
+                    index.nearest(vcpu, memory).name,
+                    self._orm_nearest(vcpu, memory).name,
+                    (vcpu, memory),
+                )
+
+    def test_rebuilds_after_the_table_changes(self):
+        from api2.ec2_index import get_ec2_index
+        from api2.models import EC2Instance
+        from api2.utils import store_ec2_instance_data
+
+        EC2Instance.objects.create(name="small", vcpu=2, memory=4.0, price_usd="0.05")
+        index = get_ec2_index()
+        self.assertIs(get_ec2_index(), index)
+        self.assertEqual(index.nearest(8, 32.0).name, "small")
+
+        store_ec2_instance_data(
+            {"prices": [{"amount": 0.4}]}, "p", "c", "large", {"vcpu": 8, "memory": 32}
+        )
+        rebuilt = get_ec2_index()
+        self.assertIsNot(rebuilt, index)
+        self.assertEqual(rebuilt.nearest(8, 32.0).name, "large")
+
+
+class OfferScanInsertTests(TestCase):
+    """New providers and offers are inserted in bulk, not one by one."""
+
+    def setUp(self):
+        from api2.ec2_index import get_ec2_index
+        from api2.models import GLM
+
+        isolate_scanner_state(self)
+        GLM.objects.create(id=1, current_price=0.1)
+        # Built by the first scan otherwise, which would count its query.
+        get_ec2_index()
+
+    def _scan_new_providers(self, count, offset):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        from api2.scanner import update_providers_info
+
+        proposals = synthetic_proposals(count * 2 + offset * 2)[offset * 2:]
+        with CaptureQueriesContext(connection) as queries:
+            update_providers_info([json.dumps(p) for p in proposals])
+        return len(queries.captured_queries)
+
+    def test_query_count_does_not_grow_with_new_providers(self):
+        from api2.models import Node, Offer
+
+        few = self._scan_new_providers(2, offset=0)
+        many = self._scan_new_providers(20, offset=2)
+        self.assertEqual(few, many)
+        self.assertEqual(Node.objects.count(), 22)
+        self.assertEqual(Offer.objects.count(), 44)
+        self.assertFalse(Offer.objects.filter(last_seen_at=None).exists())
+
+
+class OfferChunkerTests(TestCase):
+    """A scan streams its proposals to ingestion in bounded chunks."""
+
+    def setUp(self):
+        self.now = 0.0
+        patcher = patch("api2.scanner.update_providers_info")
+        self.task = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _chunker(self, **kwargs):
+        from api2.scanner import OfferChunker
+
+        return OfferChunker(clock=lambda: self.now, **kwargs)
+
+    def _sent(self):
+        from api2.offer_codec import decode_offer_batch
+
+        return [
+            (
+                [p["n"] for p in decode_offer_batch(call.args[0])],
+                call.kwargs["scan_complete"],
+            )
+            for call in self.task.delay.call_args_list
+        ]
+
+    def test_flushes_by_count_and_marks_the_last_chunk(self):
+        chunker = self._chunker(max_size=2, max_age=60)
+        for n in range(5):
+            chunker.add({"n": n})
+        chunker.complete()
+        self.assertEqual(
+            self._sent(), [([0, 1], False), ([2, 3], False), ([4], True)]
+        )
+
+    def test_flushes_by_age(self):
+        chunker = self._chunker(max_size=100, max_age=10)
+        chunker.add({"n": 0})
+        self.now = 4.0
+        chunker.add({"n": 1})
+        self.now = 10.0
+        chunker.add({"n": 2})
+        chunker.complete()
+        self.assertEqual(self._sent(), [([0, 1, 2], False), ([], True)])
+
+
+class OfferScanCompletionTests(TestCase):
+    """Per-scan bookkeeping waits for the scan-complete marker."""
+
+    def setUp(self):
+        from api2.models import GLM, Node, OfferVariantSighting
+
+        isolate_scanner_state(self)
+        GLM.objects.create(id=1, current_price=0.1)
+        Node.objects.create(node_id="0xabc", type="provider")
+        long_ago = timezone.now() - timedelta(days=2)
+        OfferVariantSighting.objects.create(
+            provider_node_id="0xgone",
+            runtime="vm",
+            content_hash="0" * 32,
+            first_seen_at=long_ago,
+            last_seen_at=long_ago,
+        )
+
+    def test_stale_sightings_survive_until_the_scan_completes(self):
+        from api2.models import OfferVariantSighting
+        from api2.scanner import update_providers_info
+
+        payload = [json.dumps({"golem.runtime.name": "wasmtime", "node_id": "0xabc"})]
+        update_providers_info(payload, scan_complete=False)
+        self.assertTrue(
+            OfferVariantSighting.objects.filter(provider_node_id="0xgone").exists()
+        )
+
+        update_providers_info([], scan_complete=True)
+        self.assertFalse(
+            OfferVariantSighting.objects.filter(provider_node_id="0xgone").exists()
+        )
+
+
+class OfferBatchCodecTests(TestCase):
+    def test_compact_and_json_batches_decode_to_the_same_offers(self):
+        from api2.offer_codec import decode_offer_batch, encode_offer_batch
+
+        offers = synthetic_proposals(50)
+        offers[3]["golem.inf.gpu.model"] = "RTX 4090"  # a second key set
+        offers[7] = {"node_id": "0xabc", "golem.runtime.name": "wasmtime"}
+
+        compact = encode_offer_batch(offers, encoding="compact")
+        legacy = encode_offer_batch(offers, encoding="json")
+        self.assertIsInstance(compact, str)
+        self.assertLess(len(compact), len(json.dumps(legacy)))
+        self.assertEqual(decode_offer_batch(compact), offers)
+        self.assertEqual(decode_offer_batch(legacy), offers)
+
+    def test_scan_ingests_a_compact_batch(self):
+        from api2.models import GLM, Offer
+        from api2.offer_codec import encode_offer_batch
+        from api2.scanner import update_providers_info
+
+        isolate_scanner_state(self)
+        GLM.objects.create(id=1, current_price=0.1)
+        update_providers_info(
+            encode_offer_batch(synthetic_proposals(6), encoding="compact")
+        )
+        self.assertEqual(Offer.objects.count(), 6)
+
+
+class GolemBaseIncrementalScrapeTests(TestCase):
+    """Only new or changed golem-base entities are decoded and ingested."""
+
+    def setUp(self):
+        from api2.models import GLM
+        from api2.scanner import ingest_golem_base_offers, update_providers_info
+
+        isolate_scanner_state(self)
+        GLM.objects.create(id=1, current_price=0.1)
+        # Run the fan-out synchronously and record what each run forwarded.
+        self.ingested = []
+        self.still_seen = []
+
+        def ingest(entities):
+            from api2.offer_codec import COMPACT_PREFIX, decode_offer_batch
+
+            self.assertTrue(entities.startswith(COMPACT_PREFIX))
+            self.ingested.append(len(decode_offer_batch(entities)))
+            ingest_golem_base_offers(entities)
+
+        def update(node_props, **kwargs):
+            self.still_seen.append(len(kwargs.get("still_seen") or []))
+            update_providers_info(node_props, **kwargs)
+
+        for target, side_effect in (
+            ("api2.scanner.ingest_golem_base_offers.delay", ingest),
+            ("api2.scanner.update_providers_info.delay", update),
+        ):
+            patcher = patch(target, side_effect=side_effect)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _entity(self, n, price=0.00001):
+        import base64
+
+        value = {
+            "providerId": f"0x{n:040x}",
+            "properties": {
+                "golem": {
+                    "runtime": {"name": "vm"},
+                    "inf": {"cpu": {"threads": 4}, "mem": {"gib": 8.0}},
+                    "com": {
+                        "usage": {"vector": ["golem.usage.duration_sec", "golem.usage.cpu_sec"]},
+                        "pricing": {"model": {"linear": {"coeffs": [price, price, 0.0]}}},
+                    },
+                }
+            },
+        }
+        return {
+            "key": f"entity-{n}",
+            "value": base64.b64encode(json.dumps(value).encode()).decode(),
+        }
+
+    def _scrape(self, entities):
+        from api2.scanner import golem_base_offer_scraper
+
+        self.ingested.clear()
+        self.still_seen.clear()
+        response = type(
+            "Response",
+            (),
+            {"raise_for_status": lambda self: None, "json": lambda self: {"result": entities}},
+        )()
+        with patch("api2.scanner.requests.post", return_value=response):
+            golem_base_offer_scraper()
+
+    def test_unchanged_entities_are_only_marked_as_seen(self):
+        from api2.models import Offer
+
+        self._scrape([self._entity(n) for n in range(3)])
+        self.assertEqual(self.ingested, [3])
+        self.assertEqual(Offer.objects.count(), 3)
+        Offer.objects.update(last_seen_at=timezone.now() - timedelta(minutes=2))
+
+        self._scrape([self._entity(0, price=0.00002), self._entity(1), self._entity(2)])
+        self.assertEqual(self.ingested, [1])
+        self.assertEqual(self.still_seen, [2])
+        changed = Offer.objects.get(provider__node_id=f"0x{0:040x}")
+        self.assertEqual(
+            changed.properties["golem.com.pricing.model.linear.coeffs"][0], 0.00002
+        )
+        self.assertEqual(Offer.objects.fresh().count(), 3)
+
+    def test_forgets_entities_that_disappear(self):
+        from api2.scanner import GOLEM_BASE_FINGERPRINTS_KEY, r
+
+        self._scrape([self._entity(n) for n in range(3)])
+        self._scrape([self._entity(0)])
+        self.assertEqual(r.hkeys(GOLEM_BASE_FINGERPRINTS_KEY), [b"entity-0"])
+
+
+class WindowedSeriesTests(TestCase):
+    """The sliding window must agree with slicing every window from scratch."""
+
+    def test_matches_reference(self):
+        import random
+
+        from api2.rolling_stats import windowed_series
+
+        rng = random.Random(7)
+        start = timezone.now().replace(microsecond=0) - timedelta(days=3)
+        rows = []
+        for n in range(1500):
+            created = start + timedelta(minutes=rng.randrange(0, 3 * 24 * 60))
+            rows.append((
+                created,
+                rng.choice([None, round(rng.uniform(0.01, 0.2), 4)]),
+                round(rng.uniform(0, 0.05), 4),
+                rng.choice([0.0, 0.0001, None, rng.random()]),
+            ))
+        rows.sort(key=lambda row: row[0])
+        # Points on exact row timestamps exercise both inclusive edges.
+        points = sorted(
+            {start + timedelta(hours=h) for h in range(0, 72, 3)}
+            | {rows[500][0], rows[500][0] + timedelta(days=1)}
+        )
+
+        actual = windowed_series(rows, points, timedelta(days=1), ("cpu", "env", "start"))
+        expected = reference_windowed_series(rows, points, timedelta(days=1))
+        self.assertEqual(len(actual), len(expected))
+        for got, want in zip(actual, expected):
+            self.assertEqual(got.keys(), want.keys())
+            for key in want:
+                self.assertAlmostEqual(got[key], want[key], places=12)
+
+    def test_empty_windows_report_zero(self):
+        from api2.rolling_stats import windowed_series
+
+        now = timezone.now()
+        rows = [(now - timedelta(days=3), 1.0, 2.0, 3.0)]
+        series = windowed_series(
+            rows,
+            [now - timedelta(days=3), now],
+            timedelta(days=1),
+            ("cpu", "env", "start"),
+        )
+        self.assertEqual(series[0]["median_start"], 3.0)
+        self.assertEqual(series[1], {
+            "average_cpu": 0, "median_cpu": 0, "average_env": 0,
+            "median_env": 0, "average_start": 0, "median_start": 0,
+        })
+
+
+class TransactionChartFactsTests(TestCase):
+    """Charts built from the daily facts must match per-window GROUP BYs."""
+
+    def setUp(self):
+        import random
+
+        from api2.models import GolemTransactions
+        from api2.transaction_facts import record_transactions
+
+        rng = random.Random(3)
+        self.now = timezone.now()
+        transactions = [
+            GolemTransactions(
+                scanner_id=n,
+                txhash=f"0x{n:064x}",
+                transaction_type=rng.choice(["singleTransfer", "batched", None]),
+                amount=round(rng.uniform(0, 50), 3),
+                timestamp=self.now - timedelta(minutes=rng.randrange(0, 400 * 24 * 60)),
+                receiver="0xreceiver",
+                sender="0xsender",
+                tx_from_golem=rng.random() < 0.4,
+            )
+            for n in range(3000)
+        ]
+        record_transactions(transactions)
+
+    def _reference(self):
+        from django.db.models import Avg, Count, FloatField, Q, Sum
+        from django.db.models.functions import Coalesce, TruncDay
+
+        from api2.models import GolemTransactions
+
+        def per_day(start, **aggregates):
+            return list(
+                GolemTransactions.objects.filter(timestamp__range=(start, self.now))
+                .annotate(date=TruncDay("timestamp"))
+                .values("date")
+                .annotate(**aggregates)
+                .order_by("date")
+            )
+
+        golem, chain = Q(tx_from_golem=True), Q(tx_from_golem=False)
+
+        def amounts(aggregate, flt):
+            return Coalesce(
+                aggregate("amount", filter=flt, output_field=FloatField()),
+                0,
+                output_field=FloatField(),
+            )
+
+        earliest = GolemTransactions.objects.earliest("timestamp").timestamp
+        starts = {
+            "7d": self.now - timedelta(days=7), "14d": self.now - timedelta(days=14),
+            "1m": self.now - timedelta(days=30), "3m": self.now - timedelta(days=90),
+            "6m": self.now - timedelta(days=180), "1y": self.now - timedelta(days=365),
+            "All": earliest,
+        }
+        charts = {}
+        for key, start in starts.items():
+            for chart, series in {
+                "average_transaction_value_over_time": per_day(
+                    start, on_golem=amounts(Avg, golem), not_golem=amounts(Avg, chain)),
+                "daily_transaction_type_counts": per_day(
+                    start,
+                    singleTransfer=Count("scanner_id", filter=Q(transaction_type="singleTransfer")),
+                    batched=Count("scanner_id", filter=Q(transaction_type="batched")),
+                ),
+                "transaction_type_comparison": list(
+                    GolemTransactions.objects.filter(
+                        timestamp__range=(start, self.now),
+                        transaction_type__in=["singleTransfer", "batched"],
+                    )
+                    .values("transaction_type")
+                    .annotate(total=Count("scanner_id"))
+                    .order_by("transaction_type")
+                ),
+                "amount_transferred_over_time": per_day(start, total_amount=Sum("amount")),
+                "transaction_volume_over_time": per_day(
+                    start,
+                    on_golem=Count("scanner_id", filter=golem),
+                    not_golem=Count("scanner_id", filter=chain),
+                ),
+                "daily_volume_golem_vs_chain": per_day(
+                    start, on_golem=amounts(Sum, golem), not_golem=amounts(Sum, chain)),
+            }.items():
+                charts.setdefault(chart, {})[key] = series
+        return charts
+
+    def assertPayloadsMatch(self, actual, expected):
+        self.assertEqual(actual.keys(), expected.keys())
+        for chart in expected:
+            self.assertEqual(list(actual[chart]), list(expected[chart]))
+            for key, rows in expected[chart].items():
+                self.assertEqual(len(actual[chart][key]), len(rows), (chart, key))
+                for got, want in zip(actual[chart][key], rows):
+                    self.assertEqual(got.keys(), want.keys())
+                    for field, value in want.items():
+                        if isinstance(value, float):
+                            self.assertAlmostEqual(got[field], value, places=6)
+                        else:
+                            self.assertEqual(got[field], value, (chart, key, field))
+
+    def test_payloads_match_per_window_queries(self):
+        from api2.transaction_facts import transaction_chart_payloads
+
+        self.assertPayloadsMatch(transaction_chart_payloads(self.now), self._reference())
+
+    def test_late_and_repeated_transfers_update_the_facts(self):
+        from api2.models import GolemTransactions
+        from api2.transaction_facts import (
+            record_transactions,
+            transaction_chart_payloads,
+        )
+
+        late = [
+            GolemTransactions(
+                scanner_id=10**6 + n,
+                txhash=f"0xlate{n}",
+                transaction_type="batched",
+                amount=7.5,
+                timestamp=self.now - timedelta(days=days, minutes=13),
+                receiver="0xr",
+                sender="0xs",
+                tx_from_golem=True,
+            )
+            # One inside the hourly facts' range, one only in the daily ones.
+            for n, days in enumerate((3, 200))
+        ]
+        record_transactions(late)
+        record_transactions(late)
+
+        self.assertPayloadsMatch(transaction_chart_payloads(self.now), self._reference())
+
+    def test_facts_hold_sum_of_squares(self):
+        from django.db.models import Sum
+
+        from api2.models import GolemTransactions, GolemTransactionsDaily
+
+        expected = sum(
+            amount * amount
+            for amount in GolemTransactions.objects.values_list("amount", flat=True)
+        )
+        stored = GolemTransactionsDaily.objects.aggregate(total=Sum("sum_squares"))["total"]
+        self.assertAlmostEqual(stored, expected, places=3)
+
+    @patch("collector.tasks.r", new_callable=fakeredis.FakeRedis)
+    def test_earnings_overview_matches_raw_sums(self, redis_mock):
+        from django.db.models import Sum
+
+        from api2.models import GolemTransactions
+        from collector.tasks import network_earnings_overview_new
+
+        with patch("collector.tasks.now", return_value=self.now):
+            network_earnings_overview_new()
+        overview = json.loads(redis_mock.get("network_earnings_overview_new"))
+        for hours in (6, 24, 168, 720, 2160):
+            expected = GolemTransactions.objects.filter(
+                tx_from_golem=True,
+                timestamp__gte=self.now - timedelta(hours=hours),
+                timestamp__lt=self.now,
+            ).aggregate(total=Sum("amount"))["total"] or 0.0
+            self.assertAlmostEqual(
+                overview[f"network_earnings_{hours}h"]["total_earnings"], expected, places=6
+            )
+
+
+@skipUnlessDBFeature("has_select_for_update")
+class ConcurrentTransactionFactsTests(TransactionTestCase):
+    def test_overlapping_refreshes_wait_for_each_other(self):
+        import threading
+        import time
+        from collections import Counter
+
+        from django.db import connection
+
+        from api2 import transaction_facts
+        from api2.models import GolemTransactions, GolemTransactionsDaily, GolemTransactionsHourly
+
+        now = timezone.now()
+        # Two writers with transfers in the same hours and days.
+        batches = [
+            [
+                GolemTransactions(
+                    scanner_id=writer * 1000 + n,
+                    txhash=f"0x{writer}{n:063x}",
+                    transaction_type=("batched", None)[n % 2],
+                    amount=1.0 + n,
+                    timestamp=now - timedelta(days=n % 3, hours=n % 5, seconds=writer),
+                    receiver="0xreceiver",
+                    sender="0xsender",
+                    tx_from_golem=n % 3 == 0,
+                )
+                for n in range(30)
+            ]
+            for writer in range(2)
+        ]
+        replace = transaction_facts._replace
+
+        def slow_replace(model, bucket_name, buckets, rows):
+            # Leave the other writer time to delete the same buckets too.
+            model.objects.filter(**{f"{bucket_name}__in": buckets}).delete()
+            time.sleep(0.2)
+            replace(model, bucket_name, buckets, rows)
+
+        barrier = threading.Barrier(len(batches))
+        errors = []
+
+        def run(batch):
+            try:
+                barrier.wait()
+                transaction_facts.record_transactions(batch)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        with patch("api2.transaction_facts._replace", slow_replace):
+            threads = [threading.Thread(target=run, args=(batch,)) for batch in batches]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(errors, [])
+        stored = list(GolemTransactions.objects.values_list("timestamp", flat=True))
+        self.assertEqual(len(stored), 60)
+        for model, bucket_name, bucket in (
+            (GolemTransactionsDaily, "day", transaction_facts.day_of),
+            (GolemTransactionsHourly, "hour", transaction_facts.hour_of),
+        ):
+            facts = Counter()
+            for moment, count in model.objects.values_list(bucket_name, "count"):
+                facts[moment] += count
+            self.assertEqual(facts, Counter(bucket(moment) for moment in stored), model)
+
+
+class FakeErc20Api(FakeHTTPServer):
+    """A local erc20-api serving a fixed set of transfers over HTTP."""
+
+    def __init__(self, transfers):
+        self.transfers = transfers
+        self.fail_once = set()
+        self.slow_when_wider_than = None
+        self.requests = []
+        super().__init__()
+        self.url += "erc20/api/stats/transfers"
+
+    def respond(self, path):
+        import time
+        from urllib.parse import parse_qs, urlparse
+
+        query = parse_qs(urlparse(path).query)
+        start, end = int(query["from"][0]), int(query["to"][0])
+        self.requests.append((start, end))
+        with self.lock:
+            failing = start in self.fail_once
+            self.fail_once.discard(start)
+        if failing:
+            return 500, b""
+        if self.slow_when_wider_than is not None and end - start > self.slow_when_wider_than:
+            time.sleep(0.5)
+        return 200, json.dumps({
+            "transfers": [t for t in self.transfers if start <= t["blockTimestamp"] <= end]
+        }).encode()
+
+
+class GolemTransactionBackfillTests(TestCase):
+    WINDOWS = 6
+
+    def setUp(self):
+        import random
+
+        from api2.glm_transfers import BACKFILL_START_EPOCH, BACKFILL_WINDOW_SECONDS
+
+        rng = random.Random(5)
+        self.now_epoch = BACKFILL_START_EPOCH + self.WINDOWS * BACKFILL_WINDOW_SECONDS - 100
+        self.transfers = [
+            {
+                "id": n,
+                "txHash": f"0x{n:064x}",
+                "tokenAmount": str(rng.randrange(1, 10**20)),
+                # Range boundaries are inclusive; make sure some land on them.
+                "blockTimestamp": (
+                    BACKFILL_START_EPOCH + BACKFILL_WINDOW_SECONDS * (n % 4)
+                    if n < 8
+                    else rng.randrange(BACKFILL_START_EPOCH, self.now_epoch)
+                ),
+                "toAddr": rng.choice(["0x50100d4faf5f3b09987dea36dc2eddd57a3e561b", "0xother"]),
+                "fromAddr": f"0xsender{n % 5}",
+                "receiverAddr": "0xreceiver",
+            }
+            for n in range(400)
+        ]
+        self.api = FakeErc20Api(self.transfers)
+        self.addCleanup(self.api.close)
+        isolate_scanner_state(self)
+        override = self.settings(ERC20_API_URL=self.api.url, GLM_TX_BACKFILL_WORKERS=1)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def assertBackfilledExactlyOnce(self):
+        from django.db.models import Sum
+
+        from api2.models import GolemTransactions, GolemTransactionsDaily, TransactionScrapeRange
+
+        self.assertEqual(
+            sorted(GolemTransactions.objects.values_list("scanner_id", flat=True)),
+            [t["id"] for t in self.transfers],
+        )
+        self.assertEqual(
+            GolemTransactionsDaily.objects.aggregate(total=Sum("count"))["total"],
+            len(self.transfers),
+        )
+        ranges = list(TransactionScrapeRange.objects.order_by("start_epoch"))
+        self.assertTrue(all(r.completed_at for r in ranges))
+        for previous, current in zip(ranges, ranges[1:]):
+            self.assertEqual(current.start_epoch, previous.end_epoch + 1)
+        self.assertEqual(sum(r.transfers for r in ranges), len(self.transfers))
+
+    def test_interrupted_backfill_resumes_without_gaps_or_duplicates(self):
+        from api2.glm_transfers import backfill_golem_transactions, plan_backfill_ranges
+        from api2.models import TransactionScrapeRange
+
+        plan_backfill_ranges(self.now_epoch)
+        starts = TransactionScrapeRange.objects.order_by("start_epoch").values_list(
+            "start_epoch", flat=True
+        )
+        self.api.fail_once.add(starts[2])
+        with self.assertRaises(Exception):
+            backfill_golem_transactions(now_epoch=self.now_epoch)
+        self.assertEqual(
+            TransactionScrapeRange.objects.filter(completed_at__isnull=True).count(), 1
+        )
+
+        completed_before = len(self.api.requests)
+        summary = backfill_golem_transactions(now_epoch=self.now_epoch)
+        self.assertEqual(summary["ranges"], 1)
+        self.assertEqual(summary["failed_ranges"], 0)
+        # Only the failed range was fetched again.
+        self.assertEqual(len(self.api.requests), completed_before + 1)
+        self.assertBackfilledExactlyOnce()
+
+    def test_range_failing_part_way_stores_nothing(self):
+        from api2.glm_transfers import plan_backfill_ranges, scrape_range
+        from api2.models import GolemTransactions, GolemTransactionsHourly, TransactionScrapeRange
+
+        plan_backfill_ranges(self.now_epoch)
+        pending = TransactionScrapeRange.objects.order_by("start_epoch").first()
+
+        def batches():
+            yield [t for t in self.transfers if t["blockTimestamp"] <= pending.end_epoch]
+            raise ConnectionError("erc20-api went away")
+
+        with self.assertRaises(ConnectionError):
+            scrape_range(pending, batches())
+        self.assertFalse(GolemTransactions.objects.exists())
+        self.assertFalse(GolemTransactionsHourly.objects.exists())
+        pending.refresh_from_db()
+        self.assertIsNone(pending.completed_at)
+
+    def test_concurrent_fetches_are_stored_one_range_at_a_time(self):
+        from collections import Counter
+
+        from api2 import glm_transfers
+        from api2.models import GolemTransactions, GolemTransactionsDaily, TransactionScrapeRange
+        from api2.transaction_facts import day_of
+
+        glm_transfers.plan_backfill_ranges(self.now_epoch)
+        starts = TransactionScrapeRange.objects.order_by("start_epoch").values_list(
+            "start_epoch", flat=True
+        )
+        self.assertTrue(all(start % 86400 == 0 for start in starts))
+        self.api.fail_once.add(starts[2])
+        # Small batches, so the fetching threads have to wait for the inserts.
+        with self.settings(GLM_TX_BACKFILL_WORKERS=3), patch.object(
+            glm_transfers.iter_transfer_batches, "__defaults__", (7,)
+        ):
+            with self.assertRaises(Exception):
+                glm_transfers.backfill_golem_transactions(now_epoch=self.now_epoch)
+            summary = glm_transfers.backfill_golem_transactions(now_epoch=self.now_epoch)
+
+        self.assertEqual(summary["ranges"], 1)
+        self.assertBackfilledExactlyOnce()
+        self.assertEqual(
+            Counter(
+                day
+                for day, count in GolemTransactionsDaily.objects.values_list("day", "count")
+                for _ in range(count)
+            ),
+            Counter(day_of(t) for t in GolemTransactions.objects.values_list("timestamp", flat=True)),
+        )
+
+    def test_task_takes_over_from_a_dead_run(self):
+        from api2.models import TransactionScraperIndex
+        from api2.tasks import init_golem_tx_scraping
+
+        now = timezone.datetime.fromtimestamp(self.now_epoch, tz=timezone.utc)
+        TransactionScraperIndex.objects.create(
+            id=1,
+            currently_indexing=True,
+            indexing_heartbeat_at=now - timedelta(hours=2),
+        )
+        with patch("django.utils.timezone.now", return_value=now):
+            summary = init_golem_tx_scraping()
+
+        index = TransactionScraperIndex.objects.get(id=1)
+        self.assertTrue(index.indexed_before)
+        self.assertFalse(index.currently_indexing)
+        self.assertEqual(summary["transfers"], len(self.transfers))
+        self.assertEqual(
+            index.latest_timestamp_indexed.timestamp(),
+            max(t["blockTimestamp"] for t in self.transfers),
+        )
+        self.assertBackfilledExactlyOnce()
+
+
+class TransferStreamingTests(TestCase):
+    def test_json_array_items_across_chunk_boundaries(self):
+        from api2.glm_transfers import iter_json_array
+
+        document = json.dumps({
+            "chain": 137,
+            "transfers": [
+                {"id": n, "txHash": f"0x{n:x}", "note": "a, [b] {c}", "nested": {"x": [n]}}
+                for n in range(50)
+            ],
+            "after": [1, 2],
+        }, indent=1)
+        for size in (1, 7, 64, len(document)):
+            chunks = [document[i: i + size] for i in range(0, len(document), size)]
+            self.assertEqual(
+                list(iter_json_array(chunks, "transfers")),
+                json.loads(document)["transfers"],
+            )
+        self.assertEqual(list(iter_json_array(['{"transfers": []}'], "transfers")), [])
+        with self.assertRaises(ValueError):
+            list(iter_json_array(['{"transfers": [{"id": 1}, '], "transfers"))
+
+    def _api(self, transfers, **settings):
+        api = FakeErc20Api(transfers)
+        self.addCleanup(api.close)
+        override = self.settings(ERC20_API_URL=api.url, **settings)
+        override.enable()
+        self.addCleanup(override.disable)
+        return api
+
+    @staticmethod
+    def _transfers(timestamps):
+        return [
+            {
+                "id": n,
+                "txHash": f"0x{n:x}",
+                "tokenAmount": "1",
+                "blockTimestamp": timestamp,
+                "toAddr": "0xto",
+                "fromAddr": "0xfrom",
+                "receiverAddr": "0xr",
+            }
+            for n, timestamp in enumerate(timestamps)
+        ]
+
+    def test_busy_windows_are_bisected(self):
+        from api2.glm_transfers import iter_transfer_batches
+
+        # 40 transfers in a single second cannot be split and are streamed.
+        timestamps = list(range(1000, 1200, 2)) + [1500] * 40
+        api = self._api(self._transfers(timestamps), ERC20_MAX_TRANSFERS_PER_REQUEST=30)
+
+        batches = list(iter_transfer_batches(1000, 2000, batch_size=10))
+
+        self.assertTrue(all(len(batch) <= 10 for batch in batches))
+        fetched = [t["id"] for batch in batches for t in batch]
+        self.assertEqual(sorted(fetched), list(range(len(timestamps))))
+        self.assertGreater(len(api.requests), 1)
+        self.assertIn((1500, 1500), api.requests)
+
+    def test_slow_windows_are_bisected(self):
+        from api2.glm_transfers import iter_transfer_batches
+
+        api = self._api(self._transfers(range(0, 100, 5)), ERC20_API_TIMEOUT=0.2)
+        api.slow_when_wider_than = 30
+
+        batches = list(iter_transfer_batches(0, 99))
+
+        self.assertEqual(
+            sorted(t["id"] for batch in batches for t in batch), list(range(20))
+        )
+        completed = [(start, end) for start, end in api.requests if end - start <= 30]
+        self.assertEqual(sum(end - start + 1 for start, end in completed), 100)
+
+
+class GolemSenderCacheTests(TestCase):
+    def setUp(self):
+        from api2.models import RelayNodes
+        from collector.models import Requestors
+
+        isolate_scanner_state(self)
+        Requestors.objects.create(node_id="0xrequestor")
+        RelayNodes.objects.create(node_id="0xrelay")
+
+    def _transactions(self, senders):
+        from api2.models import GolemTransactions
+        from api2.transaction_facts import record_transactions
+
+        now = timezone.now()
+        record_transactions([
+            GolemTransactions(
+                scanner_id=n,
+                txhash=f"0x{n:064x}",
+                transaction_type="batched",
+                amount=n + 1,
+                timestamp=now - timedelta(hours=n * 7),
+                receiver="0xreceiver",
+                sender=sender,
+                tx_from_golem=False,
+            )
+            for n, sender in enumerate(senders)
+        ])
+
+    def test_set_is_reloaded_only_when_its_version_changes(self):
+        from api2 import golem_senders
+
+        with self.assertNumQueries(2):
+            self.assertEqual(
+                golem_senders.known_golem_senders(), {"0xrequestor", "0xrelay"}
+            )
+        with patch.object(golem_senders.r, "smembers") as smembers:
+            with self.assertNumQueries(0):
+                golem_senders.known_golem_senders()
+            smembers.assert_not_called()
+
+        # Another process publishes a sender.
+        golem_senders.r.sadd(golem_senders.KNOWN_SENDERS_KEY, "0xnew")
+        golem_senders.r.incr(golem_senders.KNOWN_SENDERS_VERSION_KEY)
+        with self.assertNumQueries(0):
+            self.assertIn("0xnew", golem_senders.known_golem_senders())
+
+    def test_new_sender_retags_its_transactions_and_facts(self):
+        from django.db.models import Sum
+
+        from api2.golem_senders import add_known_sender, known_golem_senders
+        from api2.models import GolemTransactions, GolemTransactionsDaily, RelayNodes
+
+        known_golem_senders()
+        self._transactions(["0xlate", "0xother", "0xlate", "0xlate"])
+        RelayNodes.objects.create(node_id="0xlate")
+
+        self.assertEqual(add_known_sender("0xlate"), 3)
+        self.assertIn("0xlate", known_golem_senders())
+        self.assertEqual(
+            set(GolemTransactions.objects.filter(tx_from_golem=True).values_list("sender", flat=True)),
+            {"0xlate"},
+        )
+        golem_facts = GolemTransactionsDaily.objects.filter(tx_from_golem=True).aggregate(
+            count=Sum("count"), amount=Sum("total_amount")
+        )
+        self.assertEqual(golem_facts, {"count": 3, "amount": 1 + 3 + 4})
+        self.assertEqual(
+            GolemTransactionsDaily.objects.filter(tx_from_golem=False).aggregate(
+                count=Sum("count")
+            )["count"],
+            1,
+        )
+
+    def test_sender_whose_retag_failed_is_retagged_by_the_next_sync(self):
+        from django.db import DatabaseError
+
+        from api2 import golem_senders
+        from api2.models import GolemTransactions, RelayNodes
+
+        golem_senders.known_golem_senders()
+        self._transactions(["0xlate", "0xlate", "0xother"])
+        RelayNodes.objects.create(node_id="0xlate")
+
+        with patch.object(
+            golem_senders, "retag_sender_transactions", side_effect=DatabaseError("down")
+        ):
+            with self.assertRaises(DatabaseError):
+                golem_senders.add_known_sender("0xlate")
+        self.assertNotIn("0xlate", golem_senders.known_golem_senders())
+        self.assertFalse(GolemTransactions.objects.filter(tx_from_golem=True).exists())
+
+        self.assertEqual(golem_senders.sync_known_senders(), 2)
+        self.assertIn("0xlate", golem_senders.known_golem_senders())
+
+    def test_sync_retags_senders_saved_without_signals(self):
+        from api2.golem_senders import known_golem_senders, sync_known_senders
+        from api2.models import GolemTransactions
+        from collector.models import Requestors
+
+        known_golem_senders()
+        self._transactions(["0xbulk", "0xbulk", "0xother"])
+        Requestors.objects.bulk_create([Requestors(node_id="0xbulk")])
+        self.assertNotIn("0xbulk", known_golem_senders())
+
+        self.assertEqual(sync_known_senders(), 2)
+        self.assertIn("0xbulk", known_golem_senders())
+        self.assertEqual(
+            set(GolemTransactions.objects.filter(tx_from_golem=True).values_list("sender", flat=True)),
+            {"0xbulk"},
+        )
+
+        # Nothing was added since, so nothing is re-tagged.
+        with self.assertNumQueries(2):
+            self.assertEqual(sync_known_senders(), 0)
+
+    def test_sync_retags_every_sender_without_a_published_set(self):
+        from api2.golem_senders import sync_known_senders
+        from api2.models import GolemTransactions
+
+        self._transactions(["0xrequestor", "0xrelay", "0xother"])
+
+        self.assertEqual(sync_known_senders(), 2)
+        self.assertEqual(
+            set(GolemTransactions.objects.filter(tx_from_golem=True).values_list("sender", flat=True)),
+            {"0xrequestor", "0xrelay"},
+        )
+
+
+
+class FakeRelay(FakeHTTPServer):
+    """A local hybrid relay answering /nodes/<prefix> over keep-alive HTTP."""
+
+    def __init__(self, nodes, delay=0.0):
+        self.nodes = nodes
+        self.fail_once = set()
+        self.fail_always = set()
+        self.requests = []
+        super().__init__(delay=delay)
+        self.url = self.url.rstrip("/")
+
+    def respond(self, path):
+        prefix = path.rsplit("/", 1)[-1]
+        with self.lock:
+            self.requests.append(prefix)
+            failing = prefix in self.fail_always or prefix in self.fail_once
+            self.fail_once.discard(prefix)
+        if failing:
+            return 502, b"{}"
+        return 200, json.dumps({
+            node_id: sessions
+            for node_id, sessions in self.nodes.items()
+            if node_id[2:4] == prefix
+        }).encode()
+
+
+class FakeRelayMixin:
+    def setUp(self):
+        # Two nodes under every prefix, one of them with a session.
+        self.nodes = {}
+        for prefix in range(256):
+            self.nodes[f"0x{prefix:02x}{'a' * 38}"] = [
+                {"peer": f"10.0.{prefix}.1:7464", "seen": "1s"}
+            ]
+            self.nodes[f"0x{prefix:02x}{'b' * 38}"] = []
+        patcher = patch("api2.relay.RETRY_BACKOFF_SECONDS", 0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _relay(self, **kwargs):
+        relay = FakeRelay(self.nodes, **kwargs)
+        self.addCleanup(relay.close)
+        return relay
+
+
+class RelaySweepTests(FakeRelayMixin, TestCase):
+    def test_failed_prefixes_are_retried_and_reported(self):
+        import asyncio
+
+        from api2.relay import sweep_relay_nodes
+
+        relay = self._relay()
+        relay.fail_once.add("10")
+        relay.fail_always.add("ab")
+
+        nodes, failed = asyncio.run(sweep_relay_nodes(relay.url, retries=1))
+
+        self.assertEqual(set(failed), {"ab"})
+        self.assertEqual(relay.requests.count("10"), 2)
+        self.assertEqual(relay.requests.count("ab"), 2)
+        self.assertEqual(
+            nodes,
+            {node_id: sessions for node_id, sessions in self.nodes.items() if node_id[2:4] != "ab"},
+        )
+
+    def test_prefixes_are_fetched_concurrently_over_shared_connections(self):
+        import asyncio
+        import time
+
+        from api2.relay import sweep_relay_nodes
+
+        relay = self._relay(delay=0.02)
+        started = time.monotonic()
+        nodes, failed = asyncio.run(sweep_relay_nodes(relay.url, concurrency=16))
+        elapsed = time.monotonic() - started
+
+        self.assertEqual((len(nodes), failed), (len(self.nodes), {}))
+        # One request at a time would take at least 256 x 20ms; sixteen at a
+        # time a sixteenth of that, so this leaves room for a busy machine.
+        self.assertLess(elapsed, 256 * relay.delay / 2)
+        self.assertGreater(relay.most_in_flight, 1)
+        self.assertLessEqual(relay.most_in_flight, 16)
+        self.assertLessEqual(len(relay.connections), 16)
+
+    def test_relay_nodes_task_stores_peers(self):
+        from api2.models import RelayNodes
+        from api2.tasks import fetch_and_store_relay_nodes
+
+        relay = self._relay()
+        with self.settings(RELAY_CONFIG={"hybrid": {"url": relay.url}}):
+            fetch_and_store_relay_nodes()
+
+        stored = RelayNodes.objects.get(node_id=f"0x7f{'a' * 38}")
+        self.assertEqual((stored.ip_address, stored.port), ("10.0.127.1", 7464))
+        self.assertEqual(RelayNodes.objects.count(), 256)
+
+
+class RelayMonitorInitialScanTests(FakeRelayMixin, TransactionTestCase):
+    # The scan queries Node from inside the event loop, on a connection of its
+    # own, which must not wait on a test transaction.
+
+    def test_initial_scan_does_not_mark_unlisted_prefixes_offline(self):
+        import asyncio
+        import io
+
+        from api2.management.commands.relay_monitor import Command
+        from api2.models import Node
+
+        relay = self._relay()
+        relay.fail_always.add("ab")
+        gone, unknown = f"0x01{'c' * 38}", f"0xab{'a' * 38}"
+        Node.objects.create(node_id=gone, online=True)
+        Node.objects.create(node_id=unknown, online=True)
+
+        command = Command(stdout=io.StringIO())
+        command.relay_url = relay.url
+        with patch("api2.management.commands.relay_monitor.bulk_update_node_statuses") as task:
+            asyncio.run(command.initial_relay_nodes_scan())
+
+        statuses = dict(task.delay.call_args.args[0])
+        self.assertIs(statuses[gone], False)
+        self.assertNotIn(unknown, statuses)
+        self.assertIs(statuses[f"0x01{'a' * 38}"], True)
+        self.assertIs(statuses[f"0x01{'b' * 38}"], False)
+
+
+class RelayEventBufferTests(TestCase):
+    def test_last_state_per_node_is_sent_in_one_batch(self):
+        from api2.relay import RelayEventBuffer
+
+        sent = []
+        events = RelayEventBuffer(sent.append, max_nodes=100)
+        for _ in range(50):
+            events.add("0xaa", False)
+            events.add("0xaa", True)
+        events.add("0xbb", True)
+        events.add("0xbb", False)
+
+        self.assertEqual(sent, [])
+        self.assertEqual(events.flush(), 2)
+        self.assertEqual(events.flush(), 0)
+        self.assertEqual(sent, [[("0xaa", True), ("0xbb", False)]])
+        self.assertEqual(
+            events.metrics(),
+            {"events_received": 102, "batches_flushed": 1, "nodes_flushed": 2, "pending": 0},
+        )
+
+    def test_full_buffer_flushes_by_itself(self):
+        from api2.relay import RelayEventBuffer
+
+        sent = []
+        events = RelayEventBuffer(sent.append, max_nodes=3)
+        for node in range(7):
+            events.add(f"0x{node:02x}", True)
+
+        self.assertEqual([len(batch) for batch in sent], [3, 3])
+        self.assertEqual(events.metrics()["pending"], 1)
+
+    def test_failed_flush_keeps_states_behind_newer_ones(self):
+        from api2.relay import RelayEventBuffer
+
+        def unavailable(batch):
+            raise ConnectionError("broker down")
+
+        events = RelayEventBuffer(unavailable, max_nodes=100)
+        events.add("0xaa", True)
+        events.add("0xbb", True)
+        with self.assertRaises(ConnectionError):
+            events.flush()
+        events.add("0xaa", False)
+
+        sent = []
+        events.send = sent.append
+        events.flush()
+        self.assertEqual(dict(sent[0]), {"0xaa": False, "0xbb": True})
+        self.assertEqual(events.metrics()["batches_flushed"], 1)
+
+
+class RelayMonitorEventTests(TestCase):
+    def _run_monitor(self, listen):
+        import asyncio
+        import io
+
+        from api2.management.commands.relay_monitor import Command
+
+        command = Command(stdout=io.StringIO())
+
+        async def no_scan():
+            pass
+
+        command.initial_relay_nodes_scan = no_scan
+        command.listen_for_relay_events = lambda: listen(command)
+        with patch("api2.management.commands.relay_monitor.bulk_update_node_statuses") as task:
+            asyncio.run(command.main())
+        return [call.args[0] for call in task.delay.call_args_list]
+
+    def test_events_are_flushed_on_shutdown(self):
+        async def flapping_relay(command):
+            for _ in range(500):
+                await command.process_event({"Type": "lost-node", "Id": "0xaa"})
+                await command.process_event({"Type": "new-node", "Id": "0xaa"})
+            await command.process_event({"Type": "lost-node", "Id": "0xbb"})
+
+        with self.settings(RELAY_EVENT_FLUSH_SECONDS=60):
+            batches = self._run_monitor(flapping_relay)
+
+        self.assertEqual(batches, [[("0xaa", True), ("0xbb", False)]])
+
+    def test_events_are_flushed_periodically(self):
+        import asyncio
+
+        async def relay(command):
+            await command.process_event({"Type": "new-node", "Id": "0xaa"})
+            await asyncio.sleep(0.2)
+            await command.process_event({"Type": "lost-node", "Id": "0xbb"})
+
+        with self.settings(RELAY_EVENT_FLUSH_SECONDS=0.05):
+            batches = self._run_monitor(relay)
+
+        self.assertEqual(batches, [[("0xaa", True)], [("0xbb", False)]])
@@ -0,0 +1,318 @@
+"""
+Daily and hourly GolemTransactions facts, and the totals built from them.
+
+Six chart tasks used to run the same TruncDay GROUP BY over GolemTransactions
+once per window ("7d" through "All"), and network_earnings_overview_new
+summed amounts over 6h to 2160h windows on every run. Instead,
+record_transactions inserts a batch of transfers and, in the same database
+transaction, recomputes the facts for every hour and day the batch touched:
+count, sum and sum of squares per (bucket, transaction_type, tx_from_golem).
+Recomputing whole buckets means late-arriving transfers and rows that were
+already stored are handled like any other.
+
+GolemTransactionsHourly only covers the last HOURLY_FACT_DAYS days; recent
+days are summed up from their hours and older late arrivals from the raw
+rows. range_totals answers an arbitrary [start, end) range from whole days,
+then whole hours, and only reads GolemTransactions for the partial hours at
+either end, so the charts and the earnings overview keep their exact
+previous boundaries.
+
+Refreshes of the same day are serialized across processes by a PostgreSQL
+advisory lock per day, held until the refreshing transaction commits.
+Without it, two writers would both delete a day's rows and then both insert
+them, and the second would fail on the bucket unique constraints.
+"""
+
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.db.models import Count, F, FloatField, Sum
+from django.db.models.functions import TruncDay, TruncHour
+from django.utils import timezone
+
+from .models import GolemTransactions, GolemTransactionsDaily, GolemTransactionsHourly
+
+CHART_WINDOWS = [
+    ("7d", timedelta(days=7)),
+    ("14d", timedelta(days=14)),
+    ("1m", timedelta(days=30)),
+    ("3m", timedelta(days=90)),
+    ("6m", timedelta(days=180)),
+    ("1y", timedelta(days=365)),
+]
+COMPARED_TYPES = ["batched", "singleTransfer"]
+
+# Long enough for the widest earnings window (2160h = 90 days).
+HOURLY_FACT_DAYS = 100
+
+# First key of the per-day advisory locks; the second is the day's ordinal.
+FACT_LOCK_ID = 4672589
+
+FACT_GROUP = ("transaction_type", "tx_from_golem")
+FACT_VALUES = ("count", "total_amount", "sum_squares")
+
+
+def day_of(moment):
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def hour_of(moment):
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+def hourly_cutoff(now=None):
+    return day_of((now or timezone.now()) - timedelta(days=HOURLY_FACT_DAYS))
+
+
+def _aggregate(queryset, *group):
+    return (
+        queryset.values(*group, *FACT_GROUP)
+        .annotate(
+            count=Count("scanner_id"),
+            total_amount=Sum("amount"),
+            sum_squares=Sum(F("amount") * F("amount"), output_field=FloatField()),
+        )
+        .order_by()
+    )
+
+
+def _raw(start, end):
+    return GolemTransactions.objects.filter(timestamp__gte=start, timestamp__lt=end)
+
+
+def _replace(model, bucket_name, buckets, rows):
+    model.objects.filter(**{f"{bucket_name}__in": buckets}).delete()
+    model.objects.bulk_create([model(**row) for row in rows])
+
+
+def _lock_days(days):
+    # In day order, so that writers with overlapping days queue up instead
+    # of deadlocking. SQLite only ever has one writer.
+    if connection.vendor != "postgresql":
+        return
+    with connection.cursor() as cursor:
+        for day in sorted(days):
+            cursor.execute(
+                "SELECT pg_advisory_xact_lock(%s, %s)", [FACT_LOCK_ID, day.toordinal()]
+            )
+
+
+def refresh_transaction_facts(timestamps, now=None):
+    """Recompute the hour and day facts covering the given timestamps."""
+    cutoff = hourly_cutoff(now)
+    days = {day_of(moment) for moment in timestamps}
+    hours = {hour_of(moment) for moment in timestamps if moment >= cutoff}
+    if not days:
+        return
+
+    with transaction.atomic():
+        _lock_days(days)
+        if hours:
+            rows = _aggregate(
+                _raw(min(hours), max(hours) + timedelta(hours=1)).annotate(
+                    hour=TruncHour("timestamp")
+                ),
+                "hour",
+            )
+            _replace(
+                GolemTransactionsHourly,
+                "hour",
+                hours,
+                [row for row in rows if row["hour"] in hours],
+            )
+
+        recent_days = {day for day in days if day >= cutoff}
+        if recent_days:
+            totals = defaultdict(lambda: [0, 0.0, 0.0])
+            for row in GolemTransactionsHourly.objects.filter(
+                hour__gte=min(recent_days),
+                hour__lt=max(recent_days) + timedelta(days=1),
+            ).values("hour", *FACT_GROUP, *FACT_VALUES):
+                day = day_of(row["hour"])
+                if day in recent_days:
+                    _add_totals(totals[(day, *(row[f] for f in FACT_GROUP))], row)
+            _replace(
+                GolemTransactionsDaily,
+                "day",
+                recent_days,
+                [
+                    dict(zip(("day", *FACT_GROUP, *FACT_VALUES), (*key, *values)))
+                    for key, values in totals.items()
+                ],
+            )
+
+        old_days = days - recent_days
+        if old_days:
+            rows = _aggregate(
+                _raw(min(old_days), max(old_days) + timedelta(days=1)).annotate(
+                    day=TruncDay("timestamp")
+                ),
+                "day",
+            )
+            _replace(
+                GolemTransactionsDaily,
+                "day",
+                old_days,
+                [row for row in rows if row["day"] in old_days],
+            )
+
+        GolemTransactionsHourly.objects.filter(hour__lt=cutoff).delete()
+
+
+def record_transactions(transactions):
+    """Insert new transfers and bring the facts up to date atomically."""
+    with transaction.atomic():
+        GolemTransactions.objects.bulk_create(transactions, ignore_conflicts=True)
+        refresh_transaction_facts({tx.timestamp for tx in transactions})
+
+
+def _add_totals(totals, row):
+    totals[0] += row["count"]
+    totals[1] += row["total_amount"]
+    totals[2] += row["sum_squares"]
+
+
+def _ceil(moment, floor, step):
+    start = floor(moment)
+    return start if start == moment else start + step
+
+
+def range_totals(start, end, now=None):
+    """{(transaction_type, tx_from_golem): [count, sum, sum_squares]} over [start, end)."""
+    totals = defaultdict(lambda: [0, 0.0, 0.0])
+    cutoff = hourly_cutoff(now)
+
+    def collect(queryset):
+        for row in queryset:
+            _add_totals(totals[tuple(row[f] for f in FACT_GROUP)], row)
+
+    def facts(model, bucket_name, low, high):
+        collect(
+            model.objects.filter(
+                **{f"{bucket_name}__gte": low, f"{bucket_name}__lt": high}
+            ).values(*FACT_GROUP, *FACT_VALUES)
+        )
+
+    def hours(low, high):
+        # Less than a day, which never straddles the (midnight) cutoff.
+        if low >= high:
+            return
+        if low >= cutoff:
+            facts(GolemTransactionsHourly, "hour", low, high)
+        else:
+            collect(_aggregate(_raw(low, high)))
+
+    first_hour = _ceil(start, hour_of, timedelta(hours=1))
+    last_hour = hour_of(end)
+    if first_hour >= last_hour:
+        collect(_aggregate(_raw(start, end)))
+        return totals
+    collect(_aggregate(_raw(start, first_hour)))
+    collect(_aggregate(_raw(last_hour, end)))
+
+    first_day = _ceil(first_hour, day_of, timedelta(days=1))
+    last_day = day_of(last_hour)
+    if first_day >= last_day:
+        # No whole day in between; split at the midnight inside, if any.
+        middle = max(first_hour, last_day)
+        hours(first_hour, middle)
+        hours(middle, last_hour)
+    else:
+        hours(first_hour, first_day)
+        facts(GolemTransactionsDaily, "day", first_day, last_day)
+        hours(last_day, last_hour)
+    return totals
+
+
+class _Day:
+    __slots__ = ("count", "amount")
+
+    def __init__(self):
+        # Indexed by tx_from_golem; types only matter for the type charts.
+        self.count = {True: 0, False: 0}
+        self.amount = {True: 0.0, False: 0.0}
+
+
+def _add(days, types, date, transaction_type, tx_from_golem, count, amount):
+    day = days[date]
+    day.count[tx_from_golem] += count
+    day.amount[tx_from_golem] += amount
+    types[date][transaction_type] += count
+
+
+def _window_series(days, types):
+    average, type_counts, amount, volume, golem_vs_chain = [], [], [], [], []
+    compared = defaultdict(int)
+    for date in sorted(days):
+        day = days[date]
+        average.append({
+            "date": date,
+            "on_golem": day.amount[True] / day.count[True] if day.count[True] else 0,
+            "not_golem": day.amount[False] / day.count[False] if day.count[False] else 0,
+        })
+        type_counts.append({
+            "date": date,
+            "singleTransfer": types[date]["singleTransfer"],
+            "batched": types[date]["batched"],
+        })
+        amount.append({"date": date, "total_amount": day.amount[True] + day.amount[False]})
+        volume.append({"date": date, "on_golem": day.count[True], "not_golem": day.count[False]})
+        golem_vs_chain.append({
+            "date": date, "on_golem": day.amount[True], "not_golem": day.amount[False]
+        })
+        for transaction_type in COMPARED_TYPES:
+            compared[transaction_type] += types[date][transaction_type]
+    return {
+        "average_transaction_value_over_time": average,
+        "daily_transaction_type_counts": type_counts,
+        "transaction_type_comparison": [
+            {"transaction_type": transaction_type, "total": compared[transaction_type]}
+            for transaction_type in COMPARED_TYPES
+            if compared[transaction_type]
+        ],
+        "amount_transferred_over_time": amount,
+        "transaction_volume_over_time": volume,
+        "daily_volume_golem_vs_chain": golem_vs_chain,
+    }
+
+
+def transaction_chart_payloads(now=None):
+    """{redis key: {window: series}} for all six transaction charts."""
+    now = now or timezone.now()
+    facts = list(
+        GolemTransactionsDaily.objects.filter(day__lte=now)
+        .order_by("day")
+        .values_list("day", *FACT_GROUP, "count", "total_amount")
+    )
+    earliest = GolemTransactions.objects.order_by("timestamp").values_list(
+        "timestamp", flat=True
+    ).first()
+    windows = [(key, now - span) for key, span in CHART_WINDOWS]
+    if earliest is not None:
+        windows.append(("All", earliest))
+
+    payloads = defaultdict(dict)
+    for key, start in windows:
+        first_day = day_of(start)
+        days = defaultdict(_Day)
+        types = defaultdict(lambda: defaultdict(int))
+        leading = range_totals(start, first_day + timedelta(days=1), now)
+        for (transaction_type, tx_from_golem), (count, amount, _) in leading.items():
+            if count:
+                _add(days, types, first_day, transaction_type, tx_from_golem, count, amount)
+        for row in facts:
+            if row[0] > first_day:
+                _add(days, types, *row)
+        for chart, series in _window_series(days, types).items():
+            payloads[chart][key] = series
+    return dict(payloads)
+
+
+def golem_earnings(start, end, now=None):
+    """Amount transferred by known Golem senders in [start, end)."""
+    return sum(
+        amount
+        for (_, tx_from_golem), (_, amount, _) in range_totals(start, end, now).items()
+        if tx_from_golem
+    )
@@ -2,6 +2,7 @@ import subprocess
 from django.conf import settings
 import os
 from .models import Offer, EC2Instance
+from .ec2_index import invalidate_ec2_index
 
 
 def identify_network_by_offer(offer):
@@ -141,6 +142,8 @@ def store_ec2_instance_data(pricing_data, product_id, category, name, details):
         name=name,
         defaults={"vcpu": details["vcpu"], "memory": memory_gb, "price_usd": price},
     )
+    if created:
+        invalidate_ec2_index()
 
 
 def make_request_with_rate_limit_handling(url, headers, task_instance=None):
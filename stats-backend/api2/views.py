@@ -5,8 +5,8 @@ from .models import Node, Offer, HealtcheckTask
 from .serializers import NodeSerializer, OfferSerializer
 import redis
 import json
-import gzip
-from redis import asyncio as aioredis
+from core.async_redis import get_async_redis
+from core.cached_json import cached_json_response
 import requests
 from .utils import identify_network
 from django.http import JsonResponse, HttpResponse
@@ -31,16 +31,7 @@ from .scoring import calculate_uptime_percentage
 
 
 async def pricing_past_hour(request):
-    try:
-        pool = aioredis.ConnectionPool.from_url(
-            "redis://redis:6379/0", decode_responses=True
-        )
-        r = aioredis.Redis(connection_pool=pool)
-        pricing_data = json.loads(await r.get("pricing_past_hour_v2"))
-        pool.disconnect()
-        return JsonResponse(pricing_data)
-    except Exception as e:
-        return JsonResponse({"error": str(e)}, status=500)
+    return await cached_json_response(request, "pricing_past_hour_v2")
 
 
 from django.core.paginator import Paginator
@@ -98,42 +89,21 @@ def task_pricing(request):
 
 async def list_ec2_instances_comparison(request):
     if request.method == "GET":
-        pool = aioredis.ConnectionPool.from_url(
-            "redis://redis:6379/0", decode_responses=True
-        )
-        r = aioredis.Redis(connection_pool=pool)
-        content = await r.get("ec2_comparison")
-        data = json.loads(content)
-        pool.disconnect()
-        return JsonResponse(data, safe=False, json_dumps_params={"indent": 4})
+        return await cached_json_response(request, "ec2_comparison")
     else:
         return HttpResponse(status=400)
 
 
 async def online_stats_by_runtime(request):
     if request.method == "GET":
-        pool = aioredis.ConnectionPool.from_url(
-            "redis://redis:6379/0", decode_responses=True
-        )
-        r = aioredis.Redis(connection_pool=pool)
-        content = await r.get("online_stats_by_runtime")
-        data = json.loads(content)
-        pool.disconnect()
-        return JsonResponse(data, safe=False, json_dumps_params={"indent": 4})
+        return await cached_json_response(request, "online_stats_by_runtime")
     else:
         return HttpResponse(status=400)
 
 
 async def online_stats(request):
     if request.method == "GET":
-        pool = aioredis.ConnectionPool.from_url(
-            "redis://redis:6379/0", decode_responses=True
-        )
-        r = aioredis.Redis(connection_pool=pool)
-        content = await r.get("v2_network_online_stats")
-        data = json.loads(content)
-        pool.disconnect()
-        return JsonResponse(data, safe=False, json_dumps_params={"indent": 4})
+        return await cached_json_response(request, "v2_network_online_stats")
     else:
         return HttpResponse(status=400)
 
@@ -143,47 +113,19 @@ async def network_historical_stats(request):
     Network stats past 30 minutes.
     """
     if request.method == "GET":
-        pool = aioredis.ConnectionPool.from_url(
-            "redis://redis:6379/0", decode_responses=True
-        )
-        r = aioredis.Redis(connection_pool=pool)
-        content = await r.get("network_historical_stats_v2")
-        data = json.loads(content)
-        pool.disconnect()
-        return JsonResponse(data, safe=False, json_dumps_params={"indent": 4})
+        return await cached_json_response(request, "network_historical_stats_v2")
     else:
         return HttpResponse(status=400)
 
 
-async def _compressed_json_from_redis(request, key):
-    """
-    Serve a pre-serialized compact JSON string from redis, gzip-encoded
-    when the client accepts it.
-    """
-    pool = aioredis.ConnectionPool.from_url(
-        "redis://redis:6379/0", decode_responses=True
-    )
-    redis_client = aioredis.Redis(connection_pool=pool)
-    content = await redis_client.get(key)
-    pool.disconnect()
-    if content is None:
-        return HttpResponse(status=503)
-    response = HttpResponse(content, content_type="application/json")
-    if "gzip" in request.headers.get("Accept-Encoding", ""):
-        response.content = gzip.compress(response.content, compresslevel=6)
-        response["Content-Encoding"] = "gzip"
-    response["Vary"] = "Accept-Encoding"
-    return response
-
-
 async def network_historical_stats_compressed(request):
     """
     Same data as network_historical_stats but columnar — each timeframe is
     {field: [values]} instead of a list of row objects.
     """
     if request.method == "GET":
-        return await _compressed_json_from_redis(
-            request, "network_historical_stats_v2_columnar"
+        return await cached_json_response(
+            request, "network_historical_stats_v2_columnar", missing_status=503
         )
     else:
         return HttpResponse(status=400)
@@ -195,7 +137,9 @@ async def list_ec2_instances_comparison_compressed(request):
     {field: [values]} instead of a list of row objects.
     """
     if request.method == "GET":
-        return await _compressed_json_from_redis(request, "ec2_comparison_columnar")
+        return await cached_json_response(
+            request, "ec2_comparison_columnar", missing_status=503
+        )
     else:
         return HttpResponse(status=400)
 
@@ -206,14 +150,7 @@ async def network_versions_combined(request):
     nodes: {"versions": [...], "24h": 5-min points, "7d": hourly points}.
     """
     if request.method == "GET":
-        pool = aioredis.ConnectionPool.from_url(
-            "redis://redis:6379/0", decode_responses=True
-        )
-        r = aioredis.Redis(connection_pool=pool)
-        content = await r.get("network_versions_combined")
-        pool.disconnect()
-        data = json.loads(content) if content else {}
-        return JsonResponse(data, safe=False, json_dumps_params={"indent": 4})
+        return await cached_json_response(request, "network_versions_combined", default={})
     else:
         return HttpResponse(status=400)
 
@@ -224,8 +161,8 @@ async def network_historical_stats_combined(request):
     "7d": hourly points}}. Same field layout as the compressed endpoint.
     """
     if request.method == "GET":
-        return await _compressed_json_from_redis(
-            request, "network_historical_stats_combined"
+        return await cached_json_response(
+            request, "network_historical_stats_combined", missing_status=503
         )
     else:
         return HttpResponse(status=400)
@@ -233,27 +170,14 @@ async def network_historical_stats_combined(request):
 
 async def pricing_historical_combined(request):
     if request.method == "GET":
-        pool = aioredis.ConnectionPool.from_url(
-            "redis://redis:6379/0", decode_responses=True
-        )
-        r = aioredis.Redis(connection_pool=pool)
-        content = await r.get("pricing_data_combined")
-        pool.disconnect()
-        data = json.loads(content) if content else {}
-        return JsonResponse(data, safe=False, json_dumps_params={"indent": 4})
+        return await cached_json_response(request, "pricing_data_combined", default={})
     else:
         return HttpResponse(status=400)
 
 
 async def historical_pricing_data(request):
     if request.method == "GET":
-        pool = aioredis.ConnectionPool.from_url(
-            "redis://redis:6379/0", decode_responses=True
-        )
-        r = aioredis.Redis(connection_pool=pool)
-        content = await r.get("pricing_data_charted_v2")
-        data = json.loads(content) if content else {}
-        return JsonResponse(data, safe=False, json_dumps_params={"indent": 4})
+        return await cached_json_response(request, "pricing_data_charted_v2", default={})
     else:
         return HttpResponse(status=400)
 
@@ -366,17 +290,9 @@ def node_uptime(request, yagna_id):
 
 async def online_nodes_uptime_donut_data(request):
     if request.method == "GET":
-        pool = aioredis.ConnectionPool.from_url(
-            "redis://redis:6379/0", decode_responses=True
+        return await cached_json_response(
+            request, "online_nodes_uptime_donut_data", default={"error": "No data found"}
         )
-        r = aioredis.Redis(connection_pool=pool)
-        content = await r.get("online_nodes_uptime_donut_data")
-        try:
-            data = json.loads(content)
-        except TypeError:
-            data = {"error": "No data found"}
-        pool.disconnect()
-        return JsonResponse(data, safe=False, json_dumps_params={"indent": 4})
     else:
         return HttpResponse(status=400)
 
@@ -423,10 +339,7 @@ def globe_data(request):
 
 async def golem_main_website_index(request):
     if request.method == "GET":
-        pool = aioredis.ConnectionPool.from_url(
-            "redis://redis:6379/0", decode_responses=True
-        )
-        r = aioredis.Redis(connection_pool=pool)
+        r = get_async_redis()
 
         fetch_blogs = await r.get("v2_index_blog_posts")
         blogs = json.loads(fetch_blogs)
@@ -437,7 +350,6 @@ async def golem_main_website_index(request):
         fetch_cheapest_providers = await r.get("v2_cheapest_provider")
         cheapest_providers = json.loads(fetch_cheapest_providers)
 
-        pool.disconnect()
         return JsonResponse(
             {"blogs": blogs, "stats": stats, "providers": cheapest_providers},
             safe=False,
@@ -520,72 +432,42 @@ def node(request, yagna_id):
 
 async def online_nodes(request):
     if request.method == "GET":
-        pool = aioredis.ConnectionPool.from_url(
-            "redis://redis:6379/0", decode_responses=True
-        )
-        r = aioredis.Redis(connection_pool=pool)
-        content = await r.get("v2_online_counts")
-        data = json.loads(content)
-        pool.disconnect()
-        return JsonResponse(data, safe=False, json_dumps_params={"indent": 4})
+        return await cached_json_response(request, "v2_online_counts")
     else:
         return HttpResponse(status=400)
 
 
 async def cpu_vendor_stats(request):
     if request.method == "GET":
-        pool = aioredis.ConnectionPool.from_url(
-            "redis://redis:6379/0", decode_responses=True
-        )
-        r = aioredis.Redis(connection_pool=pool)
-        content = await r.get("cpu_vendors_count")
-        data = json.loads(content)
-        pool.disconnect()
-        return JsonResponse(data, safe=False, json_dumps_params={"indent": 4})
+        return await cached_json_response(request, "cpu_vendors_count")
     else:
         return HttpResponse(status=400)
 
 
 async def cpu_architecture_stats(request):
     if request.method == "GET":
-        pool = aioredis.ConnectionPool.from_url(
-            "redis://redis:6379/0", decode_responses=True
-        )
-        r = aioredis.Redis(connection_pool=pool)
-        content = await r.get("cpu_architecture_count")
-        data = json.loads(content)
-        pool.disconnect()
-        return JsonResponse(data, safe=False, json_dumps_params={"indent": 4})
+        return await cached_json_response(request, "cpu_architecture_count")
     else:
         return HttpResponse(status=400)
 
 
-from collector.models import Requestors
-from .models import RelayNodes
+from django.conf import settings
+from .golem_senders import known_golem_senders
 
 
 def get_transfer_sum(request, node_id, epoch):
     try:
         epoch_now = int(timezone.now().timestamp())
-        url = f"http://erc20-api/erc20/api/stats/transfers?chain=137&receiver={node_id}&from={epoch}&to={epoch_now}"
-        response = requests.get(url)
+        response = requests.get(
+            settings.ERC20_API_URL,
+            params={"chain": 137, "receiver": node_id, "from": epoch, "to": epoch_now},
+        )
         if response.status_code != 200:
             return JsonResponse({"error": "Failed to get data from API"}, status=500)
         data = response.json()
 
         transfers = data.get("transfers", [])
-        from_addrs = {t["fromAddr"] for t in transfers}
-
-        matched_addrs = set(
-            Requestors.objects.filter(node_id__in=from_addrs).values_list(
-                "node_id", flat=True
-            )
-        )
-        matched_addrs.update(
-            RelayNodes.objects.filter(node_id__in=from_addrs).values_list(
-                "node_id", flat=True
-            )
-        )
+        matched_addrs = known_golem_senders()
 
         total_amount_wei_matched = 0
         total_amount_wei_not_matched = 0
@@ -610,14 +492,7 @@ def get_transfer_sum(request, node_id, epoch):
 
 async def network_online(request):
     if request.method == "GET":
-        pool = aioredis.ConnectionPool.from_url(
-            "redis://redis:6379/0", decode_responses=True
-        )
-        r = aioredis.Redis(connection_pool=pool)
-        content = await r.get("v2_online")
-        data = json.loads(content)
-        pool.disconnect()
-        return JsonResponse(data, safe=False, json_dumps_params={"indent": 4})
+        return await cached_json_response(request, "v2_online")
     else:
         return HttpResponse(status=400)
 
@@ -634,10 +509,7 @@ async def network_online_new_stats_page(request):
     if request.method != "GET":
         return HttpResponse(status=400)
 
-    pool = aioredis.ConnectionPool.from_url(
-        "redis://redis:6379/0", decode_responses=True
-    )
-    r = aioredis.Redis(connection_pool=pool)
+    r = get_async_redis()
     content = await r.get(f"v2_online_{page}_{size}{runtime_key_suffix}")
     metadata_content = await r.get(f"v2_online_metadata{runtime_key_suffix}")
 
@@ -654,14 +526,7 @@ async def network_online_new_stats_page(request):
 
 async def network_online_flatmap(request):
     if request.method == "GET":
-        pool = aioredis.ConnectionPool.from_url(
-            "redis://redis:6379/0", decode_responses=True
-        )
-        r = aioredis.Redis(connection_pool=pool)
-        content = await r.get("v2_online_flatmap")
-        data = json.loads(content)
-        pool.disconnect()
-        return JsonResponse(data, safe=False, json_dumps_params={"indent": 4})
+        return await cached_json_response(request, "v2_online_flatmap")
     else:
         return HttpResponse(status=400)
 
@@ -717,14 +582,7 @@ def cheapest_by_cores(request):
 
 async def cheapest_offer(request):
     if request.method == "GET":
-        pool = aioredis.ConnectionPool.from_url(
-            "redis://redis:6379/0", decode_responses=True
-        )
-        r = aioredis.Redis(connection_pool=pool)
-        content = await r.get("v2_cheapest_offer")
-        data = json.loads(content)
-        pool.disconnect()
-        return JsonResponse(data, safe=False, json_dumps_params={"indent": 4})
+        return await cached_json_response(request, "v2_cheapest_offer")
     else:
         return HttpResponse(status=400)
 
@@ -819,14 +677,7 @@ from django.http import JsonResponse
 
 async def daily_volume_golem_vs_chain(request):
     if request.method == "GET":
-        pool = aioredis.ConnectionPool.from_url(
-            "redis://redis:6379/0", decode_responses=True
-        )
-        r = aioredis.Redis(connection_pool=pool)
-        content = await r.get("daily_volume_golem_vs_chain")
-        data = json.loads(content)
-        pool.disconnect()
-        return JsonResponse(data, safe=False, json_dumps_params={"indent": 4})
+        return await cached_json_response(request, "daily_volume_golem_vs_chain")
     else:
         return HttpResponse(status=400)
 
@@ -836,42 +687,21 @@ from django.db.models import Count
 
 async def transaction_volume_over_time(request):
     if request.method == "GET":
-        pool = aioredis.ConnectionPool.from_url(
-            "redis://redis:6379/0", decode_responses=True
-        )
-        r = aioredis.Redis(connection_pool=pool)
-        content = await r.get("transaction_volume_over_time")
-        data = json.loads(content)
-        pool.disconnect()
-        return JsonResponse(data, safe=False, json_dumps_params={"indent": 4})
+        return await cached_json_response(request, "transaction_volume_over_time")
     else:
         return HttpResponse(status=400)
 
 
 async def amount_transferred_over_time(request):
     if request.method == "GET":
-        pool = aioredis.ConnectionPool.from_url(
-            "redis://redis:6379/0", decode_responses=True
-        )
-        r = aioredis.Redis(connection_pool=pool)
-        content = await r.get("amount_transferred_over_time")
-        data = json.loads(content)
-        pool.disconnect()
-        return JsonResponse(data, safe=False, json_dumps_params={"indent": 4})
+        return await cached_json_response(request, "amount_transferred_over_time")
     else:
         return HttpResponse(status=400)
 
 
 async def transaction_type_comparison(request):
     if request.method == "GET":
-        pool = aioredis.ConnectionPool.from_url(
-            "redis://redis:6379/0", decode_responses=True
-        )
-        r = aioredis.Redis(connection_pool=pool)
-        content = await r.get("transaction_type_comparison")
-        data = json.loads(content)
-        pool.disconnect()
-        return JsonResponse(data, safe=False, json_dumps_params={"indent": 4})
+        return await cached_json_response(request, "transaction_type_comparison")
     else:
         return HttpResponse(status=400)
 
@@ -881,41 +711,23 @@ from django.db.models import IntegerField, ExpressionWrapper, Case, When, Avg
 
 async def daily_transaction_type_counts(request):
     if request.method == "GET":
-        pool = aioredis.ConnectionPool.from_url(
-            "redis://redis:6379/0", decode_responses=True
-        )
-        r = aioredis.Redis(connection_pool=pool)
-        content = await r.get("daily_transaction_type_counts")
-        data = json.loads(content)
-        pool.disconnect()
-        return JsonResponse(data, safe=False, json_dumps_params={"indent": 4})
+        return await cached_json_response(request, "daily_transaction_type_counts")
     else:
         return HttpResponse(status=400)
 
 
 async def average_transaction_value_over_time(request):
     if request.method == "GET":
-        pool = aioredis.ConnectionPool.from_url(
-            "redis://redis:6379/0", decode_responses=True
-        )
-        r = aioredis.Redis(connection_pool=pool)
-        content = await r.get("average_transaction_value_over_time")
-        data = json.loads(content)
-        pool.disconnect()
-        return JsonResponse(data, safe=False, json_dumps_params={"indent": 4})
+        return await cached_json_response(request, "average_transaction_value_over_time")
     else:
         return HttpResponse(status=400)
 
 
 async def computing_over_time_combined(request):
     if request.method == "GET":
-        pool = aioredis.ConnectionPool.from_url(
-            "redis://redis:6379/0", decode_responses=True
-        )
-        r = aioredis.Redis(connection_pool=pool)
+        r = get_async_redis()
         hourly = await r.get("computing_over_time_hourly")
         five_min = await r.get("computing_over_time_5min")
-        pool.disconnect()
         data = {
             "7d": json.loads(hourly) if hourly else [],
             "24h": json.loads(five_min) if five_min else [],
@@ -927,21 +739,14 @@ async def computing_over_time_combined(request):
 
 async def computing_total_over_time(request):
     if request.method == "GET":
-        pool = aioredis.ConnectionPool.from_url(
-            "redis://redis:6379/0", decode_responses=True
-        )
-        r = aioredis.Redis(connection_pool=pool)
-        content = await r.get("computing_total_over_time")
-        data = json.loads(content)
-        pool.disconnect()
-        return JsonResponse(data, safe=False, json_dumps_params={"indent": 4})
+        return await cached_json_response(request, "computing_total_over_time")
     else:
         return HttpResponse(status=400)
 
 
 from django.http import JsonResponse, HttpResponse
 import json
-from redis import asyncio as aioredis
+from core.async_redis import get_async_redis
 
 
 async def wallets_and_ids(request):
@@ -949,10 +754,7 @@ async def wallets_and_ids(request):
         query = request.GET.get(
             "query", ""
         ).lower()  # Get the query parameter from the request
-        pool = aioredis.ConnectionPool.from_url(
-            "redis://redis:6379/0", decode_responses=True
-        )
-        r = aioredis.Redis(connection_pool=pool)
+        r = get_async_redis()
         content = await r.get("wallets_and_ids")
         data = json.loads(content)
 
@@ -969,7 +771,6 @@ async def wallets_and_ids(request):
             ):
                 filtered_data["providers"].append(item)
 
-        pool.disconnect()
         return JsonResponse(filtered_data, safe=False, json_dumps_params={"indent": 4})
     else:
         return HttpResponse(status=400)
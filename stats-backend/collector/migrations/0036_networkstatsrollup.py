@@ -0,0 +1,44 @@
+from django.db import migrations, models
+
+
+def _aggregate(name):
+    return [
+        (f"{name}_sum", models.FloatField()),
+        (f"{name}_min", models.FloatField()),
+        (f"{name}_max", models.FloatField()),
+    ]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("collector", "0035_requestors_created_at_requestors_updated_at"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="networkstats",
+            index=models.Index(fields=["runtime", "date"], name="collector_n_runtime_ad7c2d_idx"),
+        ),
+        # Filled by the refresh_network_stats_rollups task, which backfills
+        # from the oldest raw sample on its first run.
+        migrations.CreateModel(
+            name="NetworkStatsRollup",
+            fields=[
+                ("id", models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("runtime", models.CharField(max_length=64)),
+                ("resolution", models.CharField(max_length=2)),
+                ("bucket", models.DateTimeField()),
+                ("samples", models.IntegerField()),
+                *_aggregate("online"),
+                *_aggregate("cores"),
+                *_aggregate("memory"),
+                *_aggregate("disk"),
+                *_aggregate("gpus"),
+            ],
+            options={
+                "unique_together": {("runtime", "resolution", "bucket")},
+                "indexes": [models.Index(fields=["resolution", "bucket"], name="collector_n_resolut_7d6e80_idx")],
+            },
+        ),
+    ]
@@ -62,6 +62,51 @@ class NetworkStats(models.Model):
     gpu_memory = models.FloatField(default=0)
     gpu_models = models.JSONField(default=dict)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["runtime", "date"]),
+        ]
+
+
+class NetworkStatsRollup(models.Model):
+    """NetworkStats aggregated into 5-minute, hourly and daily buckets.
+
+    Kept up to date by collector.rollups.refresh_network_stats_rollups. Every
+    bucket holds the sample count plus sum/min/max of each charted field, so
+    an average over any run of buckets is sum(sums) / sum(samples) and the
+    charts never have to go back to the raw 10-second samples.
+    """
+
+    FIVE_MINUTES = "5m"
+    HOURLY = "1h"
+    DAILY = "1d"
+
+    runtime = models.CharField(max_length=64)
+    resolution = models.CharField(max_length=2)
+    bucket = models.DateTimeField()
+    samples = models.IntegerField()
+    online_sum = models.FloatField()
+    online_min = models.FloatField()
+    online_max = models.FloatField()
+    cores_sum = models.FloatField()
+    cores_min = models.FloatField()
+    cores_max = models.FloatField()
+    memory_sum = models.FloatField()
+    memory_min = models.FloatField()
+    memory_max = models.FloatField()
+    disk_sum = models.FloatField()
+    disk_min = models.FloatField()
+    disk_max = models.FloatField()
+    gpus_sum = models.FloatField()
+    gpus_min = models.FloatField()
+    gpus_max = models.FloatField()
+
+    class Meta:
+        unique_together = ("runtime", "resolution", "bucket")
+        indexes = [
+            models.Index(fields=["resolution", "bucket"]),
+        ]
+
 
 class ProvidersComputing(models.Model):
     total = models.IntegerField()
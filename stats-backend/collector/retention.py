@@ -0,0 +1,107 @@
+"""
+Retention for the raw high-frequency sample tables.
+
+NetworkStats and ProvidersComputing get a row every 10 seconds and used to be
+kept forever. compact_raw_samples deletes raw rows older than
+RAW_SAMPLE_RETENTION_DAYS, after making sure everything the charts read from
+them lives on in a summary table:
+
+- NetworkStats: the NetworkStatsRollup tiers (collector/rollups.py) are
+  refreshed first, and nothing is deleted unless they reach past the cutoff.
+  The newest sample of every runtime is always kept, since the historical
+  charts end each series with it.
+- ProvidersComputing: every deleted day gets its ProvidersComputingMax row,
+  the same daily maximum computing_snapshot_yesterday records, if the nightly
+  snapshot did not write one.
+
+The cutoff is always a UTC midnight, so only whole days are deleted and a
+day's summary never has to be recomputed from a partial set of samples.
+"""
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Max
+from django.db.models.functions import TruncDay
+from django.utils import timezone
+
+from .models import NetworkStats, NetworkStatsRollup, ProvidersComputing, ProvidersComputingMax
+from .rollups import bucket_start, refresh_network_stats_rollups
+
+# computing_over_time_hourly charts seven days of raw ProvidersComputing
+# samples, so retention can never be shorter than that.
+MIN_RETENTION_DAYS = 7
+
+
+def retention_cutoff(now=None):
+    days = max(settings.RAW_SAMPLE_RETENTION_DAYS, MIN_RETENTION_DAYS)
+    now = now or timezone.now()
+    return bucket_start(now - timedelta(days=days), NetworkStatsRollup.DAILY)
+
+
+def _delete_in_batches(queryset, batch_size):
+    """Delete the queryset's rows a batch of primary keys at a time."""
+    deleted = 0
+    while True:
+        ids = list(queryset.order_by("pk").values_list("pk", flat=True)[:batch_size])
+        if not ids:
+            return deleted
+        deleted += queryset.model.objects.filter(pk__in=ids).delete()[0]
+
+
+def _compact_network_stats(cutoff, now, batch_size):
+    compacted = refresh_network_stats_rollups(now=now)
+    covered = NetworkStatsRollup.objects.filter(
+        resolution=NetworkStatsRollup.FIVE_MINUTES
+    ).aggregate(latest=Max("bucket"))["latest"]
+    if covered is None or covered < cutoff:
+        return {"compacted": compacted, "deleted": 0}
+
+    latest_per_runtime = (
+        NetworkStats.objects.values("runtime")
+        .annotate(latest=Max("date"))
+        .values_list("runtime", "latest")
+    )
+    expired = NetworkStats.objects.filter(date__lt=cutoff)
+    for runtime, latest in latest_per_runtime:
+        if latest < cutoff:
+            expired = expired.exclude(runtime=runtime, date=latest)
+    return {"compacted": compacted, "deleted": _delete_in_batches(expired, batch_size)}
+
+
+def _compact_providers_computing(cutoff, batch_size):
+    expired = ProvidersComputing.objects.filter(date__lt=cutoff)
+    recorded_days = set(
+        ProvidersComputingMax.objects.filter(date__lt=cutoff)
+        .annotate(day=TruncDay("date"))
+        .values_list("day", flat=True)
+    )
+    daily_maxima = (
+        expired.annotate(day=TruncDay("date"))
+        .values("day")
+        .annotate(total=Max("total"))
+        .order_by("day")
+    )
+    missing = [
+        ProvidersComputingMax(date=row["day"], total=row["total"])
+        for row in daily_maxima
+        if row["day"] not in recorded_days
+    ]
+    ProvidersComputingMax.objects.bulk_create(missing)
+    return {"compacted": len(missing), "deleted": _delete_in_batches(expired, batch_size)}
+
+
+def compact_raw_samples(now=None):
+    """Summarise and delete expired raw samples.
+
+    Returns {"NetworkStats": {"compacted": n, "deleted": n},
+    "ProvidersComputing": {...}}, where "compacted" counts the summary rows
+    written by this run and "deleted" the raw rows freed.
+    """
+    now = now or timezone.now()
+    cutoff = retention_cutoff(now)
+    batch_size = settings.RAW_SAMPLE_DELETE_BATCH
+    return {
+        "NetworkStats": _compact_network_stats(cutoff, now, batch_size),
+        "ProvidersComputing": _compact_providers_computing(cutoff, batch_size),
+    }
@@ -0,0 +1,189 @@
+"""
+Incremental 5-minute / hourly / daily rollups of NetworkStats.
+
+v2_network_stats_to_redis writes one NetworkStats row per runtime every 10
+seconds, and every chart used to re-aggregate those raw rows from scratch —
+the "1y" and "All" ranges included. refresh_network_stats_rollups folds new
+samples into NetworkStatsRollup buckets instead (5-minute buckets from the raw
+rows, hourly ones from the 5-minute buckets, daily ones from the hourly), and
+the chart producers read the coarsest tier that still has the resolution they
+plot. Their cost then depends on the length of the range, not on how many
+raw samples the table has accumulated.
+"""
+
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db.models import Max, Min
+from django.utils import timezone
+
+from .models import NetworkStats, NetworkStatsRollup
+
+ROLLUP_FIELDS = ("online", "cores", "memory", "disk", "gpus")
+AGGREGATE_COLUMNS = [
+    f"{field}_{kind}" for field in ROLLUP_FIELDS for kind in ("sum", "min", "max")
+]
+
+# Raw samples are folded into 5-minute buckets this much at a time, which keeps
+# the first (backfill) run from loading the whole table into memory.
+BACKFILL_CHUNK = timedelta(days=1)
+
+
+def bucket_start(moment, resolution):
+    """Start of the bucket of the given resolution containing ``moment``."""
+    if resolution == NetworkStatsRollup.FIVE_MINUTES:
+        return moment.replace(
+            minute=moment.minute - moment.minute % 5, second=0, microsecond=0
+        )
+    if resolution == NetworkStatsRollup.HOURLY:
+        return moment.replace(minute=0, second=0, microsecond=0)
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+class _Accumulator:
+    __slots__ = ("samples", "values")
+
+    def __init__(self):
+        self.samples = 0
+        self.values = {}
+
+    def add_sample(self, row):
+        self.samples += 1
+        for field in ROLLUP_FIELDS:
+            value = row[field] or 0
+            self._merge(field, value, value, value)
+
+    def add_rollup(self, rollup):
+        self.samples += rollup.samples
+        for field in ROLLUP_FIELDS:
+            self._merge(
+                field,
+                getattr(rollup, f"{field}_sum"),
+                getattr(rollup, f"{field}_min"),
+                getattr(rollup, f"{field}_max"),
+            )
+
+    def _merge(self, field, total, low, high):
+        current = self.values.get(field)
+        if current is None:
+            self.values[field] = [total, low, high]
+        else:
+            current[0] += total
+            current[1] = min(current[1], low)
+            current[2] = max(current[2], high)
+
+    def to_rollup(self, runtime, resolution, bucket):
+        columns = {}
+        for field, (total, low, high) in self.values.items():
+            columns[f"{field}_sum"] = total
+            columns[f"{field}_min"] = low
+            columns[f"{field}_max"] = high
+        return NetworkStatsRollup(
+            runtime=runtime,
+            resolution=resolution,
+            bucket=bucket,
+            samples=self.samples,
+            **columns,
+        )
+
+
+def _save(buckets, resolution):
+    rollups = [
+        accumulator.to_rollup(runtime, resolution, bucket)
+        for (runtime, bucket), accumulator in buckets.items()
+    ]
+    NetworkStatsRollup.objects.bulk_create(
+        rollups,
+        batch_size=1000,
+        update_conflicts=True,
+        unique_fields=["runtime", "resolution", "bucket"],
+        update_fields=["samples", *AGGREGATE_COLUMNS],
+    )
+    return len(rollups)
+
+
+def _roll_up(source_resolution, target_resolution, since):
+    """Recompute the target buckets from ``since`` out of the finer tier."""
+    start = bucket_start(since, target_resolution)
+    buckets = defaultdict(_Accumulator)
+    for rollup in NetworkStatsRollup.objects.filter(
+        resolution=source_resolution, bucket__gte=start
+    ).iterator():
+        key = (rollup.runtime, bucket_start(rollup.bucket, target_resolution))
+        buckets[key].add_rollup(rollup)
+    return _save(buckets, target_resolution)
+
+
+def refresh_network_stats_rollups(now=None):
+    """Fold raw samples newer than the last 5-minute bucket into all tiers.
+
+    The newest 5-minute bucket is recomputed along with everything after it,
+    since it was probably still filling up on the previous run. Without any
+    rollups yet this backfills from the oldest raw sample.
+    Returns the number of 5-minute buckets written.
+    """
+    now = now or timezone.now()
+    start = NetworkStatsRollup.objects.filter(
+        resolution=NetworkStatsRollup.FIVE_MINUTES
+    ).aggregate(latest=Max("bucket"))["latest"]
+    if start is None:
+        earliest = NetworkStats.objects.aggregate(earliest=Min("date"))["earliest"]
+        if earliest is None:
+            return 0
+        start = bucket_start(earliest, NetworkStatsRollup.FIVE_MINUTES)
+    since = start
+
+    written = 0
+    while True:
+        chunk_end = start + BACKFILL_CHUNK
+        last_chunk = chunk_end > now
+        rows = NetworkStats.objects.filter(date__gte=start)
+        if not last_chunk:
+            rows = rows.filter(date__lt=chunk_end)
+        buckets = defaultdict(_Accumulator)
+        for row in rows.values("runtime", "date", *ROLLUP_FIELDS).iterator():
+            key = (
+                row["runtime"],
+                bucket_start(row["date"], NetworkStatsRollup.FIVE_MINUTES),
+            )
+            buckets[key].add_sample(row)
+        written += _save(buckets, NetworkStatsRollup.FIVE_MINUTES)
+        if last_chunk:
+            break
+        start = chunk_end
+
+    _roll_up(NetworkStatsRollup.FIVE_MINUTES, NetworkStatsRollup.HOURLY, since)
+    _roll_up(NetworkStatsRollup.HOURLY, NetworkStatsRollup.DAILY, since)
+    return written
+
+
+def rollup_series(runtime, resolution, start=None, end=None):
+    """[(bucket, {field: average, ...}), ...] for the buckets overlapping the range.
+
+    Ranges start on a bucket boundary: the bucket containing ``start`` is
+    included whole. Without ``start`` the series goes back to the first bucket.
+    """
+    rollups = NetworkStatsRollup.objects.filter(runtime=runtime, resolution=resolution)
+    if start is not None:
+        rollups = rollups.filter(bucket__gte=bucket_start(start, resolution))
+    if end is not None:
+        rollups = rollups.filter(bucket__lte=end)
+    series = []
+    for rollup in rollups.order_by("bucket"):
+        series.append(
+            (
+                rollup.bucket,
+                {
+                    field: getattr(rollup, f"{field}_sum") / rollup.samples
+                    for field in ROLLUP_FIELDS
+                },
+            )
+        )
+    return series
+
+
+def rollup_runtimes(resolution, since=None):
+    rollups = NetworkStatsRollup.objects.filter(resolution=resolution)
+    if since is not None:
+        rollups = rollups.filter(bucket__gte=bucket_start(since, resolution))
+    return list(rollups.values_list("runtime", flat=True).distinct().order_by("runtime"))
@@ -1,8 +1,7 @@
 from django.db import transaction
-import urllib.parse
 from django.utils.timezone import now
-from django.db.models import Sum
-from api2.models import GolemTransactions
+from api2.transaction_facts import golem_earnings
+from core.cached_json import store_json_payload
 from collections import defaultdict
 from django.db.models.functions import TruncHour, TruncDay
 import requests
@@ -11,9 +10,11 @@ from django.db.models.functions import TruncDay
 from core.celery import app
 from celery import Celery
 import json
+import re
 import subprocess
 import os
 import statistics
+from api import prometheus
 from api.utils import get_stats_data, get_stats_data_v2
 import time
 import redis
@@ -23,6 +24,7 @@ from .models import (
     Node,
     NetworkStats,
     NetworkStatsMax,
+    NetworkStatsRollup,
     ProvidersComputing,
     NetworkAveragePricing,
     NetworkMedianPricing,
@@ -33,6 +35,8 @@ from .models import (
     Requestors,
     requestor_scraper_check,
 )
+from .retention import compact_raw_samples
+from .rollups import bucket_start, refresh_network_stats_rollups
 
 from api2.models import Node as Nodev2, Offer
 from django.db.models import Max, Avg, Min
@@ -75,7 +79,8 @@ def requests_served():
     obj = APIHits.objects.get(id=1)
     jsondata = {"count": obj.count}
     serialized = json.dumps(jsondata)
-    r.set("api_requests", serialized)
+    # Not on a schedule, so no promise of when it changes next.
+    store_json_payload(r, "api_requests", serialized, max_age=0)
 
 
 @app.task
@@ -83,53 +88,48 @@ def requestors_to_redis():
     query = Requestors.objects.all().order_by("-tasks_requested")
     serializer = RequestorSerializer(query, many=True)
     data = json.dumps(serializer.data)
-    r.set("requestors", data)
+    store_json_payload(r, "requestors", data, max_age=10)
 
 
 @app.task
 def stats_snapshot_yesterday():
-    start_date = date.today() - timedelta(days=1)
-    date_trunc_day = TruncDay("date", output_field=DateField())
-
-    online = (
-        NetworkStats.objects.filter(date__gte=start_date, runtime="vm")
-        .annotate(day=date_trunc_day)
-        .values("day")
-        .annotate(online=Max("online"))
-    )
-    cores = (
-        NetworkStats.objects.filter(date__gte=start_date, runtime="vm")
-        .annotate(day=date_trunc_day)
-        .values("day")
-        .annotate(cores=Max("cores"))
+    # Daily maxima come straight from the daily rollup buckets (see
+    # collector/rollups.py) instead of four MAX() scans over raw samples.
+    # Refresh first so the last minutes of yesterday are in.
+    refresh_network_stats_rollups()
+    start_date = bucket_start(timezone.now(), NetworkStatsRollup.DAILY) - timedelta(
+        days=1
     )
-    memory = (
-        NetworkStats.objects.filter(date__gte=start_date, runtime="vm")
-        .annotate(day=date_trunc_day)
-        .values("day")
-        .annotate(memory=Max("memory"))
-    )
-    disk = (
-        NetworkStats.objects.filter(date__gte=start_date, runtime="vm")
-        .annotate(day=date_trunc_day)
-        .values("day")
-        .annotate(disk=Max("disk"))
+    rollups = NetworkStatsRollup.objects.filter(
+        runtime="vm", resolution=NetworkStatsRollup.DAILY, bucket__gte=start_date
     )
+    for rollup in rollups:
+        NetworkStatsMax.objects.get_or_create(
+            runtime="vm",
+            date=rollup.bucket,
+            defaults={
+                "online": int(rollup.online_max),
+                "cores": int(rollup.cores_max),
+                "memory": rollup.memory_max,
+                "disk": rollup.disk_max,
+            },
+        )
 
-    existing_dates = NetworkStatsMax.objects.filter(runtime="vm").values_list(
-        "date", flat=True
-    )
 
-    for online_obj, cores_obj, memory_obj, disk_obj in zip(online, cores, memory, disk):
-        current_date = online_obj["day"]
-        if current_date not in existing_dates:
-            NetworkStatsMax.objects.create(
-                online=online_obj["online"],
-                cores=cores_obj["cores"],
-                memory=memory_obj["memory"],
-                disk=disk_obj["disk"],
-                date=current_date,
-            )
+@app.task
+def network_stats_rollups():
+    refresh_network_stats_rollups()
+
+
+@app.task
+def compact_raw_samples_task():
+    report = compact_raw_samples()
+    for table, counts in report.items():
+        print(
+            f"{table}: {counts['compacted']} summary rows written, "
+            f"{counts['deleted']} raw rows deleted"
+        )
+    return report
 
 
 @app.task
@@ -245,7 +245,7 @@ def network_average_pricing():
         cpuh=cpuhour_avg,
         perh=perhour_avg,
     )
-    r.set("network_average_pricing", serialized)
+    store_json_payload(r, "network_average_pricing", serialized, max_age=15)
 
 
 @app.task
@@ -299,7 +299,7 @@ def network_median_pricing():
         cpuh=statistics.median(cpuhour),
         perh=statistics.median(perhour),
     )
-    r.set("network_median_pricing", serialized)
+    store_json_payload(r, "network_median_pricing", serialized, max_age=15)
 
 
 @app.task
@@ -315,22 +315,22 @@ def max_stats():
     data = ProvidersComputingMax.objects.all()
     serializercomputing = ProvidersComputingMaxSerializer(data, many=True)
     providermax = json.dumps(serializercomputing.data)
-    r.set("providers_computing_max", providermax)
+    store_json_payload(r, "providers_computing_max", providermax, max_age=3600)
 
     data2 = NetworkAveragePricingMax.objects.all()
     serializeravg = NetworkAveragePricingMaxSerializer(data2, many=True)
     avgmax = json.dumps(serializeravg.data)
-    r.set("pricing_average_max", avgmax)
+    store_json_payload(r, "pricing_average_max", avgmax, max_age=3600)
 
     data3 = NetworkMedianPricingMax.objects.all()
     serializermedian = NetworkMedianPricingMaxSerializer(data3, many=True)
     medianmax = json.dumps(serializermedian.data)
-    r.set("pricing_median_max", medianmax)
+    store_json_payload(r, "pricing_median_max", medianmax, max_age=3600)
 
     data4 = NetworkStatsMax.objects.filter(runtime="vm")
     serializerstats = NetworkStatsMaxSerializer(data4, many=True)
     statsmax = json.dumps(serializerstats.data)
-    r.set("stats_max", statsmax)
+    store_json_payload(r, "stats_max", statsmax, max_age=3600)
 
 
 @app.task
@@ -379,7 +379,7 @@ def network_stats_to_redis():
 
     serialized = json.dumps(content)
 
-    r.set("online_stats", serialized)
+    store_json_payload(r, "online_stats", serialized, max_age=10)
 
 
 @app.task
@@ -390,7 +390,7 @@ def networkstats_30m():
         date__range=(before, now), runtime="vm"
     ).order_by("date")
     serializer = NetworkStatsSerializer(data, many=True)
-    r.set("stats_30m", json.dumps(serializer.data))
+    store_json_payload(r, "stats_30m", json.dumps(serializer.data))
 
 
 @app.task
@@ -410,7 +410,7 @@ def network_utilization_to_redis():
         [int(row.date.timestamp()), str(row.total)] for row in rows[::3]
     ]
     serialized = json.dumps({"data": {"result": [{"values": values}]}})
-    r.set("network_utilization", serialized)
+    store_json_payload(r, "network_utilization", serialized, max_age=10)
 
 
 @app.task
@@ -541,7 +541,7 @@ def network_versions_to_redis():
         )
 
     serialized = json.dumps(versions)
-    r.set("network_versions", serialized)
+    store_json_payload(r, "network_versions", serialized, max_age=30)
 
 @app.task
 def fetch_yagna_release():
@@ -572,25 +572,22 @@ def fetch_yagna_release():
             url = None
 
     serialized = json.dumps(releases_info)
-    r.set("yagna_releases", serialized)
+    store_json_payload(r, "yagna_releases", serialized, max_age=3600)
 
 
 
 
 @app.task
 def network_earnings_overview_new():
+    # Summed from the hourly/daily transaction facts (api2/transaction_facts.py);
+    # only the partial hours at the ends of each window read raw transfers.
     time_frames = [6, 24, 168, 720, 2160]
     response_data = {}
+    end_time = now()
 
     for frame in time_frames:
-        end_time = now()
         start_time = end_time - timedelta(hours=frame)
-        total_earnings = (
-            GolemTransactions.objects.filter(
-                timestamp__range=[start_time, end_time], tx_from_golem=True
-            ).aggregate(Sum("amount"))["amount__sum"]
-            or 0.0
-        )
+        total_earnings = golem_earnings(start_time, end_time, end_time)
 
         response_data[f"network_earnings_{frame}h"] = {
             "total_earnings": float(total_earnings)
@@ -600,12 +597,7 @@ def network_earnings_overview_new():
 
     min_timestamp = datetime.fromtimestamp(1768937740, tz=timezone.utc)
 
-    all_time_earnings = float(
-            GolemTransactions.objects.filter(tx_from_golem=True, timestamp__gte=min_timestamp).aggregate(Sum("amount"))[
-                "amount__sum"
-            ]
-            or 0.0
-    )
+    all_time_earnings = float(golem_earnings(min_timestamp, end_time, end_time))
 
     if all_time_earnings > 0:
         all_time_earnings += 264342.50 # manually added earnings before 2026-01-20
@@ -614,7 +606,7 @@ def network_earnings_overview_new():
         "total_earnings": float(all_time_earnings)
     }
 
-    r.set("network_earnings_overview_new", json.dumps(response_data))
+    store_json_payload(r, "network_earnings_overview_new", json.dumps(response_data))
 
 
 def update_total_earnings(domain):
@@ -631,7 +623,8 @@ def update_total_earnings(domain):
             db.save()
             content = {"total_earnings": db.total_earnings}
             serialized = json.dumps(content)
-            r.set("network_total_earnings", serialized)
+            # Not on a schedule, so no promise of when it changes next.
+            store_json_payload(r, "network_total_earnings", serialized, max_age=0)
 
 
 @app.task
@@ -643,7 +636,7 @@ def computing_now_to_redis():
     total = Nodev2.objects.filter(online=True, computing_now=True).count()
     content = {"computing_now": total}
     ProvidersComputing.objects.create(total=total)
-    r.set("computing_now", json.dumps(content))
+    store_json_payload(r, "computing_now", json.dumps(content), max_age=10)
 
 
 @app.task
@@ -653,12 +646,14 @@ def providers_average_earnings_to_redis():
     end = round(time.time())
     total_average_earnings = 0.0
 
-    for platform in platforms:
-        domain = (
-            os.environ.get("STATS_URL")
-            + f'api/datasources/uid/dec5owmc8gt8ge/resources/api/v1/query?query=avg(increase(payment_amount_received%7Bexported_job%3D~"{settings.GRAFANA_JOB_NAME}"%2C%20platform%3D"{platform}"%7D%5B24h%5D)%2F10%5E9)&time={end}'
-        )
-        data = get_stats_data(domain)
+    results = prometheus.query_many(
+        [
+            f'avg(increase(payment_amount_received{{exported_job=~"{settings.GRAFANA_JOB_NAME}", platform="{platform}"}}[24h])/10^9)'
+            for platform in platforms
+        ],
+        at=end,
+    )
+    for data in results:
         if data[1] == 200 and data[0]["data"]["result"]:
             platform_average = round(
                 float(data[0]["data"]["result"][0]["value"][1]), 4)
@@ -668,7 +663,7 @@ def providers_average_earnings_to_redis():
 
     content = {"average_earnings": total_average_earnings}
     serialized = json.dumps(content)
-    r.set("provider_average_earnings", serialized)
+    store_json_payload(r, "provider_average_earnings", serialized, max_age=10)
 
 
 @app.task
@@ -685,7 +680,7 @@ def paid_invoices_1h():
                 "percentage_paid": float(data[0]["data"]["result"][0]["value"][1]) * 100
             }
             serialized = json.dumps(content)
-            r.set("paid_invoices_1h", serialized)
+            store_json_payload(r, "paid_invoices_1h", serialized, max_age=15)
 
 
 @app.task
@@ -705,64 +700,64 @@ def provider_accepted_invoices_1h():
                 * 100
             }
             serialized = json.dumps(content)
-            r.set("provider_accepted_invoice_percentage", serialized)
+            store_json_payload(r, "provider_accepted_invoice_percentage", serialized, max_age=15)
 
 
-def get_earnings_for_node_on_platform(user_node_id, platform):
-    now = round(time.time())
-    domain = (
-        os.environ.get("STATS_URL")
-        + f'api/datasources/uid/dec5owmc8gt8ge/resources/api/v1/query?query=sum(increase(payment_amount_received%7Bhostname%3D~"{user_node_id}"%2C%20platform%3D"{platform}"%7D%5B10m%5D)%2F10%5E9)&time={now}'
+def earnings_by_node(at=None):
+    """{hostname: GLM received in the 10 minutes before ``at``} over the mainnet platforms.
+
+    One query for the whole network instead of one per node and platform;
+    each platform's amount is rounded to 2 decimals, as those queries were.
+    """
+    # Escaped for the regex, then its backslashes for the PromQL string.
+    platforms = "|".join(
+        re.escape(platform).replace("\\", "\\\\")
+        for platform in settings.GOLEM_MAINNET_PAYMENT_DRIVERS
     )
-    data = get_stats_data(domain)
+    query = (
+        f'sum by (hostname, platform) (increase(payment_amount_received{{platform=~"{platforms}"}}[10m])/10^9)'
+    )
+    data = prometheus.query(query, at=at)
+    earnings = defaultdict(float)
     try:
-        if data[0]["data"]["result"]:
-            return round(float(data[0]["data"]["result"][0]["value"][1]), 2)
-        else:
-            return 0.0
+        for series in data[0]["data"]["result"]:
+            hostname = series["metric"].get("hostname")
+            if hostname:
+                earnings[hostname] += round(float(series["value"][1]), 2)
     except Exception as e:
-        print(f"Error getting data for {user_node_id} on {platform}", e)
-        return 0.0
+        print("Error getting node earnings", e)
+        return {}
+    return earnings
+
+
+def _add_node_earnings(model, earnings):
+    providers = model.objects.filter(online=True).values_list(
+        "pk", "node_id", "earnings_total"
+    )
+    model.objects.bulk_update(
+        [
+            model(
+                pk=pk,
+                earnings_total=(
+                    earnings_total + earnings.get(node_id, 0.0)
+                    if earnings_total
+                    else earnings.get(node_id, 0.0)
+                ),
+            )
+            for pk, node_id, earnings_total in providers
+        ],
+        ["earnings_total"],
+    )
 
 
 @app.task
-def node_earnings_total(node_version):
-    if node_version == "v1":
-        providers = Node.objects.filter(
-            online=True).only("node_id", "earnings_total")
-    elif node_version == "v2":
-        providers = Nodev2.objects.filter(
-            online=True).only("node_id", "earnings_total")
-
-    providers_updates = []
-    for provider in providers:
-        earnings_total = sum(
-            get_earnings_for_node_on_platform(provider.node_id, platform)
-            for platform in settings.GOLEM_MAINNET_PAYMENT_DRIVERS
-        )
-        updated_earnings_total = (
-            provider.earnings_total + earnings_total
-            if provider.earnings_total
-            else earnings_total
-        )
-        providers_updates.append((provider.pk, updated_earnings_total))
-
-    if node_version == "v1":
-        Node.objects.bulk_update(
-            [
-                Node(pk=pk, earnings_total=earnings)
-                for pk, earnings in providers_updates
-            ],
-            ["earnings_total"],
-        )
-    elif node_version == "v2":
-        Nodev2.objects.bulk_update(
-            [
-                Nodev2(pk=pk, earnings_total=earnings)
-                for pk, earnings in providers_updates
-            ],
-            ["earnings_total"],
-        )
+def node_earnings_total(node_version=None):
+    # Both node tables are updated from the same query unless one is named.
+    earnings = earnings_by_node()
+    if node_version in (None, "v1"):
+        _add_node_earnings(Node, earnings)
+    if node_version in (None, "v2"):
+        _add_node_earnings(Nodev2, earnings)
 
 
 @app.task
@@ -779,20 +774,21 @@ def market_agreement_termination_reasons():
         "RequestorUnreachable": "market_agreements_requestorUnreachable",
         "DebitNotesDeadline": "market_agreements_debitnoteDeadline",
     }
+    results = prometheus.query_many(
+        [
+            f'sum(increase(market_agreements_provider_terminated_reason{{exported_job="{settings.GRAFANA_JOB_NAME}", reason="{reason}"}}[1h]))'
+            for reason in reasons
+        ],
+        at=end,
+    )
     content = {}
-    for reason, key in reasons.items():
-        query = f'sum(increase(market_agreements_provider_terminated_reason{{exported_job="{settings.GRAFANA_JOB_NAME}", reason="{reason}"}}[1h]))'
-        domain = (
-            os.environ.get("STATS_URL")
-            + f"api/datasources/uid/dec5owmc8gt8ge/resources/api/v1/query?query={urllib.parse.quote(query)}&time={end}"
-        )
-        data = get_stats_data(domain)
+    for key, data in zip(reasons.values(), results):
         content[key] = 0
         if data[1] == 200 and data[0]["data"]["result"]:
             content[key] = round(
                 float(data[0]["data"]["result"][0]["value"][1]))
     serialized = json.dumps(content)
-    r.set("market_agreement_termination_reasons", serialized)
+    store_json_payload(r, "market_agreement_termination_reasons", serialized, max_age=15)
 
 
 @app.task
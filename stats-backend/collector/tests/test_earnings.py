@@ -0,0 +1,77 @@
+from unittest.mock import patch
+
+from django.test import TestCase, override_settings
+
+from api2.models import Node as Nodev2
+from collector.models import Node
+from collector.tasks import earnings_by_node, node_earnings_total
+
+
+def earnings_response(*series):
+    return [
+        {
+            "status": "success",
+            "data": {
+                "result": [
+                    {"metric": {"hostname": hostname, "platform": platform}, "value": [0, value]}
+                    for hostname, platform, value in series
+                ]
+            },
+        },
+        200,
+    ]
+
+
+@override_settings(GOLEM_MAINNET_PAYMENT_DRIVERS=["erc20-polygon-glm", "erc20-mainnet-glm"])
+class NodeEarningsTotalTests(TestCase):
+    def setUp(self):
+        self.response = earnings_response(
+            ("0xaaa", "erc20-polygon-glm", "1.004"),
+            ("0xaaa", "erc20-mainnet-glm", "0.5"),
+            ("0xbbb", "erc20-polygon-glm", "2.25"),
+            ("0xoffline", "erc20-polygon-glm", "9"),
+        )
+
+    def test_earnings_are_summed_per_node_from_one_query(self):
+        with patch("collector.tasks.prometheus.query", return_value=self.response) as query:
+            earnings = earnings_by_node(at=1000)
+
+        query.assert_called_once()
+        promql = query.call_args.args[0]
+        self.assertIn("sum by (hostname, platform)", promql)
+        self.assertIn(r'platform=~"erc20\\-polygon\\-glm|erc20\\-mainnet\\-glm"', promql)
+        self.assertEqual(query.call_args.kwargs, {"at": 1000})
+        self.assertEqual(dict(earnings), {"0xaaa": 1.5, "0xbbb": 2.25, "0xoffline": 9.0})
+
+    @override_settings(GOLEM_MAINNET_PAYMENT_DRIVERS=["erc20.polygon-glm"])
+    def test_platform_names_are_matched_literally(self):
+        with patch("collector.tasks.prometheus.query", return_value=self.response) as query:
+            earnings_by_node()
+
+        # A regex-escaped dot, its backslash escaped again inside the PromQL string.
+        self.assertIn(r'platform=~"erc20\\.polygon\\-glm"', query.call_args.args[0])
+
+    def test_both_node_tables_are_updated_from_a_single_query(self):
+        for model in (Node, Nodev2):
+            model.objects.create(node_id="0xaaa", online=True, earnings_total=10.0)
+            model.objects.create(node_id="0xbbb", online=True)
+            model.objects.create(node_id="0xccc", online=True, earnings_total=4.0)
+            model.objects.create(node_id="0xoffline", online=False, earnings_total=1.0)
+
+        with patch("collector.tasks.prometheus.query", return_value=self.response) as query:
+            node_earnings_total()
+
+        query.assert_called_once()
+        for model in (Node, Nodev2):
+            self.assertEqual(
+                dict(model.objects.values_list("node_id", "earnings_total")),
+                {"0xaaa": 11.5, "0xbbb": 2.25, "0xccc": 4.0, "0xoffline": 1.0},
+            )
+
+    def test_failed_query_leaves_totals_unchanged(self):
+        Nodev2.objects.create(node_id="0xaaa", online=True, earnings_total=10.0)
+
+        with patch("collector.tasks.prometheus.query", return_value=[{"status": "error"}, 503]):
+            node_earnings_total(node_version="v2")
+
+        self.assertEqual(Nodev2.objects.get(node_id="0xaaa").earnings_total, 10.0)
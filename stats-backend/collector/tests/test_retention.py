@@ -0,0 +1,137 @@
+import json
+from datetime import timedelta
+from unittest.mock import patch
+
+import fakeredis
+from django.db.models import Max
+from django.db.models.functions import TruncDay
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from collector.models import NetworkStats, ProvidersComputing, ProvidersComputingMax
+from collector.retention import compact_raw_samples, retention_cutoff
+from collector.rollups import refresh_network_stats_rollups
+
+
+def backdate(model, row, when):
+    model.objects.filter(pk=row.pk).update(date=when)
+
+
+@override_settings(RAW_SAMPLE_RETENTION_DAYS=10, RAW_SAMPLE_DELETE_BATCH=7)
+class RawSampleRetentionTests(TestCase):
+    def setUp(self):
+        self.now = timezone.now()
+        # 20 days of samples every 3 hours; "wasmtime" stopped reporting 15 days ago.
+        for i in range(20 * 8):
+            when = self.now - timedelta(hours=3 * i + 1)
+            runtimes = ("vm", "wasmtime") if i >= 15 * 8 else ("vm",)
+            for runtime in runtimes:
+                stat = NetworkStats.objects.create(
+                    online=5 + i % 7,
+                    cores=40 + i % 11,
+                    memory=2048.0 + i,
+                    disk=4096.0 * (i % 3 + 1),
+                    gpus=i % 2,
+                    runtime=runtime,
+                )
+                backdate(NetworkStats, stat, when)
+            computing = ProvidersComputing.objects.create(total=i % 23)
+            backdate(ProvidersComputing, computing, when)
+        refresh_network_stats_rollups(now=self.now)
+        self.daily_maxima = {
+            row["day"]: row["total"]
+            for row in ProvidersComputing.objects.annotate(day=TruncDay("date"))
+            .values("day")
+            .annotate(total=Max("total"))
+        }
+
+    def record_snapshots(self, skip=()):
+        """What computing_snapshot_yesterday would have written every night."""
+        for day, total in self.daily_maxima.items():
+            if day not in skip:
+                ProvidersComputingMax.objects.create(date=day, total=total)
+
+    def chart_payloads(self):
+        from api2.tasks import (
+            computing_total_over_time,
+            network_historical_stats_to_redis_v2,
+        )
+
+        cache = fakeredis.FakeRedis()
+        with patch("api2.tasks.r", cache), patch(
+            "django.utils.timezone.now", return_value=self.now
+        ):
+            network_historical_stats_to_redis_v2()
+            computing_total_over_time()
+            v1_computing = self.v1_computing()
+        payloads = {
+            key: json.loads(cache.get(key))
+            for key in (
+                "network_historical_stats_v2",
+                "network_historical_stats_v2_columnar",
+                "computing_total_over_time",
+            )
+        }
+        payloads["v1_computing"] = v1_computing
+        return payloads
+
+    def v1_computing(self):
+        return [
+            (row["date"], row["total"])
+            for row in self.client.get("/v1/network/historical/stats/computing").json()
+        ]
+
+    def test_charts_unchanged_by_compaction(self):
+        self.record_snapshots()
+        before = self.chart_payloads()
+        report = compact_raw_samples(now=self.now)
+        after = self.chart_payloads()
+
+        self.assertEqual(before, after)
+        cutoff = retention_cutoff(self.now)
+        self.assertFalse(
+            NetworkStats.objects.filter(date__lt=cutoff, runtime="vm").exists()
+        )
+        # The last wasmtime sample ends that runtime's series, so it is kept.
+        self.assertEqual(
+            NetworkStats.objects.filter(date__lt=cutoff, runtime="wasmtime").count(), 1
+        )
+        self.assertFalse(ProvidersComputing.objects.filter(date__lt=cutoff).exists())
+        self.assertEqual(report["ProvidersComputing"]["compacted"], 0)
+        self.assertEqual(
+            report["ProvidersComputing"]["deleted"],
+            sum(1 for day in range(20 * 8) if self.now - timedelta(hours=3 * day + 1) < cutoff),
+        )
+        self.assertGreater(report["NetworkStats"]["deleted"], 0)
+
+    def test_v1_computing_merges_raw_samples_and_older_maxima_by_total(self):
+        self.record_snapshots()
+        cutoff = retention_cutoff(self.now)
+        raw = list(ProvidersComputing.objects.filter(date__gte=cutoff))
+        maxima = list(ProvidersComputingMax.objects.filter(date__lt=cutoff))
+
+        def by_total(rows):
+            rows = sorted(rows, key=lambda row: (row.total, row.date), reverse=True)
+            return [(row.date.isoformat().replace("+00:00", "Z"), row.total) for row in rows]
+
+        with patch("django.utils.timezone.now", return_value=self.now):
+            self.assertEqual(self.v1_computing(), by_total(raw + maxima))
+            # After a full compaction, nothing but the maxima is left.
+            ProvidersComputing.objects.all().delete()
+            self.assertEqual(self.v1_computing(), by_total(maxima))
+
+    def test_days_missed_by_the_snapshot_are_summarised_before_deletion(self):
+        missed = retention_cutoff(self.now) - timedelta(days=3)
+        self.record_snapshots(skip={missed})
+
+        report = compact_raw_samples(now=self.now)
+
+        self.assertEqual(report["ProvidersComputing"]["compacted"], 1)
+        self.assertEqual(
+            ProvidersComputingMax.objects.get(date=missed).total,
+            self.daily_maxima[missed],
+        )
+
+    @override_settings(RAW_SAMPLE_RETENTION_DAYS=1)
+    def test_retention_never_drops_below_the_raw_chart_window(self):
+        self.assertLessEqual(retention_cutoff(self.now), self.now - timedelta(days=7))
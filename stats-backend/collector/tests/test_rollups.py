@@ -0,0 +1,111 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.db.models import Avg, Max
+from django.db.models.functions import TruncDay, TruncHour
+from django.test import TestCase
+
+from collector.models import NetworkStats, NetworkStatsMax, NetworkStatsRollup
+from collector.rollups import (
+    refresh_network_stats_rollups,
+    rollup_runtimes,
+    rollup_series,
+)
+
+START = datetime(2024, 3, 1, 22, 0, tzinfo=dt_timezone.utc)
+
+
+def add_samples(start, count, runtime="vm", step=timedelta(minutes=7)):
+    """NetworkStats rows every ``step`` from ``start``; ``date`` is auto_now."""
+    for i in range(count):
+        stat = NetworkStats.objects.create(
+            online=10 + i % 13,
+            cores=100 + i % 17,
+            memory=1024.0 * (i % 5 + 1),
+            disk=2048.0 * (i % 3 + 1),
+            gpus=i % 4,
+            runtime=runtime,
+        )
+        NetworkStats.objects.filter(pk=stat.pk).update(date=start + step * i)
+
+
+class NetworkStatsRollupTests(TestCase):
+    def setUp(self):
+        add_samples(START, 600)
+        add_samples(START, 50, runtime="wasmtime", step=timedelta(minutes=31))
+        self.now = START + timedelta(days=4)
+
+    def assertMatchesRaw(self, resolution, trunc):
+        raw = {
+            (row["runtime"], row["bucket"]): row
+            for row in NetworkStats.objects.annotate(bucket=trunc("date"))
+            .values("runtime", "bucket")
+            .annotate(avg_online=Avg("online"), avg_memory=Avg("memory"), max_cores=Max("cores"))
+        }
+        rollups = NetworkStatsRollup.objects.filter(resolution=resolution)
+        self.assertEqual(len(rollups), len(raw))
+        for rollup in rollups:
+            expected = raw[(rollup.runtime, rollup.bucket)]
+            self.assertAlmostEqual(rollup.online_sum / rollup.samples, expected["avg_online"])
+            self.assertAlmostEqual(rollup.memory_sum / rollup.samples, expected["avg_memory"])
+            self.assertEqual(rollup.cores_max, expected["max_cores"])
+
+    def test_tiers_match_raw_aggregates(self):
+        refresh_network_stats_rollups(now=self.now)
+
+        self.assertMatchesRaw(NetworkStatsRollup.HOURLY, TruncHour)
+        self.assertMatchesRaw(NetworkStatsRollup.DAILY, TruncDay)
+
+    def test_incremental_refresh_equals_full_rebuild(self):
+        cutoff = START + timedelta(hours=20, minutes=2)
+        later = list(NetworkStats.objects.filter(date__gt=cutoff).values())
+        NetworkStats.objects.filter(date__gt=cutoff).delete()
+        refresh_network_stats_rollups(now=cutoff)
+
+        for row in later:
+            NetworkStats.objects.create(**row)
+        for row in later:
+            NetworkStats.objects.filter(pk=row["id"]).update(date=row["date"])
+        refresh_network_stats_rollups(now=self.now)
+        incremental = sorted(
+            NetworkStatsRollup.objects.values_list("runtime", "resolution", "bucket", "samples", "online_sum")
+        )
+
+        NetworkStatsRollup.objects.all().delete()
+        refresh_network_stats_rollups(now=self.now)
+        rebuilt = sorted(
+            NetworkStatsRollup.objects.values_list("runtime", "resolution", "bucket", "samples", "online_sum")
+        )
+        self.assertEqual(incremental, rebuilt)
+
+    def test_series_and_runtimes(self):
+        refresh_network_stats_rollups(now=self.now)
+
+        self.assertEqual(rollup_runtimes(NetworkStatsRollup.DAILY), ["vm", "wasmtime"])
+        self.assertEqual(
+            rollup_runtimes(NetworkStatsRollup.HOURLY, since=START + timedelta(days=2)),
+            ["vm"],
+        )
+        series = rollup_series("vm", NetworkStatsRollup.DAILY, START + timedelta(hours=5))
+        self.assertEqual(
+            [bucket for bucket, _ in series],
+            [START.replace(hour=0) + timedelta(days=d) for d in range(1, 4)],
+        )
+
+    def test_snapshot_yesterday_reads_daily_maxima(self):
+        from unittest.mock import patch
+
+        from collector.tasks import stats_snapshot_yesterday
+
+        refresh_network_stats_rollups(now=self.now)
+        with patch("django.utils.timezone.now", return_value=START + timedelta(hours=3)):
+            stats_snapshot_yesterday()
+            stats_snapshot_yesterday()
+
+        day = START.replace(hour=0)
+        maxima = NetworkStatsMax.objects.order_by("date")
+        self.assertEqual(
+            [m.date for m in maxima], [day + timedelta(days=d) for d in range(4)]
+        )
+        raw = NetworkStats.objects.filter(runtime="vm", date__gte=day, date__lt=day + timedelta(days=1))
+        self.assertEqual(maxima[0].online, raw.aggregate(m=Max("online"))["m"])
+        self.assertEqual(maxima[0].memory, raw.aggregate(m=Max("memory"))["m"])
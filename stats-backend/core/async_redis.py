@@ -0,0 +1,46 @@
+"""
+One asyncio Redis client per event loop, shared by the async views.
+
+The views used to build a ConnectionPool for every request, open a connection
+for a single GET and tear it down again, or leave that to the garbage
+collector. get_async_redis returns a client whose pool is created the first
+time it is needed on the running loop and reused by every later request on
+it. The pool is bounded by ASYNC_REDIS_MAX_CONNECTIONS; when all of its
+connections are busy a request waits for one to be released instead of
+opening another.
+
+Connections belong to the loop they were opened on, hence one client per
+loop. daphne serves every request from a single loop; async_to_sync (the
+test client, management commands) runs each call on a loop of its own,
+whose client is dropped once the loop is closed.
+
+Values come back as bytes, so cached payloads can be sent on without being
+decoded first (see core/cached_json.py).
+"""
+
+import asyncio
+
+from django.conf import settings
+from redis import asyncio as aioredis
+
+_clients = {}
+
+
+def _new_client():
+    pool = aioredis.BlockingConnectionPool.from_url(
+        settings.REDIS_URL,
+        max_connections=settings.ASYNC_REDIS_MAX_CONNECTIONS,
+        timeout=settings.ASYNC_REDIS_POOL_TIMEOUT,
+    )
+    return aioredis.Redis(connection_pool=pool)
+
+
+def get_async_redis():
+    """The shared client for the running event loop."""
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None:
+        for closed in [other for other in _clients if other.is_closed()]:
+            del _clients[closed]
+        client = _clients[loop] = _new_client()
+    return client
@@ -0,0 +1,207 @@
+"""
+JSON payloads that tasks serialize into Redis for the views to serve.
+
+The views used to json.loads the stored string and encode it again through
+JsonResponse with indent=4, which costs CPU in proportion to the payload
+(v2_online is megabytes) and makes the response about a third larger.
+cached_json_response sends the stored bytes as they are. ``?pretty=1`` still
+gets the indented form for people reading the API in a browser.
+
+Producers store their payloads with store_json_payload, which also writes
+compressed variants next to the key, compressed once per refresh rather than
+once per request:
+
+    <key>           the JSON itself
+    <key>:gzip      gzip, for payloads of at least COMPRESS_MIN_BYTES
+    <key>:br        brotli, likewise, when the brotli package is installed
+    <key>:meta      hash of "sha256" (of the JSON), "encodings" (the
+                    variants stored, comma separated), "generated_at" (epoch
+                    seconds) and "max_age" (seconds until the producer's next
+                    scheduled run)
+
+All of them are written in one MULTI. The meta is read before the body, so
+a response may carry the validators of the run before the one whose body it
+sends, never a newer one; at worst the client downloads the body again.
+
+Dashboards poll far more often than the tasks refresh, so responses carry a
+weak ETag (the digest, shared by all encodings), Last-Modified and a
+Cache-Control max-age lasting until the next refresh, and conditional
+requests for an unchanged payload get a 304 without the body being read.
+Keys written without meta are served as plain JSON without validators.
+"""
+
+import gzip
+import hashlib
+import json
+import time
+
+from django.http import HttpResponse, HttpResponseNotModified, JsonResponse
+from django.utils.http import http_date, parse_etags, parse_http_date_safe
+
+from .async_redis import get_async_redis
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Below this the compressed variant saves less than the headers it needs.
+COMPRESS_MIN_BYTES = 1024
+
+# Stored variants, in order of preference.
+ENCODINGS = ("br", "gzip")
+
+# Most producers run every minute; those on another schedule say so.
+DEFAULT_MAX_AGE = 60
+
+_MISSING = object()
+
+PRETTY_VALUES = {"1", "true", "yes"}
+
+
+def _compress(content):
+    variants = {}
+    if len(content) >= COMPRESS_MIN_BYTES:
+        if brotli is not None:
+            variants["br"] = brotli.compress(content, quality=9)
+        variants["gzip"] = gzip.compress(content, compresslevel=9)
+    return variants
+
+
+def store_json_payload(redis_client, key, content, max_age=DEFAULT_MAX_AGE):
+    """Store serialized JSON under ``key`` with its variants and meta.
+
+    ``max_age`` is how often the producer runs, in seconds.
+    """
+    if isinstance(content, str):
+        content = content.encode()
+    variants = _compress(content)
+    pipe = redis_client.pipeline(transaction=True)
+    pipe.set(key, content)
+    for encoding in ENCODINGS:
+        if encoding in variants:
+            pipe.set(f"{key}:{encoding}", variants[encoding])
+        else:
+            pipe.delete(f"{key}:{encoding}")
+    pipe.hset(
+        f"{key}:meta",
+        mapping={
+            "sha256": hashlib.sha256(content).hexdigest(),
+            "encodings": ",".join(e for e in ENCODINGS if e in variants),
+            "generated_at": repr(time.time()),
+            "max_age": max_age,
+        },
+    )
+    pipe.execute()
+
+
+def accepted_encodings(request):
+    """Content codings the client accepts, ignoring those it gives q=0."""
+    accepted = set()
+    for part in request.headers.get("Accept-Encoding", "").split(","):
+        coding, *params = (piece.strip() for piece in part.split(";"))
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if coding and quality > 0:
+            accepted.add(coding.lower())
+    if "*" in accepted:
+        accepted.update(ENCODINGS)
+    return accepted
+
+
+def _validators(meta, now):
+    """ETag, Last-Modified and Cache-Control headers from a key's meta."""
+    generated_at = float(meta[b"generated_at"])
+    remaining = generated_at + int(meta[b"max_age"]) - now
+    return {
+        "ETag": f'W/"{meta[b"sha256"].decode()}"',
+        "Last-Modified": http_date(generated_at),
+        "Cache-Control": f"max-age={max(int(remaining), 0)}",
+    }
+
+
+def _not_modified(request, headers):
+    if_none_match = request.headers.get("If-None-Match")
+    if if_none_match is not None:
+        # Weak comparison, as GET allows.
+        if if_none_match.strip() == "*":
+            return True
+        etag = headers["ETag"].removeprefix("W/")
+        return any(
+            candidate.removeprefix("W/") == etag
+            for candidate in parse_etags(if_none_match)
+        )
+    if_modified_since = parse_http_date_safe(
+        request.headers.get("If-Modified-Since", "")
+    )
+    last_modified = parse_http_date_safe(headers["Last-Modified"])
+    return if_modified_since is not None and last_modified <= if_modified_since
+
+
+def wants_pretty(request):
+    return request.GET.get("pretty", "").lower() in PRETTY_VALUES
+
+
+def json_payload_response(request, content, encoding=None):
+    """A response for an already serialized JSON document.
+
+    ``content`` is compressed with ``encoding`` when one is given.
+    """
+    if wants_pretty(request):
+        return JsonResponse(
+            json.loads(content), safe=False, json_dumps_params={"indent": 4}
+        )
+    response = HttpResponse(content, content_type="application/json")
+    if encoding is not None:
+        response["Content-Encoding"] = encoding
+    return response
+
+
+async def cached_json_response(request, key, default=_MISSING, missing_status=500):
+    """Serve the JSON stored under ``key``, precompressed when possible.
+
+    When the key is missing, ``default`` is served instead if given;
+    otherwise the response is an error with ``missing_status``. The default
+    500 is what these views answered when they failed to decode a missing
+    payload.
+    """
+    r = get_async_redis()
+    content, encoding, headers = None, None, {}
+    meta = await r.hgetall(f"{key}:meta")
+    if b"generated_at" in meta and not wants_pretty(request):
+        headers = _validators(meta, time.time())
+        if _not_modified(request, headers):
+            response = HttpResponseNotModified()
+            for name, value in headers.items():
+                response[name] = value
+            response["Vary"] = "Accept-Encoding"
+            return response
+    if meta and not wants_pretty(request):
+        stored = meta.get(b"encodings", b"").decode().split(",")
+        accepted = accepted_encodings(request)
+        for candidate in ENCODINGS:
+            if candidate in stored and candidate in accepted:
+                # A newer run may have stopped storing it since.
+                content = await r.get(f"{key}:{candidate}")
+                if content is not None:
+                    encoding = candidate
+                break
+    if content is None:
+        content = await r.get(key)
+    if content is None:
+        if default is _MISSING:
+            return JsonResponse(
+                {"error": f"{key} is not available"}, status=missing_status
+            )
+        content = json.dumps(default)
+    response = json_payload_response(request, content, encoding)
+    for name, value in headers.items():
+        response[name] = value
+    response["Vary"] = "Accept-Encoding"
+    return response
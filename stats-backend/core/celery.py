@@ -24,6 +24,8 @@ def setup_periodic_tasks(sender, **kwargs):
         network_versions_to_redis,
         node_earnings_total,
         stats_snapshot_yesterday,
+        network_stats_rollups,
+        compact_raw_samples_task,
         network_median_pricing,
         network_average_pricing,
         computing_snapshot_yesterday,
@@ -66,12 +68,8 @@ def setup_periodic_tasks(sender, **kwargs):
         fetch_and_store_relay_nodes,
         init_golem_tx_scraping,
         fetch_latest_glm_tx,
-        transaction_volume_over_time,
-        amount_transferred_over_time,
-        transaction_type_comparison,
-        daily_transaction_type_counts,
-        average_transaction_value_over_time,
-        daily_volume_golem_vs_chain,
+        transaction_charts_to_redis,
+        sync_known_golem_senders,
         computing_total_over_time,
         computing_over_time_hourly,
         computing_over_time_5min,
@@ -131,13 +129,7 @@ def setup_periodic_tasks(sender, **kwargs):
         )
     sender.add_periodic_task(
         60,
-        transaction_volume_over_time.s(),
-        queue="default",
-        options={"queue": "default", "routing_key": "default"},
-    )
-    sender.add_periodic_task(
-        60,
-        daily_volume_golem_vs_chain.s(),
+        transaction_charts_to_redis.s(),
         queue="default",
         options={"queue": "default", "routing_key": "default"},
     )
@@ -147,30 +139,6 @@ def setup_periodic_tasks(sender, **kwargs):
         queue="default",
         options={"queue": "default", "routing_key": "default"},
     )
-    sender.add_periodic_task(
-        60,
-        daily_transaction_type_counts.s(),
-        queue="default",
-        options={"queue": "default", "routing_key": "default"},
-    )
-    sender.add_periodic_task(
-        60,
-        average_transaction_value_over_time.s(),
-        queue="default",
-        options={"queue": "default", "routing_key": "default"},
-    )
-    sender.add_periodic_task(
-        60,
-        transaction_type_comparison.s(),
-        queue="default",
-        options={"queue": "default", "routing_key": "default"},
-    )
-    sender.add_periodic_task(
-        60,
-        amount_transferred_over_time.s(),
-        queue="default",
-        options={"queue": "default", "routing_key": "default"},
-    )
 
     sender.add_periodic_task(
         crontab(hour="*/24"),
@@ -190,6 +158,12 @@ def setup_periodic_tasks(sender, **kwargs):
         queue="default",
         options={"queue": "default", "routing_key": "default"},
     )
+    sender.add_periodic_task(
+        crontab(minute=15),
+        sync_known_golem_senders.s(),
+        queue="default",
+        options={"queue": "default", "routing_key": "default"},
+    )
     sender.add_periodic_task(
         30,
         fetch_and_store_relay_nodes.s(),
@@ -354,6 +328,12 @@ def setup_periodic_tasks(sender, **kwargs):
         queue="default",
         options={"queue": "default", "routing_key": "default"},
     )
+    sender.add_periodic_task(
+        60,
+        network_stats_rollups.s(),
+        queue="default",
+        options={"queue": "default", "routing_key": "default"},
+    )
     sender.add_periodic_task(
         60,
         network_historical_stats_to_redis_v2.s(),
@@ -410,14 +390,14 @@ def setup_periodic_tasks(sender, **kwargs):
         options={"queue": "default", "routing_key": "default"},
     )
     sender.add_periodic_task(
-        crontab(minute="*/10"),
-        node_earnings_total.s(node_version="v1"),
+        crontab(minute=30, hour=1),
+        compact_raw_samples_task.s(),
         queue="default",
         options={"queue": "default", "routing_key": "default"},
     )
     sender.add_periodic_task(
         crontab(minute="*/10"),
-        node_earnings_total.s(node_version="v2"),
+        node_earnings_total.s(),
         queue="default",
         options={"queue": "default", "routing_key": "default"},
     )
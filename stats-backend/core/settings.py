@@ -64,6 +64,68 @@ OFFER_SCRAPER_CONFIG = {
 # scraper loop takes ~60s per subnet, so this allows a few missed rounds.
 OFFER_FRESHNESS_SECONDS = int(os.environ.get("OFFER_FRESHNESS_SECONDS", 300))
 
+# A market scan hands its proposals to update_providers_info while it is still
+# running, in chunks of at most this many proposals or whenever the oldest
+# buffered proposal has waited this long, instead of one message per scan.
+OFFER_SCAN_CHUNK_SIZE = int(os.environ.get("OFFER_SCAN_CHUNK_SIZE", 500))
+OFFER_SCAN_CHUNK_SECONDS = float(os.environ.get("OFFER_SCAN_CHUNK_SECONDS", 10))
+
+# Wire format of those chunks (see api2/offer_codec.py): "compact" or "json".
+# Workers decode both; "json" is only needed while older workers that cannot
+# decode "compact" still consume the queue.
+OFFER_BATCH_ENCODING = os.environ.get("OFFER_BATCH_ENCODING", "compact")
+
+# Raw NetworkStats / ProvidersComputing samples older than this many days are
+# folded into their summary tables and deleted (see collector/retention.py),
+# this many rows per DELETE. Values below 7 are raised to 7.
+RAW_SAMPLE_RETENTION_DAYS = int(os.environ.get("RAW_SAMPLE_RETENTION_DAYS", 30))
+RAW_SAMPLE_DELETE_BATCH = int(os.environ.get("RAW_SAMPLE_DELETE_BATCH", 5000))
+
+# Transfers endpoint of the erc20-api, and how many 30-day ranges the initial
+# GolemTransactions backfill fetches at once (see api2/glm_transfers.py).
+ERC20_API_URL = os.environ.get(
+    "ERC20_API_URL", "http://erc20-api/erc20/api/stats/transfers"
+)
+GLM_TX_BACKFILL_WORKERS = int(os.environ.get("GLM_TX_BACKFILL_WORKERS", 4))
+# A transfers request that returns more than this many transfers, or takes
+# longer than this many seconds, is retried as two half-length windows.
+ERC20_MAX_TRANSFERS_PER_REQUEST = int(
+    os.environ.get("ERC20_MAX_TRANSFERS_PER_REQUEST", 20000)
+)
+ERC20_API_TIMEOUT = float(os.environ.get("ERC20_API_TIMEOUT", 60))
+
+# Redis holding the cached payloads the async views serve. Each event loop
+# shares one client over at most ASYNC_REDIS_MAX_CONNECTIONS connections; a
+# request that finds them all busy waits up to ASYNC_REDIS_POOL_TIMEOUT
+# seconds for one (see core/async_redis.py).
+REDIS_URL = os.environ.get("REDIS_URL", "redis://redis:6379/0")
+ASYNC_REDIS_MAX_CONNECTIONS = int(os.environ.get("ASYNC_REDIS_MAX_CONNECTIONS", 50))
+ASYNC_REDIS_POOL_TIMEOUT = float(os.environ.get("ASYNC_REDIS_POOL_TIMEOUT", 5))
+
+# Listing a hybrid relay's nodes takes one request per id prefix (256); this
+# many run at once, each with this timeout in seconds and retried this many
+# times (see api2/relay.py).
+RELAY_SWEEP_CONCURRENCY = int(os.environ.get("RELAY_SWEEP_CONCURRENCY", 16))
+RELAY_SWEEP_TIMEOUT = float(os.environ.get("RELAY_SWEEP_TIMEOUT", 5))
+RELAY_SWEEP_RETRIES = int(os.environ.get("RELAY_SWEEP_RETRIES", 2))
+# relay_monitor batches relay node events for this many seconds, or until
+# this many nodes are waiting, before queuing their status update.
+RELAY_EVENT_FLUSH_SECONDS = float(os.environ.get("RELAY_EVENT_FLUSH_SECONDS", 2))
+RELAY_EVENT_BUFFER_NODES = int(os.environ.get("RELAY_EVENT_BUFFER_NODES", 1000))
+# Grafana/Prometheus queries share at most PROMETHEUS_MAX_CONNECTIONS kept-alive
+# connections per process, send lists of queries PROMETHEUS_CONCURRENCY at a
+# time and answer identical requests from the last answer for
+# PROMETHEUS_COALESCE_SECONDS (see api/prometheus.py).
+PROMETHEUS_MAX_CONNECTIONS = int(os.environ.get("PROMETHEUS_MAX_CONNECTIONS", 16))
+PROMETHEUS_CONCURRENCY = int(os.environ.get("PROMETHEUS_CONCURRENCY", 8))
+PROMETHEUS_TIMEOUT = float(os.environ.get("PROMETHEUS_TIMEOUT", 30))
+PROMETHEUS_COALESCE_SECONDS = float(os.environ.get("PROMETHEUS_COALESCE_SECONDS", 5))
+# Every process prints its query latencies every PROMETHEUS_LATENCY_LOG_SECONDS
+# (0 disables it), keeping at most PROMETHEUS_LATENCY_MAX_QUERIES queries
+# apart and the rest under one "(other queries)" entry.
+PROMETHEUS_LATENCY_LOG_SECONDS = float(os.environ.get("PROMETHEUS_LATENCY_LOG_SECONDS", 300))
+PROMETHEUS_LATENCY_MAX_QUERIES = int(os.environ.get("PROMETHEUS_LATENCY_MAX_QUERIES", 200))
+
 
 TESTING = len(sys.argv) > 1 and sys.argv[1] == "test"
 
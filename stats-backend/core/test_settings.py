@@ -3,9 +3,17 @@ Test settings: skip the migration history (broken on sqlite) and build the
 schema directly from the current models.
 
 Usage: python manage.py test --settings=core.test_settings
+
+The tests run on an in-memory SQLite database. With TEST_POSTGRES=1 they run
+on the PostgreSQL server given by DB_HOST, DB_PORT, DB_USER, DB_PASSWORD and
+DB_NAME instead, which the tests of concurrent row locking need; they are
+skipped on SQLite.
 """
 
+import os
+
 from .settings import *  # noqa: F401,F403
+from .settings import DATABASES
 
 
 class DisableMigrations(dict):
@@ -17,3 +25,7 @@ class DisableMigrations(dict):
 
 
 MIGRATION_MODULES = DisableMigrations()
+
+if os.environ.get("TEST_POSTGRES"):
+    DATABASES["default"]["ENGINE"] = "django.db.backends.postgresql_psycopg2"
+    DATABASES["default"]["NAME"] = os.environ.get("DB_NAME")
@@ -0,0 +1,64 @@
+"""
+Helpers shared by the tests of several apps.
+"""
+
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeHTTPServer:
+    """A local keep-alive HTTP server answering GET requests through respond().
+
+    Subclasses implement respond(path), returning (status, body bytes). Each
+    request waits ``delay`` seconds first; ``connections`` collects the client
+    addresses and ``most_in_flight`` the most requests handled at once.
+    """
+
+    content_type = "application/json"
+
+    def __init__(self, delay=0.0):
+        server = self
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.connections = set()
+        self.in_flight = self.most_in_flight = 0
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                with server.lock:
+                    server.connections.add(self.client_address)
+                    server.in_flight += 1
+                    server.most_in_flight = max(server.most_in_flight, server.in_flight)
+                try:
+                    time.sleep(server.delay)
+                    status, body = server.respond(self.path)
+                finally:
+                    with server.lock:
+                        server.in_flight -= 1
+                try:
+                    self.send_response(status)
+                    self.send_header("Content-Type", server.content_type)
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                except (BrokenPipeError, ConnectionResetError):
+                    # The client stopped waiting for the answer.
+                    pass
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_port}/"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def respond(self, path):
+        raise NotImplementedError
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()